@@ -0,0 +1,496 @@
+"""
+Approximate nearest-neighbour indexes over the LocalVectorStore matrix
+"""
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from config import (
+    ANN_CANDIDATES,
+    BINARY_OVERSAMPLE,
+    IVF_NLIST,
+    IVF_NPROBE,
+    IVF_TRAIN_MIN,
+    HNSW_M,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_SEARCH,
+)
+
+
+# Cap on the number of vectors k-means is trained on
+IVF_TRAIN_SAMPLE = 50000
+IVF_TRAIN_ITERATIONS = 10
+
+
+def _argmax_blocked(vectors: np.ndarray, centroids: np.ndarray, block_rows: int = 65536) -> np.ndarray:
+    """Index of the most similar centroid for every vector"""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block_rows):
+        block = np.asarray(vectors[start:start + block_rows], dtype=np.float32)
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+class IVFIndex:
+    """
+    Inverted-file index in pure NumPy
+
+    Vectors are bucketed by their nearest k-means centroid and a query only
+    scores the rows in its nprobe closest buckets. Training happens once the
+    store holds IVF_TRAIN_MIN vectors; until then the store searches exactly.
+    New rows are assigned to the existing centroids as they are inserted and
+    their assignments are appended to ivf_assign.bin.
+    """
+
+    def __init__(
+        self,
+        persist_dir: str,
+        nlist: int = IVF_NLIST,
+        nprobe: int = IVF_NPROBE,
+        train_min: int = IVF_TRAIN_MIN,
+    ):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_min = train_min
+        self._centroids_path = os.path.join(persist_dir, "ivf_centroids.npy")
+        self._assign_path = os.path.join(persist_dir, "ivf_assign.bin")
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[np.ndarray] = []
+        self._covered = 0
+
+        if os.path.exists(self._centroids_path):
+            self._centroids = np.load(self._centroids_path)
+            self._lists = [np.zeros(0, dtype=np.int64) for _ in range(len(self._centroids))]
+            if os.path.exists(self._assign_path):
+                assignments = np.fromfile(self._assign_path, dtype=np.int32)
+                self._extend_lists(0, assignments)
+                self._covered = len(assignments)
+
+    @property
+    def ready(self) -> bool:
+        return self._centroids is not None
+
+    def _extend_lists(self, first_row: int, assignments: np.ndarray):
+        rows = np.arange(first_row, first_row + len(assignments))
+        for list_id in np.unique(assignments):
+            self._lists[list_id] = np.concatenate([self._lists[list_id], rows[assignments == list_id]])
+
+    def _train(self, matrix: np.ndarray, live: np.ndarray):
+        rng = np.random.default_rng(0)
+        live_rows = np.flatnonzero(live)
+        sample_rows = np.sort(rng.choice(live_rows, min(len(live_rows), IVF_TRAIN_SAMPLE), replace=False))
+        sample = np.asarray(matrix[sample_rows], dtype=np.float32)
+
+        nlist = self.nlist or int(4 * np.sqrt(len(live_rows)))
+        nlist = max(1, min(nlist, len(sample)))
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+
+        # Spherical k-means, the stored vectors are already unit length
+        for _ in range(IVF_TRAIN_ITERATIONS):
+            assignments = _argmax_blocked(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            empty = np.bincount(assignments, minlength=nlist) == 0
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+        self._centroids = centroids.astype(np.float32)
+        np.save(self._centroids_path, self._centroids)
+        self._lists = [np.zeros(0, dtype=np.int64) for _ in range(nlist)]
+        self._covered = 0
+        if os.path.exists(self._assign_path):
+            os.unlink(self._assign_path)
+
+    def sync(self, matrix: Optional[np.ndarray], live: np.ndarray):
+        """Train once enough vectors exist, then assign rows not yet covered"""
+        if matrix is None:
+            return
+        if not self.ready:
+            if int(live.sum()) < self.train_min:
+                return
+            self._train(matrix, live)
+
+        if self._covered < len(matrix):
+            assignments = _argmax_blocked(matrix[self._covered:], self._centroids)
+            with open(self._assign_path, "ab") as f:
+                f.write(assignments.tobytes())
+            self._extend_lists(self._covered, assignments)
+            self._covered = len(matrix)
+
+    def remove(self, rows: List[int]):
+        # Dead rows stay in their lists and are masked out by the store
+        pass
+
+    def search(self, query_vector: np.ndarray, k: int, nprobe: Optional[int] = None, **params: Any) -> np.ndarray:
+        """Candidate rows from the nprobe buckets closest to the query"""
+        nprobe = min(nprobe or self.nprobe, len(self._centroids))
+        centroid_scores = self._centroids @ query_vector
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        return np.concatenate([self._lists[list_id] for list_id in probe])
+
+    def reset(self):
+        """Forget row assignments, keeping the trained centroids"""
+        if os.path.exists(self._assign_path):
+            os.unlink(self._assign_path)
+        if self.ready:
+            self._lists = [np.zeros(0, dtype=np.int64) for _ in range(len(self._centroids))]
+        self._covered = 0
+
+    def save(self):
+        # Centroids are saved when trained and assignments are appended on sync
+        pass
+
+
+class HNSWIndex:
+    """
+    HNSW graph index backed by hnswlib
+
+    Rows are added to the graph as they are inserted and deletions are marked
+    in place. The graph is written to hnsw.bin on save(); rows appended after
+    the last save are re-added when the store is reopened.
+    """
+
+    def __init__(
+        self,
+        persist_dir: str,
+        m: int = HNSW_M,
+        ef_construction: int = HNSW_EF_CONSTRUCTION,
+        ef_search: int = HNSW_EF_SEARCH,
+    ):
+        import hnswlib
+
+        self._hnswlib = hnswlib
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self._path = os.path.join(persist_dir, "hnsw.bin")
+        self._index = None
+
+    @property
+    def ready(self) -> bool:
+        return self._index is not None and self._index.get_current_count() > 0
+
+    def _open(self, dim: int, n_rows: int, live: np.ndarray):
+        self._index = self._hnswlib.Index(space="ip", dim=dim)
+        if os.path.exists(self._path):
+            self._index.load_index(self._path, max_elements=max(1024, 2 * n_rows))
+            # Replay deletions that happened after the graph was saved
+            covered = min(self._index.get_current_count(), n_rows)
+            self.remove(np.flatnonzero(~live[:covered]).tolist())
+        else:
+            self._index.init_index(
+                max_elements=max(1024, 2 * n_rows),
+                ef_construction=self.ef_construction,
+                M=self.m,
+            )
+
+    def sync(self, matrix: Optional[np.ndarray], live: np.ndarray):
+        """Add rows that are not in the graph yet"""
+        if matrix is None:
+            return
+        if self._index is None:
+            self._open(matrix.shape[1], len(matrix), live)
+
+        covered = self._index.get_current_count()
+        if covered >= len(matrix):
+            return
+        if len(matrix) > self._index.get_max_elements():
+            self._index.resize_index(2 * len(matrix))
+
+        rows = np.arange(covered, len(matrix))
+        self._index.add_items(np.asarray(matrix[covered:], dtype=np.float32), rows)
+        self.remove(rows[~live[covered:]].tolist())
+
+    def remove(self, rows: List[int]):
+        if self._index is None:
+            return
+        for row in rows:
+            try:
+                self._index.mark_deleted(int(row))
+            except RuntimeError:
+                # Already deleted or never added
+                pass
+
+    def search(self, query_vector: np.ndarray, k: int, ef: Optional[int] = None, **params: Any) -> np.ndarray:
+        """Candidate rows from a graph walk with the given ef"""
+        k = min(k, self._index.get_current_count())
+        self._index.set_ef(max(ef or self.ef_search, k))
+        while k > 0:
+            try:
+                labels, _ = self._index.knn_query(query_vector, k=k)
+                return labels[0].astype(np.int64)
+            except RuntimeError:
+                # Fewer live elements than k, ask for fewer
+                k //= 2
+        return np.zeros(0, dtype=np.int64)
+
+    def reset(self):
+        """Drop the graph so it is rebuilt from the matrix on the next sync"""
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+        self._index = None
+
+    def save(self):
+        if self._index is not None:
+            self._index.save_index(self._path)
+
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    """Number of set bits in every byte"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return _POPCOUNT_TABLE[values]
+
+
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# Codes widened per scoring block; small enough that the float32 copy stays in cache
+QUANT_BLOCK_ROWS = 2048
+
+
+class QuantizedIndex:
+    """
+    Compact int8 or binary codes of every matrix row, scanned in full per query
+
+    int8 keeps one signed byte per dimension plus a float32 scale per row,
+    about a quarter of float32. binary keeps one sign bit per dimension, a
+    32nd, and ranks by Hamming distance. The codes are only a first pass: the
+    store rescores the candidates against the full-precision matrix, which
+    stays memory-mapped on disk and is only paged in for those rows. Codes are
+    appended to quant_<kind>.bin as rows are inserted; with persist_dir None
+    they are kept in memory only.
+    """
+
+    def __init__(self, persist_dir: Optional[str], kind: str = "int8", oversample: Optional[int] = None):
+        if kind not in ("int8", "binary"):
+            raise ValueError(f"Unknown quantization: {kind}")
+        self.kind = kind
+        self.oversample = oversample or (BINARY_OVERSAMPLE if kind == "binary" else 1)
+        self._path = os.path.join(persist_dir, f"quant_{kind}.bin") if persist_dir else None
+        self._dtype: Optional[np.dtype] = None
+        self._codes: Optional[np.ndarray] = None
+        self._live: Optional[np.ndarray] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._codes is not None and len(self._codes) > 0
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the codes"""
+        return 0 if self._codes is None else self._codes.nbytes
+
+    def _record_dtype(self, dim: int) -> np.dtype:
+        if self.kind == "int8":
+            return np.dtype([("scale", "<f4"), ("code", "i1", (dim,))])
+        return np.dtype([("code", "u1", ((dim + 7) // 8,))])
+
+    def _open(self, dim: int):
+        self._dtype = self._record_dtype(dim)
+        self._codes = np.zeros(0, dtype=self._dtype)
+        if self._path and os.path.exists(self._path):
+            rows, remainder = divmod(os.path.getsize(self._path), self._dtype.itemsize)
+            if remainder:
+                # Partial record from an interrupted append
+                with open(self._path, "r+b") as f:
+                    f.truncate(rows * self._dtype.itemsize)
+            self._codes = np.fromfile(self._path, dtype=self._dtype)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Codes for a block of unit-length vectors"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        records = np.zeros(len(vectors), dtype=self._record_dtype(vectors.shape[1]))
+        if self.kind == "int8":
+            # Symmetric per-row scale, so the largest component maps to +-127
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+            records["scale"] = scales
+            records["code"] = np.rint(vectors / scales[:, None]).astype(np.int8)
+        else:
+            records["code"] = np.packbits(vectors > 0, axis=1)
+        return records
+
+    def sync(self, matrix: Optional[np.ndarray], live: np.ndarray, block_rows: int = 65536):
+        """Encode rows not yet covered"""
+        if matrix is None:
+            return
+        if self._codes is None:
+            self._open(matrix.shape[1])
+        if len(self._codes) > len(matrix):
+            # Codes from a matrix that has since been rewritten
+            self.reset()
+            self._open(matrix.shape[1])
+        self._live = live
+
+        covered = len(self._codes)
+        if covered < len(matrix):
+            blocks = [
+                self.encode(matrix[start:start + block_rows])
+                for start in range(covered, len(matrix), block_rows)
+            ]
+            if self._path:
+                with open(self._path, "ab") as f:
+                    for block in blocks:
+                        f.write(block.tobytes())
+            self._codes = np.concatenate([self._codes] + blocks)
+
+    def remove(self, rows: List[int]):
+        # Dead rows keep their codes and are masked out with the store's live mask
+        pass
+
+    def scores(self, query_vector: np.ndarray, block_rows: int = QUANT_BLOCK_ROWS) -> np.ndarray:
+        """Approximate similarity of the query to every covered row, higher is better"""
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        scores = np.empty(len(self._codes), dtype=np.float32)
+        if self.kind == "binary":
+            query_bits = np.packbits(query_vector > 0)
+        for start in range(0, len(self._codes), block_rows):
+            block = self._codes[start:start + block_rows]
+            if self.kind == "int8":
+                block_scores = (block["code"].astype(np.float32) @ query_vector) * block["scale"]
+            else:
+                # Fewer differing sign bits means a smaller angle
+                block_scores = -_popcount(block["code"] ^ query_bits).sum(axis=1, dtype=np.int32)
+            scores[start:start + len(block)] = block_scores
+        return scores
+
+    def search(self, query_vector: np.ndarray, k: int, oversample: Optional[int] = None, **params: Any) -> np.ndarray:
+        """Candidate rows with the best approximate scores"""
+        scores = self.scores(query_vector)
+        if self._live is not None:
+            scores[~self._live[:len(scores)]] = -np.inf
+        n_candidates = min(k * (oversample or self.oversample), len(scores))
+        if n_candidates <= 0:
+            return np.zeros(0, dtype=np.int64)
+        if n_candidates < len(scores):
+            return np.argpartition(-scores, n_candidates - 1)[:n_candidates].astype(np.int64)
+        return np.arange(len(scores), dtype=np.int64)
+
+    def reset(self):
+        """Drop the codes so they are rebuilt from the matrix on the next sync"""
+        if self._path and os.path.exists(self._path):
+            os.unlink(self._path)
+        self._codes = None
+
+    def save(self):
+        # Codes are appended on sync
+        pass
+
+
+def quantization_report(
+    matrix: np.ndarray,
+    live: np.ndarray,
+    query_vectors: np.ndarray,
+    k: int = 10,
+    kinds: Sequence[str] = ("int8", "binary"),
+) -> List[Dict[str, Any]]:
+    """
+    Memory and recall@k of quantized codes against exact search over a matrix
+
+    Ground truth is the exact top-k over the live rows; a result counts as a
+    hit when its exact score reaches the k-th best, so ties are not misses.
+    For every kind, recall is reported for the code ranking alone and after
+    the store's rescoring of k * ANN_CANDIDATES candidates against the
+    full-precision matrix.
+
+    Args:
+        matrix: Unit-length row vectors, e.g. the store matrix
+        live: Mask of the rows that count
+        query_vectors: Unit-length queries, one per row
+        k: Number of results per query
+        kinds: Quantizations to compare
+
+    Returns:
+        One dict per mode ("exact" first) with bytes_per_vector, memory_bytes,
+        recall, rescored_recall and query_ms
+    """
+    live_count = int(live.sum())
+    k = min(k, live_count)
+    query_vectors = np.asarray(query_vectors, dtype=np.float32)
+    if not k or not len(query_vectors):
+        return []
+
+    def top_rows(scores: np.ndarray, n: int) -> np.ndarray:
+        return np.argpartition(-scores, n - 1)[:n] if n < len(scores) else np.arange(len(scores))
+
+    thresholds = []
+    started = time.perf_counter()
+    for query_vector in query_vectors:
+        scores = _exact_scores(matrix, query_vector)
+        scores[~live] = -np.inf
+        thresholds.append(scores[top_rows(scores, k)].min())
+    exact_ms = (time.perf_counter() - started) * 1000 / len(query_vectors)
+
+    def hits(rows: np.ndarray, query_vector: np.ndarray, threshold: float) -> int:
+        exact = np.asarray(matrix[np.sort(rows)], dtype=np.float32) @ query_vector
+        return int((exact >= threshold - 1e-6).sum())
+
+    row_bytes = matrix.shape[1] * matrix.dtype.itemsize
+    report = [{
+        "mode": "exact",
+        "bytes_per_vector": row_bytes,
+        "memory_bytes": row_bytes * len(matrix),
+        "recall": 1.0,
+        "rescored_recall": 1.0,
+        "query_ms": exact_ms,
+    }]
+
+    for kind in kinds:
+        index = QuantizedIndex(None, kind)
+        index.sync(matrix, live)
+        first_pass = rescored = 0
+        elapsed = 0.0
+        for query_vector, threshold in zip(query_vectors, thresholds):
+            # Timed like a store query: code scan, then exact rescoring of the candidates
+            started = time.perf_counter()
+            candidates = np.sort(index.search(query_vector, k * ANN_CANDIDATES))
+            candidate_scores = np.asarray(matrix[candidates], dtype=np.float32) @ query_vector
+            found = candidates[top_rows(candidate_scores, k)]
+            elapsed += time.perf_counter() - started
+            rescored += hits(found, query_vector, threshold)
+
+            scores = index.scores(query_vector)
+            scores[~live] = -np.inf
+            first_pass += hits(top_rows(scores, k), query_vector, threshold)
+        report.append({
+            "mode": kind,
+            "bytes_per_vector": index.nbytes / max(len(matrix), 1),
+            "memory_bytes": index.nbytes,
+            "recall": first_pass / (k * len(query_vectors)),
+            "rescored_recall": rescored / (k * len(query_vectors)),
+            "query_ms": elapsed * 1000 / len(query_vectors),
+        })
+    return report
+
+
+def _exact_scores(matrix: np.ndarray, query_vector: np.ndarray, block_rows: int = 65536) -> np.ndarray:
+    scores = np.empty(len(matrix), dtype=np.float32)
+    for start in range(0, len(matrix), block_rows):
+        block = np.asarray(matrix[start:start + block_rows], dtype=np.float32)
+        scores[start:start + len(block)] = block @ query_vector
+    return scores
+
+
+def create_ann_index(kind: str, persist_dir: str) -> Optional[Any]:
+    """
+    Build the ANN index configured for a store
+
+    Args:
+        kind: "exact", "ivf", "hnsw", "int8" or "binary"
+        persist_dir: Directory the index files live in
+
+    Returns:
+        An index object, or None for exact search
+    """
+    if kind == "exact":
+        return None
+    if kind == "hnsw":
+        try:
+            return HNSWIndex(persist_dir)
+        except ImportError:
+            print("hnswlib is not installed, falling back to the NumPy IVF index")
+            return IVFIndex(persist_dir)
+    if kind == "ivf":
+        return IVFIndex(persist_dir)
+    if kind in ("int8", "binary"):
+        return QuantizedIndex(persist_dir, kind)
+    raise ValueError(f"Unknown vector index type: {kind}")
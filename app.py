@@ -4,18 +4,22 @@ Streamlit App for Multimodal RAG Application
 import streamlit as st
 import os
 from pathlib import Path
-import time
 from typing import List
 
-from document_processor import DocumentProcessor, get_file_type_category
+from document_processor import get_file_type_category
 from youtube_processor import YouTubeProcessor
-from rag_engine import RAGEngine
+from shards import validate_collection_name
+from resource_pool import get_shared_engine, get_shared_job_queue
+import metrics
 from config import (
     UPLOAD_DIR, 
     SUPPORTED_TEXT_FORMATS, 
     SUPPORTED_IMAGE_FORMATS,
     SUPPORTED_AUDIO_FORMATS,
-    SUPPORTED_VIDEO_FORMATS
+    SUPPORTED_VIDEO_FORMATS,
+    RETRIEVAL_MODE,
+    COLLECTION_NAME,
+    JOB_REFRESH_SECONDS
 )
 
 # Page configuration
@@ -165,17 +169,20 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Initialize session state
+# The engine and ingest job queue are shared by all sessions in this process
 if 'rag_engine' not in st.session_state:
-    st.session_state.rag_engine = RAGEngine()
+    st.session_state.rag_engine = get_shared_engine()
+    # Exporter and profiler are process-wide, starting them again is a no-op
+    metrics.start_configured()
 
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
 
-if 'document_processor' not in st.session_state:
-    st.session_state.document_processor = DocumentProcessor()
+if 'job_queue' not in st.session_state:
+    st.session_state.job_queue = get_shared_job_queue()
 
-if 'uploaded_files_list' not in st.session_state:
-    st.session_state.uploaded_files_list = []
+if 'active_jobs' not in st.session_state:
+    st.session_state.active_jobs = set()
 
 # Main title
 st.title("🤖 Multimodal RAG Chat Assistant")
@@ -190,10 +197,22 @@ with st.sidebar:
     with col1:
         st.metric("Documents", st.session_state.rag_engine.get_document_count())
     with col2:
-        st.metric("Uploaded", len(st.session_state.uploaded_files_list))
+        st.metric("Uploaded", len(st.session_state.job_queue.indexed_items()))
     
     st.divider()
     
+    # Each collection is indexed separately, e.g. one per team, and loaded only when searched
+    target_collection = st.text_input(
+        "🗂️ Add to collection",
+        value=COLLECTION_NAME,
+        key="target_collection"
+    ).strip()
+    try:
+        validate_collection_name(target_collection)
+    except ValueError as e:
+        st.error(str(e))
+        target_collection = None
+    
     # Create tabs for different upload types
     tab1, tab2 = st.tabs(["📁 Files", "🎥 YouTube"])
     
@@ -216,67 +235,100 @@ with st.sidebar:
         )
         
         if uploaded_files:
-            if st.button("🚀 Process Files", use_container_width=True):
-                with st.spinner("Processing files..."):
-                    all_documents = []
-                    
-                    for uploaded_file in uploaded_files:
-                        # Save file
-                        file_path = os.path.join(UPLOAD_DIR, uploaded_file.name)
-                        with open(file_path, 'wb') as f:
-                            f.write(uploaded_file.getbuffer())
-                        
-                        # Process file
-                        try:
-                            documents = st.session_state.document_processor.process_file(file_path)
-                            all_documents.extend(documents)
-                            st.session_state.uploaded_files_list.append({
-                                'name': uploaded_file.name,
-                                'type': get_file_type_category(file_path),
-                                'size': uploaded_file.size
-                            })
-                            st.success(f"✅ Processed: {uploaded_file.name}")
-                        except Exception as e:
-                            st.error(f"❌ Error processing {uploaded_file.name}: {str(e)}")
-                    
-                    # Add to RAG engine
-                    if all_documents:
-                        st.session_state.rag_engine.add_documents(all_documents)
-                        st.success(f"🎉 Added {len(all_documents)} document chunks to the index!")
-                        time.sleep(1)
-                        st.rerun()
+            if st.button("🚀 Process Files", use_container_width=True, disabled=target_collection is None):
+                # Save files; extraction and indexing run in the background job queue
+                saved_files = {}
+                for uploaded_file in uploaded_files:
+                    file_path = os.path.join(UPLOAD_DIR, uploaded_file.name)
+                    with open(file_path, 'wb') as f:
+                        f.write(uploaded_file.getbuffer())
+                    saved_files[file_path] = {
+                        'name': uploaded_file.name,
+                        'type': get_file_type_category(file_path),
+                        'size': uploaded_file.size
+                    }
+                
+                job_id = st.session_state.job_queue.submit_files(list(saved_files), saved_files, target_collection)
+                st.session_state.active_jobs.add(job_id)
+                st.success(f"📥 Queued {len(saved_files)} file(s) as job #{job_id}")
     
     with tab2:
         st.subheader("YouTube Videos")
         
-        youtube_url = st.text_input(
-            "Enter YouTube URL",
-            placeholder="https://www.youtube.com/watch?v=..."
+        youtube_urls = st.text_area(
+            "Enter YouTube URLs (one per line; playlists and channels work too)",
+            placeholder="https://www.youtube.com/watch?v=...\nhttps://www.youtube.com/playlist?list=..."
         )
         
-        if st.button("🎬 Process Video", use_container_width=True):
-            if youtube_url:
-                with st.spinner("Extracting transcript..."):
-                    try:
-                        documents = YouTubeProcessor.process_youtube_url(youtube_url)
-                        st.session_state.rag_engine.add_documents(documents)
-                        
-                        # Add to uploaded list
-                        video_id = YouTubeProcessor.extract_video_id(youtube_url)
-                        st.session_state.uploaded_files_list.append({
-                            'name': f"YouTube: {video_id}",
-                            'type': 'youtube',
-                            'size': 0
-                        })
-                        
-                        st.success("✅ YouTube video processed successfully!")
-                        time.sleep(1)
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"❌ Error: {str(e)}")
+        if st.button("🎬 Process Videos", use_container_width=True, disabled=target_collection is None):
+            if youtube_urls.strip():
+                # Playlists are expanded and videos fetched concurrently in the background
+                job_id = st.session_state.job_queue.submit_youtube(youtube_urls.splitlines(), target_collection)
+                st.session_state.active_jobs.add(job_id)
+                st.success(f"📥 Queued YouTube job #{job_id}")
             else:
                 st.warning("Please enter a YouTube URL")
     
+    # Job progress refreshes on its own, without rerunning the rest of the page
+    @st.fragment(run_every=JOB_REFRESH_SECONDS)
+    def show_jobs():
+        job_queue = st.session_state.job_queue
+        jobs = job_queue.list_jobs(limit=5)
+        
+        # Once a job finishes, rerun the whole page so counts and file list catch up
+        finished = {job.id for job in jobs if not job.active}
+        if st.session_state.active_jobs & finished:
+            st.session_state.active_jobs -= finished
+            st.rerun()
+        st.session_state.active_jobs |= {job.id for job in jobs if job.active}
+        
+        if not jobs:
+            return
+        st.subheader("⏳ Ingest Jobs")
+        for job in jobs:
+            label = "Files" if job.kind == "files" else "YouTube"
+            st.progress(
+                job.progress,
+                text=f"#{job.id} {label}: {job.message} ({job.done + job.failed}/{job.total}, {job.indexed} documents)"
+            )
+            if job.active:
+                if st.button("✖️ Cancel", key=f"cancel_job_{job.id}"):
+                    job_queue.cancel(job.id)
+            elif job.status in ("cancelled", "failed") and job.done + job.failed < job.total:
+                if st.button("▶️ Resume", key=f"resume_job_{job.id}"):
+                    job_queue.resume(job.id)
+                    st.session_state.active_jobs.add(job.id)
+            if job.error:
+                st.error(f"❌ {job.error}")
+            for item, error in job_queue.item_errors(job.id)[:3]:
+                st.caption(f"❌ {Path(item).name}: {error}")
+    
+    show_jobs()
+    
+    st.divider()
+    
+    # Keyword search finds exact names and codes without calling the embedding model
+    search_modes = {"hybrid": "Hybrid (keywords + meaning)", "vector": "Meaning only", "keyword": "Keywords only"}
+    st.selectbox(
+        "🔎 Search mode",
+        options=list(search_modes),
+        index=list(search_modes).index(RETRIEVAL_MODE),
+        format_func=search_modes.get,
+        key="retrieval_mode"
+    )
+    
+    # Questions search the selected collections in parallel, all of them when none is selected
+    collections = st.session_state.rag_engine.list_collections()
+    st.session_state.search_collections = [
+        name for name in st.session_state.get('search_collections', []) if name in collections
+    ]
+    st.multiselect(
+        "📂 Search in",
+        options=collections,
+        key="search_collections",
+        placeholder="All collections"
+    )
+    
     st.divider()
     
     # Clear buttons
@@ -289,19 +341,31 @@ with st.sidebar:
     with col2:
         if st.button("🔄 Clear Index", use_container_width=True):
             st.session_state.rag_engine.clear_index()
-            st.session_state.uploaded_files_list = []
+            st.session_state.job_queue.clear_finished()
             st.success("Index cleared!")
             st.rerun()
     
     # Show uploaded files
-    if st.session_state.uploaded_files_list:
+    recent_items = st.session_state.job_queue.indexed_items(limit=5)
+    if recent_items:
         st.divider()
         st.subheader("📋 Uploaded Files")
-        for idx, file_info in enumerate(st.session_state.uploaded_files_list[-5:]):  # Show last 5
-            with st.expander(f"{file_info['name'][:30]}..."):
-                st.write(f"**Type:** {file_info['type']}")
-                if file_info['size'] > 0:
+        for idx, file_info in enumerate(recent_items):  # Show last 5
+            name = file_info.get('name') or f"YouTube: {file_info['item']}"
+            with st.expander(f"{name[:30]}..."):
+                st.write(f"**Type:** {file_info.get('type', file_info['kind'])}")
+                st.write(f"**Collection:** {file_info['collection'] or COLLECTION_NAME}")
+                if file_info.get('size', 0) > 0:
                     st.write(f"**Size:** {file_info['size'] / 1024:.2f} KB")
+                if st.button("🗑️ Remove", key=f"remove_item_{idx}"):
+                    # Only this file's or video's chunks leave the index
+                    if file_info['kind'] == 'youtube':
+                        source = YouTubeProcessor.extract_video_id(file_info['item'])
+                    else:
+                        source = file_info['item']
+                    st.session_state.rag_engine.delete_document(source, file_info['collection'])
+                    st.session_state.job_queue.remove_item(file_info['item'], file_info['collection'])
+                    st.rerun()
 
 # Main chat interface
 st.markdown("---")
@@ -324,9 +388,14 @@ if prompt := st.chat_input("Ask me anything about your documents..."):
     
     # Get response from RAG engine
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            response = st.session_state.rag_engine.query(prompt)
-            st.markdown(response)
+        # Tokens render as Groq produces them; write_stream returns the full text
+        response = st.write_stream(
+            st.session_state.rag_engine.stream_query(
+                prompt,
+                mode=st.session_state.retrieval_mode,
+                collections=st.session_state.search_collections or None
+            )
+        )
     
     # Add assistant response to chat history
     st.session_state.chat_history.append({"role": "assistant", "content": response})
@@ -0,0 +1,506 @@
+"""
+Offline benchmark for ingest, indexing, index loading and queries
+
+Generates synthetic corpora (text, PDF, images with rendered text and
+tone-burst audio), runs them through the app's own code paths with a fake LLM
+and a deterministic hashing embedding, and prints the results as JSON so runs
+can be diffed across commits:
+
+    python benchmark.py --sizes 100,1000,5000 --queries 200 --output bench.json
+
+Everything runs in a scratch directory, so the app's own index and caches are
+never touched. Modalities whose backends are not installed (e.g. EasyOCR for
+images) are reported with their errors instead of failing the run.
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from typing import Any, Dict, List, Optional
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Speech backend that needs neither network nor models
+AUDIO_SPEECH_BACKEND = "placeholder"
+
+# Timed small adds into each pre-populated index
+INCREMENTAL_REPEATS = 5
+
+
+class HashEmbedding(BaseEmbedding):
+    """
+    Deterministic bag-of-words embedding for offline runs
+
+    Every token is hashed to a signed bucket, so texts sharing words land
+    close together and the same text always gets the same vector.
+    """
+
+    dim: int = 384
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashEmbedding"
+
+    def _embed(self, text: str) -> Embedding:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            value = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[value % self.dim] += 1.0 if value >> 63 else -1.0
+        norm = float(np.linalg.norm(vector))
+        return (vector / norm if norm else vector).tolist()
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._embed(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return [self._embed(text) for text in texts]
+
+
+class Corpus:
+    """Seeded generator of words, sentences and questions over a fixed vocabulary"""
+
+    def __init__(self, seed: int = 0, vocabulary_size: int = 2000):
+        self.random = random.Random(seed)
+        syllables = ["ka", "lo", "mi", "ten", "ra", "su", "vel", "dor", "pi", "an", "qua", "zen", "bo", "rix"]
+        words = set()
+        while len(words) < vocabulary_size:
+            words.add("".join(self.random.choice(syllables) for _ in range(self.random.randint(2, 4))))
+        self.words = sorted(words)
+
+    def sentence(self, n_words: int = 12) -> str:
+        return " ".join(self.random.choice(self.words) for _ in range(n_words)).capitalize() + "."
+
+    def paragraph(self, n_sentences: int = 8) -> str:
+        return " ".join(self.sentence(self.random.randint(8, 16)) for _ in range(n_sentences))
+
+    def question(self) -> str:
+        return "What about " + " ".join(self.random.choice(self.words) for _ in range(self.random.randint(3, 6))) + "?"
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages: List[List[str]]):
+    """Write a minimal text PDF, one list of lines per page, in Helvetica"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for lines in pages:
+        content = "BT /F1 11 Tf 14 TL 72 740 Td " + " ".join(f"({_pdf_escape(line)}) '" for line in lines) + " ET"
+        content = content.encode("latin-1", errors="replace")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects))
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(output)
+
+
+def write_text_image(path: str, lines: List[str], size=(1600, 1000)):
+    """Render lines of black text on a white image"""
+    from PIL import Image, ImageDraw, ImageFont
+
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    try:
+        font = ImageFont.load_default(size=32)
+    except TypeError:
+        # Pillow < 10.1 has a single fixed-size default font
+        font = ImageFont.load_default()
+    for index, line in enumerate(lines):
+        draw.text((40, 40 + index * 48), line, fill="black", font=font)
+    image.save(path)
+
+
+def write_tone_audio(path: str, seconds: float, sample_rate: int = 16000, seed: int = 0):
+    """Write a mono WAV of tone bursts separated by pauses, so it segments like speech"""
+    rng = np.random.default_rng(seed)
+    samples = []
+    total = 0
+    while total < seconds * sample_rate:
+        burst = int(rng.uniform(1.5, 4.0) * sample_rate)
+        t = np.arange(burst) / sample_rate
+        tone = 0.3 * np.sin(2 * np.pi * rng.uniform(200, 800) * t)
+        samples.append(tone)
+        samples.append(np.zeros(int(rng.uniform(0.6, 1.2) * sample_rate)))
+        total += len(samples[-2]) + len(samples[-1])
+    pcm = (np.concatenate(samples)[:int(seconds * sample_rate)] * 32767).astype("<i2")
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.tobytes())
+
+
+def generate_files(directory: str, corpus: Corpus, files_per_modality: int) -> Dict[str, List[str]]:
+    """Write the synthetic files for every modality and return their paths"""
+    os.makedirs(directory, exist_ok=True)
+    files = {"text": [], "pdf": [], "image": [], "audio": []}
+    for index in range(files_per_modality):
+        path = os.path.join(directory, f"doc_{index}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(corpus.paragraph() for _ in range(10)))
+        files["text"].append(path)
+
+        path = os.path.join(directory, f"report_{index}.pdf")
+        write_pdf(path, [[corpus.sentence(10) for _ in range(40)] for _ in range(20)])
+        files["pdf"].append(path)
+
+        path = os.path.join(directory, f"scan_{index}.png")
+        write_text_image(path, [corpus.sentence(6) for _ in range(18)])
+        files["image"].append(path)
+
+        path = os.path.join(directory, f"recording_{index}.wav")
+        write_tone_audio(path, seconds=60, seed=index)
+        files["audio"].append(path)
+    return files
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """Summary of latencies in milliseconds"""
+    if not values:
+        return {}
+    millis = np.asarray(values) * 1000
+    return {
+        "count": len(values),
+        "mean_ms": float(millis.mean()),
+        "p50_ms": float(np.percentile(millis, 50)),
+        "p95_ms": float(np.percentile(millis, 95)),
+        "p99_ms": float(np.percentile(millis, 99)),
+        "max_ms": float(millis.max()),
+    }
+
+
+def _span_totals() -> Dict[str, float]:
+    """Seconds spent per span since the last metrics reset"""
+    import metrics
+
+    totals = {}
+    for histogram in metrics.get_metrics().snapshot()["histograms"]:
+        if histogram["name"] == "span_seconds":
+            span = histogram["labels"]["span"]
+            totals[span] = totals.get(span, 0.0) + histogram["sum"]
+    return totals
+
+
+def bench_ingest(files: Dict[str, List[str]]) -> Dict[str, Any]:
+    """Extraction throughput per modality through DocumentProcessor.process_file"""
+    from document_processor import DocumentProcessor
+
+    processor = DocumentProcessor(speech_backend=AUDIO_SPEECH_BACKEND)
+    # Every file is extracted for real
+    processor.cache = None
+
+    results = {}
+    for modality, paths in files.items():
+        timings = []
+        documents = 0
+        characters = 0
+        errors = []
+        started = time.perf_counter()
+        for path in paths:
+            file_started = time.perf_counter()
+            try:
+                docs = processor.process_file(path)
+            except Exception as e:
+                errors.append(str(e))
+                continue
+            timings.append(time.perf_counter() - file_started)
+            failed = [doc.metadata["error"] for doc in docs if "error" in doc.metadata]
+            if failed:
+                errors.extend(failed)
+                continue
+            documents += len(docs)
+            characters += sum(len(doc.text) for doc in docs)
+        elapsed = time.perf_counter() - started
+        size_mb = sum(os.path.getsize(path) for path in paths) / 2 ** 20
+        results[modality] = {
+            "files": len(paths),
+            "documents": documents,
+            "characters": characters,
+            "seconds": elapsed,
+            "files_per_second": len(paths) / elapsed if elapsed else 0.0,
+            "mb_per_second": size_mb / elapsed if elapsed else 0.0,
+            "per_file": percentiles(timings),
+            "errors": sorted(set(errors))[:5],
+            "error_count": len(errors),
+        }
+        print(f"ingest {modality}: {len(paths)} files in {elapsed:.2f}s, {len(errors)} errors", file=sys.stderr)
+    return results
+
+
+def _new_engine():
+    from llama_index.core.llms import MockLLM
+    from rag_engine import RAGEngine
+
+    engine = RAGEngine(llm=MockLLM(max_tokens=64), embed_model=HashEmbedding(model_name="hash-384"))
+    # Measure the full query path, not the semantic answer cache
+    engine.query_cache = None
+    return engine
+
+
+def _close_engine(engine):
+    engine.close()
+
+
+def bench_indexing(corpus: Corpus, sizes: List[int], batch: int = 10) -> List[Dict[str, Any]]:
+    """
+    add_documents cost for growing corpora
+
+    Each corpus is indexed into an empty store, then batches of a fixed size
+    are added to the populated index, so the cost of a small upload can be
+    compared across index sizes.
+    """
+    import metrics
+    from llama_index.core import Document
+
+    def make_documents(count: int, prefix: str) -> List[Document]:
+        return [
+            Document(text=corpus.paragraph(), metadata={"file_name": f"{prefix}_{index}.txt", "file_type": "text"})
+            for index in range(count)
+        ]
+
+    results = []
+    for size in sizes:
+        engine = _new_engine()
+        engine.clear_index()
+        documents = make_documents(size, "doc")
+        metrics.get_metrics().reset()
+        started = time.perf_counter()
+        engine.add_documents(documents)
+        elapsed = time.perf_counter() - started
+        spans = _span_totals()
+        chunks = engine.get_document_count()
+        result = {
+            "documents": size,
+            "chunks": chunks,
+            "seconds": elapsed,
+            "documents_per_second": size / elapsed if elapsed else 0.0,
+            "chunk_seconds": spans.get("index.chunk", 0.0),
+            "embed_seconds": spans.get("index.embed", 0.0),
+            "persist_seconds": spans.get("index.persist", 0.0),
+        }
+
+        if batch:
+            metrics.get_metrics().reset()
+            timings = []
+            for repeat in range(INCREMENTAL_REPEATS):
+                added = make_documents(batch, f"added_{repeat}")
+                started = time.perf_counter()
+                engine.add_documents(added)
+                timings.append(time.perf_counter() - started)
+            spans = _span_totals()
+            result["incremental"] = {
+                "documents": batch,
+                **percentiles(timings),
+                "persist_seconds": spans.get("index.persist", 0.0) / INCREMENTAL_REPEATS,
+            }
+            print(
+                f"add {batch} documents to {size}: p50 {result['incremental']['p50_ms']:.1f}ms",
+                file=sys.stderr,
+            )
+
+        results.append(result)
+        print(f"index {size} documents: {elapsed:.2f}s", file=sys.stderr)
+        _close_engine(engine)
+    return results
+
+
+def bench_load(repeats: int = 3) -> Dict[str, Any]:
+    """Time opening the collection left by the largest indexing run"""
+    import metrics
+
+    timings = []
+    load_timings = []
+    count = 0
+    for _ in range(repeats):
+        metrics.get_metrics().reset()
+        started = time.perf_counter()
+        engine = _new_engine()
+        # Collections open lazily, count the first open as part of startup
+        engine.load_collections()
+        timings.append(time.perf_counter() - started)
+        load_timings.append(_span_totals().get("index.load", 0.0))
+        count = engine.get_document_count()
+        _close_engine(engine)
+    return {
+        "chunks": count,
+        "engine_init": percentiles(timings),
+        "load_index": percentiles(load_timings),
+    }
+
+
+def bench_queries(corpus: Corpus, n_queries: int, modes: List[str]) -> Dict[str, Any]:
+    """
+    query() latency per retrieval mode over the index left by the largest indexing run
+
+    Error answers and the no-documents answer come back fast without doing
+    the work, so they are counted as failures and left out of the latencies.
+    """
+    import metrics
+    from rag_engine import NO_DOCUMENTS_MESSAGE
+
+    engine = _new_engine()
+    questions = [corpus.question() for _ in range(n_queries)]
+    results = {}
+    for mode in modes:
+        # Warm up lazily built engines and indexes outside the measurement
+        engine.query(questions[0], mode=mode)
+        metrics.get_metrics().reset()
+        timings = []
+        errors = []
+        for question in questions:
+            started = time.perf_counter()
+            answer = engine.query(question, mode=mode)
+            elapsed = time.perf_counter() - started
+            if answer == NO_DOCUMENTS_MESSAGE or answer.startswith("Error processing query:"):
+                errors.append(answer)
+                continue
+            timings.append(elapsed)
+        spans = _span_totals()
+        results[mode] = {
+            **percentiles(timings),
+            "failures": len(errors),
+            "errors": sorted(set(errors))[:5],
+            "embed_seconds": spans.get("query.embed", 0.0),
+            "retrieve_seconds": spans.get("query.retrieve", 0.0),
+            "llm_seconds": spans.get("query.llm", 0.0),
+        }
+        if timings:
+            print(f"query {mode}: p50 {results[mode]['p50_ms']:.1f}ms p99 {results[mode]['p99_ms']:.1f}ms, {len(errors)} failed", file=sys.stderr)
+        else:
+            print(f"query {mode}: all {len(errors)} queries failed", file=sys.stderr)
+    _close_engine(engine)
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(
+    sizes: List[int],
+    n_queries: int,
+    files_per_modality: int,
+    modes: List[str],
+    batch: int = 10,
+    seed: int = 0,
+    workdir: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Run every benchmark in a scratch directory
+
+    The app keeps its stores and caches relative to the working directory,
+    so the process moves into workdir before any app module is imported.
+
+    Returns:
+        JSON-serialisable results
+    """
+    owned = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix="rag-bench-")
+    previous_dir = os.getcwd()
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    try:
+        corpus = Corpus(seed)
+        results: Dict[str, Any] = {
+            "meta": {
+                "commit": _git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "seed": seed,
+                "sizes": sizes,
+                "queries": n_queries,
+                "batch": batch,
+                "files_per_modality": files_per_modality,
+            },
+        }
+        if files_per_modality:
+            files = generate_files(os.path.join(workdir, "corpus"), corpus, files_per_modality)
+            results["ingest"] = bench_ingest(files)
+        if sizes:
+            results["indexing"] = bench_indexing(corpus, sizes, batch)
+            results["load"] = bench_load()
+            if n_queries:
+                results["query"] = bench_queries(corpus, n_queries, modes)
+        return results
+    finally:
+        os.chdir(previous_dir)
+        if owned:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="100,1000,5000", help="comma-separated corpus sizes in documents")
+    parser.add_argument("--queries", type=int, default=200, help="queries per retrieval mode")
+    parser.add_argument("--batch", type=int, default=10, help="documents per incremental add into each indexed corpus, 0 skips it")
+    parser.add_argument("--files", type=int, default=3, help="synthetic files per modality for the ingest benchmark")
+    parser.add_argument("--modes", default="vector,keyword,hybrid", help="comma-separated retrieval modes to query")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="keep stores and corpora here instead of a temporary directory")
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    args = parser.parse_args()
+
+    results = run(
+        sizes=[int(size) for size in args.sizes.split(",") if size],
+        n_queries=args.queries,
+        files_per_modality=args.files,
+        modes=[mode for mode in args.modes.split(",") if mode],
+        batch=args.batch,
+        seed=args.seed,
+        workdir=os.path.abspath(args.workdir) if args.workdir else None,
+    )
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
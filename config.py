@@ -13,15 +13,106 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 # Model configurations
 GROQ_MODEL = "llama-3.3-70b-versatile"  # or "llama2-70b-4096"
 EMBEDDING_MODEL = "BAAI/bge-small-en-v1.5"
+EMBED_BATCH_SIZE = 64  # chunks per embedding model call
+
+# Embedding cache settings
+EMBED_CACHE_ENABLED = True
+EMBED_CACHE_DIR = "./embedding_cache"
+EMBED_CACHE_MAX_ENTRIES = 200000
 
 # Vector store settings
-VECTOR_STORE_DIR = "./chroma_db"
-COLLECTION_NAME = "multimodal_rag"
+VECTOR_STORE_DIR = "./chroma_db"  # one subdirectory per collection
+COLLECTION_NAME = "multimodal_rag"  # default collection for ingest
+MAX_LOADED_SHARDS = 8  # collections kept open at once, least recently used are closed first
+SHARD_IDLE_TIMEOUT = 1800  # seconds before an unused collection is closed
+SHARD_QUERY_WORKERS = 4  # collections searched in parallel by one query
+INSERT_BATCH_SIZE = 8192  # nodes written to the stores per batch
+VECTOR_STORE_COMPACT_EVERY = 50  # write transactions between compactions
+VECTOR_STORE_DTYPE = "float32"  # or "float16" to halve embedding memory
+
+# Approximate nearest-neighbour search
+VECTOR_INDEX = "exact"  # "exact", "ivf" (NumPy), "hnsw" (needs hnswlib), or "int8" / "binary" quantized codes
+ANN_CANDIDATES = 4  # multiples of top-k fetched from the ANN index for exact rescoring
+IVF_NLIST = 0  # 0 picks about 4 * sqrt(n) lists at training time
+IVF_NPROBE = 8  # lists scanned per query, higher means better recall
+IVF_TRAIN_MIN = 10000  # vectors needed before the IVF index is trained
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64  # candidates explored per query, higher means better recall
+BINARY_OVERSAMPLE = 10  # extra candidate multiple for binary codes, which rank more coarsely than int8
+
+# Retrieval settings
+RETRIEVAL_MODE = "hybrid"  # "hybrid" (BM25 + vector), "vector" or "keyword" (BM25 only)
+SIMILARITY_TOP_K = 5  # chunks passed to the LLM
+HYBRID_CANDIDATES = 4  # multiples of top-k fetched from each retriever before fusion
+RRF_K = 60  # reciprocal rank fusion constant, higher flattens rank differences
+FILTER_FIELDS = ["file_type", "file_name", "page_number", "video_id", "source", "file_path"]  # metadata indexed for filtering and per-document delete
+
+# Metrics and profiling
+METRICS_ENABLED = True
+METRICS_RECENT_SPANS = 1000  # finished spans kept for the JSON trace view
+METRICS_PORT = 0  # serve /metrics, /metrics.json and /profile on this port, 0 disables
+METRICS_HOST = "127.0.0.1"  # address the metrics server binds to; "0.0.0.0" exposes it to the network
+PROFILER_INTERVAL = 0  # seconds between stack samples, e.g. 0.01; 0 disables the profiler
+
+# Query cache settings
+QUERY_CACHE_ENABLED = True
+QUERY_CACHE_THRESHOLD = 0.95  # cosine similarity for two questions to share an answer
+QUERY_CACHE_TTL = 3600  # seconds
+QUERY_CACHE_MAX_ENTRIES = 1000
+
+# Shared model pool settings
+MODEL_IDLE_TIMEOUT = 1800  # seconds before an unused model is unloaded
+POOL_REAP_INTERVAL = 60  # seconds between idle checks
 
 # File upload settings
 UPLOAD_DIR = "./uploaded_files"
 MAX_FILE_SIZE_MB = 200
 
+# Ingest cache settings
+INGEST_CACHE_ENABLED = True
+INGEST_CACHE_DIR = "./ingest_cache"
+INGEST_CACHE_MAX_MB = 500
+
+# Parallel ingest settings
+INGEST_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+INGEST_FILE_TIMEOUT = 600  # seconds per file
+
+# Background ingest job settings
+JOB_QUEUE_PATH = "./ingest_jobs.db"
+JOB_WORKERS = 1  # jobs run at a time; each one already extracts files in parallel
+JOB_REFRESH_SECONDS = 2  # how often the sidebar polls job progress
+
+# Streaming PDF settings
+PDF_WORKERS = INGEST_WORKERS  # processes extracting page ranges of one streamed PDF (>= PDF_STREAM_MIN_PAGES)
+PDF_PAGES_PER_TASK = 25  # pages extracted per worker task
+PDF_STREAM_MIN_PAGES = 100  # longer PDFs are streamed straight into the index
+INDEX_BATCH_DOCS = 200  # documents buffered before they are chunked, embedded and indexed
+
+# Image OCR settings
+OCR_MAX_SIDE = 2000  # longer image sides are downscaled to this before text detection
+OCR_BATCH_SIZE = 8  # images per EasyOCR batch
+
+# YouTube ingestion settings
+YOUTUBE_CACHE_ENABLED = True
+YOUTUBE_CACHE_DIR = "./youtube_cache"
+YOUTUBE_WORKERS = 8  # videos fetched concurrently
+YOUTUBE_MAX_RETRIES = 3
+YOUTUBE_RETRY_BACKOFF = 1.0  # seconds before the first retry, doubled after each
+YOUTUBE_CHUNK_SECONDS = 60  # caption time covered by one transcript chunk
+YOUTUBE_CHUNK_MAX_CHARS = 1500  # keeps a chunk within the 512-token splitter size
+
+# Speech recognition settings
+SPEECH_BACKEND = "google"  # "google", "sphinx" (offline, needs pocketsphinx) or "placeholder"
+AUDIO_WORKERS = 4  # segments transcribed concurrently
+AUDIO_RECOGNITION_RETRIES = 2  # retries of a segment the Google API failed to answer
+AUDIO_RETRY_BACKOFF = 1.0  # seconds before the first retry, doubled after each
+AUDIO_SAMPLE_RATE = 16000  # audio is resampled to mono at this rate before recognition
+AUDIO_SEGMENT_MIN_SECONDS = 5  # segments shorter than this don't end at a pause
+AUDIO_SEGMENT_MAX_SECONDS = 30  # longer speech is cut hard
+AUDIO_MIN_SILENCE_MS = 500  # pause length that ends a segment
+AUDIO_SILENCE_THRESH_DBFS = -40  # quieter frames count as silence
+
 # Supported file types
 SUPPORTED_TEXT_FORMATS = [".txt", ".pdf", ".docx", ".doc", ".md"]
 SUPPORTED_IMAGE_FORMATS = [".jpg", ".jpeg", ".png", ".gif", ".bmp"]
@@ -31,4 +122,5 @@ SUPPORTED_VIDEO_FORMATS = [".mp4", ".avi", ".mov", ".mkv"]
 # Create necessary directories
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
+os.makedirs(INGEST_CACHE_DIR, exist_ok=True)
 
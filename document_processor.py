@@ -1,26 +1,115 @@
 """
 Document processor for handling multiple file types
 """
-import os
+import functools
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from pathlib import Path
-from typing import List, Dict, Any
-import PyPDF2
-import docx
-from PIL import Image
-import easyocr
-import numpy as np
-import speech_recognition as sr
-from pydub import AudioSegment
-from moviepy.editor import VideoFileClip
-import tempfile
+from typing import List, Dict, Any, Optional, Callable, Iterable, Iterator, Tuple
 from llama_index.core import Document
+from ingest_cache import IngestCache
+from pdf_extract import pdf_page_count, extract_pdf_pages
+from image_ocr import image_size, load_for_ocr, pad_batch
+from resource_pool import get_pool
+import metrics
+from transcription import RecognizerBackend, get_recognizer, iter_pcm, iter_segments, transcribe_segments
+from config import (
+    INGEST_CACHE_ENABLED,
+    PDF_WORKERS,
+    PDF_PAGES_PER_TASK,
+    PDF_STREAM_MIN_PAGES,
+    SPEECH_BACKEND,
+    AUDIO_WORKERS,
+    AUDIO_SAMPLE_RATE,
+    OCR_MAX_SIDE,
+    OCR_BATCH_SIZE,
+)
+
+
+# Bump whenever extraction output changes so stale cache entries are ignored
+PROCESSOR_VERSION = "3"
+
+# Extension -> handler registry. Handlers import their libraries (OCR, codecs,
+# PDF/DOCX parsers) on first call, so importing this module stays cheap and
+# each modality only costs something once it is actually used.
+_HANDLERS: Dict[str, Callable[..., List[Document]]] = {}
+
+# Extension -> streaming handler, yielding Documents as they are extracted
+_STREAMERS: Dict[str, Callable[..., Iterator[Document]]] = {}
+
+
+def register_handler(*extensions: str):
+    """
+    Register a function as the processor for one or more file extensions
+    
+    The function is called as handler(processor, file_path), so methods of
+    DocumentProcessor can be registered directly.
+    
+    Args:
+        *extensions: Lower-case extensions including the dot, e.g. '.pdf'
+        
+    Returns:
+        Decorator that registers and returns the function
+    """
+    def decorator(func):
+        for extension in extensions:
+            _HANDLERS[extension] = func
+        return func
+    return decorator
+
+
+def register_streamer(*extensions: str):
+    """
+    Register a generator function as the streaming processor for extensions
+    
+    Streamers are called as streamer(processor, file_path) and are used by
+    DocumentProcessor.iter_file(). Extensions without one fall back to their
+    regular handler.
+    
+    Args:
+        *extensions: Lower-case extensions including the dot, e.g. '.pdf'
+        
+    Returns:
+        Decorator that registers and returns the function
+    """
+    def decorator(func):
+        for extension in extensions:
+            _STREAMERS[extension] = func
+        return func
+    return decorator
+
+
+def supported_extensions() -> List[str]:
+    """Extensions that have a registered handler"""
+    return sorted(_HANDLERS)
 
 
 class DocumentProcessor:
     """Handles processing of various document types"""
     
-    def __init__(self):
-        self.recognizer = sr.Recognizer()
+    def __init__(
+        self,
+        cache: Optional[IngestCache] = None,
+        pdf_workers: int = PDF_WORKERS,
+        speech_backend: str = SPEECH_BACKEND,
+        audio_workers: int = AUDIO_WORKERS,
+    ):
+        self._recognizer = None
+        self.ocr_languages = ['en']
+        self.ocr_max_side = OCR_MAX_SIDE
+        self.pdf_workers = max(1, pdf_workers)
+        self.speech_backend = speech_backend
+        self.audio_workers = max(1, audio_workers)
+        if cache is None and INGEST_CACHE_ENABLED:
+            cache = IngestCache()
+        self.cache = cache
+    
+    @property
+    def recognizer(self) -> RecognizerBackend:
+        """Speech recognition backend, created on first audio/video file"""
+        if self._recognizer is None:
+            self._recognizer = get_recognizer(self.speech_backend)
+        return self._recognizer
     
     def process_file(self, file_path: str) -> List[Document]:
         """
@@ -34,33 +123,135 @@ class DocumentProcessor:
         """
         extension = Path(file_path).suffix.lower()
         
-        processors = {
-            '.txt': self._process_text,
-            '.pdf': self._process_pdf,
-            '.docx': self._process_docx,
-            '.doc': self._process_docx,
-            '.jpg': self._process_image,
-            '.jpeg': self._process_image,
-            '.png': self._process_image,
-            '.gif': self._process_image,
-            '.bmp': self._process_image,
-            '.mp3': self._process_audio,
-            '.wav': self._process_audio,
-            '.m4a': self._process_audio,
-            '.ogg': self._process_audio,
-            '.mp4': self._process_video,
-            '.avi': self._process_video,
-            '.mov': self._process_video,
-            '.mkv': self._process_video,
-            '.md': self._process_text,
-        }
-        
-        processor = processors.get(extension)
-        if processor:
-            return processor(file_path)
-        else:
+        handler = _HANDLERS.get(extension)
+        if not handler:
             raise ValueError(f"Unsupported file type: {extension}")
+        
+        processor = functools.partial(handler, self)
+        modality = get_file_type_category(file_path)
+        
+        with metrics.span("document.process", modality=modality):
+            if self.cache is None:
+                return processor(file_path)
+            
+            key = self._cache_key(file_path, extension)
+            documents = self._cached_documents(key, file_path)
+            if documents is not None:
+                return documents
+            
+            # Cache hits are cheap, only extraction is timed separately
+            with metrics.span("document.extract", modality=modality):
+                documents = processor(file_path)
+        
+        # Don't cache failures, they may be transient (network, missing codecs)
+        if not any('error' in doc.metadata for doc in documents):
+            self.cache.put(key, documents)
+        
+        return documents
+    
+    def iter_file(self, file_path: str) -> Iterator[Document]:
+        """
+        Yield a file's Documents as they are extracted
+        
+        File types with a registered streamer (PDF) never hold the whole
+        result in memory. Streamed output is not written to the ingest cache,
+        since that would mean collecting it first, but earlier cached results
+        are still used.
+        
+        Args:
+            file_path: Path to the file to process
+            
+        Returns:
+            Iterator of LlamaIndex Document objects
+        """
+        extension = Path(file_path).suffix.lower()
+        
+        streamer = _STREAMERS.get(extension)
+        if not streamer:
+            yield from self.process_file(file_path)
+            return
+        
+        if self.cache is not None:
+            documents = self._cached_documents(self._cache_key(file_path, extension), file_path)
+            if documents is not None:
+                yield from documents
+                return
+        
+        yield from streamer(self, file_path)
+    
+    def process_images(self, file_paths: List[str], batch_size: int = OCR_BATCH_SIZE) -> Dict[str, List[Document]]:
+        """
+        OCR many images, running them through the reader in batches
+        
+        Cached images are skipped. The rest are sorted by size, so images in
+        a batch need little padding to a common shape, and processed
+        batch_size at a time.
+        
+        Args:
+            file_paths: Paths of the image files
+            batch_size: Images per EasyOCR batch
+            
+        Returns:
+            Dictionary mapping each path to its Documents
+        """
+        results = {}
+        keys = {}
+        misses = []
+        for file_path in file_paths:
+            if self.cache is not None:
+                keys[file_path] = self._cache_key(file_path, Path(file_path).suffix.lower())
+                documents = self._cached_documents(keys[file_path], file_path)
+                if documents is not None:
+                    results[file_path] = documents
+                    continue
+            misses.append(file_path)
+        
+        def area(file_path):
+            try:
+                width, height = image_size(file_path)
+                return width * height
+            except Exception:
+                return 0
+        
+        misses.sort(key=area)
+        for start in range(0, len(misses), batch_size):
+            batch = self._ocr_batch(misses[start:start + batch_size])
+            for file_path, documents in batch.items():
+                if self.cache is not None and not any('error' in doc.metadata for doc in documents):
+                    self.cache.put(keys[file_path], documents)
+            results.update(batch)
+        
+        return {file_path: results[file_path] for file_path in file_paths}
+    
+    def _cache_key(self, file_path: str, extension: str) -> str:
+        return IngestCache.make_key(
+            IngestCache.hash_file(file_path),
+            PROCESSOR_VERSION,
+            self._cache_options(extension),
+        )
     
+    def _cached_documents(self, key: str, file_path: str) -> Optional[List[Document]]:
+        documents = self.cache.get(key)
+        metrics.inc("ingest_cache_total", result="miss" if documents is None else "hit")
+        if documents is not None:
+            # Same bytes may have been uploaded under another name
+            for doc in documents:
+                doc.metadata.update({
+                    'file_name': Path(file_path).name,
+                    'file_path': file_path
+                })
+        return documents
+    
+    def _cache_options(self, extension: str) -> Dict[str, Any]:
+        """Extraction options that change the output for a given extension"""
+        return {
+            'extension': extension,
+            'ocr_languages': self.ocr_languages,
+            'ocr_max_side': self.ocr_max_side,
+            'speech_backend': self.speech_backend,
+        }
+    
+    @register_handler('.txt', '.md')
     def _process_text(self, file_path: str) -> List[Document]:
         """Process text files"""
         with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
@@ -75,31 +266,83 @@ class DocumentProcessor:
             }
         )]
     
+    @register_handler('.pdf')
     def _process_pdf(self, file_path: str) -> List[Document]:
         """Process PDF files"""
-        documents = []
+        documents = list(self.iter_pdf_pages(file_path))
+        # Workers finish out of order, keep cached results deterministic
+        documents.sort(key=lambda doc: doc.metadata['page_number'])
+        return documents
+    
+    @register_streamer('.pdf')
+    def iter_pdf_pages(self, file_path: str) -> Iterator[Document]:
+        """
+        Yield one Document per non-empty PDF page as page ranges finish
         
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
+        PDFs of at least PDF_STREAM_MIN_PAGES pages are split into ranges of
+        PDF_PAGES_PER_TASK pages, extracted by up to pdf_workers processes.
+        At most two ranges per worker are in flight, so memory stays flat
+        however long the PDF is, and pages arrive in completion order.
+        Shorter PDFs are extracted in this process, where starting a pool
+        would cost more than it saves.
+        
+        Args:
+            file_path: Path to the PDF
             
-            for page_num, page in enumerate(pdf_reader.pages):
-                text = page.extract_text()
-                
-                if text.strip():
-                    documents.append(Document(
-                        text=text,
-                        metadata={
-                            'file_name': Path(file_path).name,
-                            'file_type': 'pdf',
-                            'page_number': page_num + 1,
-                            'file_path': file_path
-                        }
-                    ))
+        Returns:
+            Iterator of page Documents
+        """
+        page_count = pdf_page_count(file_path)
+        ranges = [
+            (start, min(start + PDF_PAGES_PER_TASK, page_count))
+            for start in range(0, page_count, PDF_PAGES_PER_TASK)
+        ]
         
-        return documents
+        workers = min(self.pdf_workers, len(ranges)) if page_count >= PDF_STREAM_MIN_PAGES else 1
+        if workers <= 1:
+            for start, stop in ranges:
+                yield from self._pdf_page_documents(file_path, extract_pdf_pages(file_path, start, stop))
+            return
+        
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+        try:
+            pending = set()
+            remaining = iter(ranges)
+            while True:
+                for start, stop in remaining:
+                    pending.add(executor.submit(extract_pdf_pages, file_path, start, stop))
+                    if len(pending) >= 2 * workers:
+                        break
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from self._pdf_page_documents(file_path, future.result())
+        finally:
+            # Also runs when the consumer stops early; drop queued ranges
+            executor.shutdown(wait=True, cancel_futures=True)
     
+    def _pdf_page_documents(self, file_path: str, pages: List[Tuple[int, str]]) -> Iterator[Document]:
+        for page_number, text in pages:
+            if text.strip():
+                yield Document(
+                    text=text,
+                    metadata={
+                        'file_name': Path(file_path).name,
+                        'file_type': 'pdf',
+                        'page_number': page_number,
+                        'file_path': file_path
+                    }
+                )
+    
+    @register_handler('.docx', '.doc')
     def _process_docx(self, file_path: str) -> List[Document]:
         """Process DOCX files"""
+        import docx
+        
         doc = docx.Document(file_path)
         text = '\n'.join([paragraph.text for paragraph in doc.paragraphs])
         
@@ -112,118 +355,167 @@ class DocumentProcessor:
             }
         )]
     
+    @register_handler('.jpg', '.jpeg', '.png', '.gif', '.bmp')
     def _process_image(self, file_path: str) -> List[Document]:
         """Process image files using EasyOCR (OpenCV-based)"""
+        return self._ocr_batch([file_path])[file_path]
+    
+    @metrics.timed("document.ocr_batch")
+    def _ocr_batch(self, file_paths: List[str]) -> Dict[str, List[Document]]:
+        """Run one batch of images through the EasyOCR reader"""
+        results = {}
         try:
-            # Initialize EasyOCR reader (lazy load to save memory)
-            # using cpu=True for compatibility with free tier cloud instances
-            if not hasattr(self, 'reader'):
-                self.reader = easyocr.Reader(['en'], gpu=False)
-            
-            # Read text directly from file path
-            result = self.reader.readtext(file_path, detail=0)
-            text = " ".join(result)
-            
-            image = Image.open(file_path)
-            
-            if not text.strip():
-                text = f"[Image file: {Path(file_path).name}. No text detected via OCR.]"
+            import easyocr
             
-            return [Document(
-                text=text,
-                metadata={
-                    'file_name': Path(file_path).name,
-                    'file_type': 'image',
-                    'file_path': file_path,
-                    'image_size': f"{image.width}x{image.height}",
-                    'ocr_engine': 'easyocr'
-                }
-            )]
+            # EasyOCR reader is shared process-wide, loaded on first use and
+            # evicted when idle; using cpu for free tier cloud instances
+            reader = get_pool().get(
+                ('easyocr', tuple(self.ocr_languages)),
+                lambda: easyocr.Reader(self.ocr_languages, gpu=False),
+            )
         except Exception as e:
-            return [Document(
-                text=f"[Image file: {Path(file_path).name}. Error processing: {str(e)}]",
-                metadata={
-                    'file_name': Path(file_path).name,
-                    'file_type': 'image',
-                    'file_path': file_path,
-                    'error': str(e)
-                }
-            )]
-
+            return {file_path: [self._image_error(file_path, e)] for file_path in file_paths}
+        
+        # Decode each image once, downscaled; dimensions come from the header
+        loaded = {}
+        for file_path in file_paths:
+            try:
+                loaded[file_path] = load_for_ocr(file_path, self.ocr_max_side)
+            except Exception as e:
+                results[file_path] = [self._image_error(file_path, e)]
+        
+        if loaded:
+            try:
+                batch = pad_batch([image for image, _ in loaded.values()])
+                texts = reader.readtext_batched(batch, detail=0)
+            except Exception as e:
+                texts = None
+                for file_path in loaded:
+                    results[file_path] = [self._image_error(file_path, e)]
+            
+            if texts is not None:
+                for (file_path, (_, (width, height))), words in zip(loaded.items(), texts):
+                    text = " ".join(words)
+                    if not text.strip():
+                        text = f"[Image file: {Path(file_path).name}. No text detected via OCR.]"
+                    
+                    results[file_path] = [Document(
+                        text=text,
+                        metadata={
+                            'file_name': Path(file_path).name,
+                            'file_type': 'image',
+                            'file_path': file_path,
+                            'image_size': f"{width}x{height}",
+                            'ocr_engine': 'easyocr'
+                        }
+                    )]
+        
+        return results
+    
+    def _image_error(self, file_path: str, error: Exception) -> Document:
+        return Document(
+            text=f"[Image file: {Path(file_path).name}. Error processing: {str(error)}]",
+            metadata={
+                'file_name': Path(file_path).name,
+                'file_type': 'image',
+                'file_path': file_path,
+                'error': str(error)
+            }
+        )
     
+    @register_handler('.mp3', '.wav', '.m4a', '.ogg')
     def _process_audio(self, file_path: str) -> List[Document]:
-        """Process audio files using speech recognition"""
+        """Process audio files by transcribing silence-separated segments concurrently"""
         try:
-            # Convert to WAV if needed
-            audio = AudioSegment.from_file(file_path)
-            
-            # Export to temporary WAV file
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_wav:
-                audio.export(temp_wav.name, format='wav')
-                temp_wav_path = temp_wav.name
-            
-            # Perform speech recognition
-            with sr.AudioFile(temp_wav_path) as source:
-                audio_data = self.recognizer.record(source)
-                try:
-                    text = self.recognizer.recognize_google(audio_data)
-                except sr.UnknownValueError:
-                    text = "[Audio file: Google Speech Recognition could not understand audio]"
-                except sr.RequestError as e:
-                    text = f"[Audio file: Could not request results; {e}]"
-            
-            # Clean up temp file
-            os.unlink(temp_wav_path)
-            
+            # ffmpeg decodes straight to the recognizer's format, no temp WAV
+            return self._transcribe_pcm(file_path, iter_pcm(file_path, AUDIO_SAMPLE_RATE), {'file_type': 'audio'})
+        except Exception as e:
             return [Document(
-                text=text,
+                text=f"[Audio file: {Path(file_path).name}. Error processing: {str(e)}]",
                 metadata={
                     'file_name': Path(file_path).name,
                     'file_type': 'audio',
                     'file_path': file_path,
-                    'duration_seconds': len(audio) / 1000
+                    'error': str(e)
                 }
             )]
-        except Exception as e:
-            return [Document(
-                text=f"[Audio file: {Path(file_path).name}. Error processing: {str(e)}]",
+    
+    def _transcribe_pcm(
+        self,
+        file_path: str,
+        pcm_chunks: Iterable[bytes],
+        metadata: Dict[str, Any],
+    ) -> List[Document]:
+        """
+        Transcribe mono 16-bit PCM into one Document per speech segment
+        
+        Args:
+            file_path: File the audio came from
+            pcm_chunks: PCM at AUDIO_SAMPLE_RATE in chunks of any size
+            metadata: Extra metadata for every Document, including file_type
+            
+        Returns:
+            Documents with start_seconds/end_seconds offsets, in recording order
+        """
+        total_bytes = 0
+        
+        def counted(chunks):
+            nonlocal total_bytes
+            for chunk in chunks:
+                total_bytes += len(chunk)
+                yield chunk
+        
+        documents = []
+        segments = iter_segments(counted(pcm_chunks), AUDIO_SAMPLE_RATE)
+        for segment, text in transcribe_segments(segments, self.recognizer, AUDIO_SAMPLE_RATE, self.audio_workers):
+            if text.strip():
+                documents.append(Document(
+                    text=text,
+                    metadata={
+                        'file_name': Path(file_path).name,
+                        'file_path': file_path,
+                        'segment': segment.index,
+                        'start_seconds': segment.start,
+                        'end_seconds': segment.end,
+                        **metadata
+                    }
+                ))
+        
+        if not documents:
+            documents.append(Document(
+                text=f"[{metadata['file_type'].capitalize()} file: {Path(file_path).name}. No speech could be recognized]",
                 metadata={
                     'file_name': Path(file_path).name,
-                    'file_type': 'audio',
                     'file_path': file_path,
-                    'error': str(e)
+                    **metadata
                 }
-            )]
+            ))
+        
+        # Duration is only known once the whole stream has been decoded
+        if 'duration_seconds' not in metadata:
+            for doc in documents:
+                doc.metadata['duration_seconds'] = total_bytes / (AUDIO_SAMPLE_RATE * 2)
+        
+        return documents
     
+    @register_handler('.mp4', '.avi', '.mov', '.mkv')
     def _process_video(self, file_path: str) -> List[Document]:
-        """Process video files by extracting audio and using speech recognition"""
+        """Process video files by streaming their audio track into speech recognition"""
         try:
-            # Extract audio from video
-            video = VideoFileClip(file_path)
-            
-            # Export audio to temporary file
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_audio:
-                video.audio.write_audiofile(temp_audio.name, logger=None)
-                temp_audio_path = temp_audio.name
+            from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
             
-            # Process the audio
-            audio_docs = self._process_audio(temp_audio_path)
+            # Header probe only, the audio track is decoded once below
+            infos = ffmpeg_parse_infos(file_path)
             
-            # Update metadata
-            for doc in audio_docs:
-                doc.metadata.update({
-                    'file_name': Path(file_path).name,
+            return self._transcribe_pcm(
+                file_path,
+                iter_pcm(file_path, AUDIO_SAMPLE_RATE),
+                {
                     'file_type': 'video',
-                    'file_path': file_path,
-                    'duration_seconds': video.duration,
-                    'fps': video.fps
-                })
-            
-            # Clean up
-            os.unlink(temp_audio_path)
-            video.close()
-            
-            return audio_docs
+                    'duration_seconds': infos.get('duration'),
+                    'fps': infos.get('video_fps')
+                },
+            )
         except Exception as e:
             return [Document(
                 text=f"[Video file: {Path(file_path).name}. Error processing: {str(e)}]",
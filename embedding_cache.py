@@ -0,0 +1,182 @@
+"""
+Persistent embedding cache keyed by model name and chunk text
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from config import EMBED_CACHE_DIR, EMBED_CACHE_MAX_ENTRIES
+
+
+# SQLite limits the number of bound parameters per statement
+_SQL_BATCH = 500
+
+
+class EmbeddingCache:
+    """SQLite store of float32 embedding blobs with least recently used eviction"""
+
+    def __init__(self, cache_dir: str = EMBED_CACHE_DIR, max_entries: int = EMBED_CACHE_MAX_ENTRIES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(cache_dir, "embeddings.db"),
+            check_same_thread=False,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key BLOB PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+        )
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> bytes:
+        """
+        Hash a chunk for lookup, ignoring Unicode form and whitespace differences
+
+        Args:
+            model_name: Name of the embedding model
+            text: Chunk text as sent to the model
+
+        Returns:
+            20-byte digest
+        """
+        normalized = re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+        return hashlib.sha1(f"{model_name}\0{normalized}".encode("utf-8")).digest()
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, List[float]]:
+        """Return cached embeddings for the keys that are present"""
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _SQL_BATCH):
+                batch = keys[start:start + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                for key, vector in self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch,
+                ):
+                    found[key] = np.frombuffer(vector, dtype=np.float32).tolist()
+
+            if found:
+                now = time.time()
+                with self._conn:
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                        [(now, key) for key in found],
+                    )
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, embeddings: Dict[bytes, List[float]]):
+        """Store embeddings and evict the least recently used ones if over budget"""
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                    [
+                        (key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                        for key, vector in embeddings.items()
+                    ],
+                )
+            self._count += self._conn.total_changes - before
+
+            if self._count > self.max_entries:
+                with self._conn:
+                    self._conn.execute(
+                        "DELETE FROM embeddings WHERE key IN "
+                        "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                        (self._count - self.max_entries,),
+                    )
+                self._count = self.max_entries
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the number of cached embeddings"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': self._count,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Wraps an embedding model so chunk embeddings are computed once per text
+
+    Only document (text) embeddings are cached. Query embeddings go straight
+    to the wrapped model since some models embed queries with an instruction
+    prefix.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, embed_model: BaseEmbedding, cache: Optional[EmbeddingCache] = None, **kwargs: Any):
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            **kwargs,
+        )
+        self._embed_model = embed_model
+        self._cache = cache or EmbeddingCache()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._embed_model.get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return await self._embed_model.aget_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        keys = [EmbeddingCache.make_key(self.model_name, text) for text in texts]
+        found = self._cache.get_many(keys)
+
+        # Embed each distinct missing text once, even if it repeats in the batch
+        missing: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self._embed_model.get_text_embedding_batch(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._cache.put_many(computed)
+            found.update(computed)
+
+        return [found[key] for key in keys]
@@ -0,0 +1,54 @@
+"""
+Image loading helpers for batched OCR
+"""
+from typing import List, Tuple
+import numpy as np
+from config import OCR_MAX_SIDE
+
+
+def image_size(file_path: str) -> Tuple[int, int]:
+    """Width and height of an image, read from its header without decoding pixels"""
+    from PIL import Image
+
+    with Image.open(file_path) as image:
+        return image.size
+
+
+def load_for_ocr(file_path: str, max_side: int = OCR_MAX_SIDE) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """
+    Decode an image as upright greyscale, no larger than max_side on either side
+
+    JPEGs are decoded directly at a reduced scale, other formats are resized
+    after decoding. EasyOCR works on greyscale internally, so nothing is lost
+    by converting first.
+
+    Args:
+        file_path: Path to the image
+        max_side: Longest allowed side in pixels
+
+    Returns:
+        Tuple of (greyscale uint8 array, original (width, height) from the header)
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(file_path) as image:
+        size = image.size
+        if max(size) > max_side:
+            # Only affects JPEG, lets the decoder skip most of the work
+            image.draft('L', (max_side, max_side))
+        image = ImageOps.exif_transpose(image).convert('L')
+        if max(image.size) > max_side:
+            image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        return np.asarray(image), size
+
+
+def pad_batch(images: List[np.ndarray]) -> List[np.ndarray]:
+    """Pad greyscale images with white to a common shape, as batched detection requires"""
+    height = max(image.shape[0] for image in images)
+    width = max(image.shape[1] for image in images)
+    padded = []
+    for image in images:
+        canvas = np.full((height, width), 255, dtype=np.uint8)
+        canvas[:image.shape[0], :image.shape[1]] = image
+        padded.append(canvas)
+    return padded
@@ -0,0 +1,161 @@
+"""
+Content-addressed on-disk cache for extracted documents
+"""
+import hashlib
+import json
+import os
+import tempfile
+from typing import List, Optional, Dict, Any, Tuple
+from llama_index.core import Document
+from config import INGEST_CACHE_DIR, INGEST_CACHE_MAX_MB
+
+
+class IngestCache:
+    """Stores extracted Documents keyed by file content, processor version and options"""
+
+    def __init__(self, cache_dir: str = INGEST_CACHE_DIR, max_size_mb: float = INGEST_CACHE_MAX_MB):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def hash_file(file_path: str) -> str:
+        """
+        Compute the SHA-256 digest of a file's contents
+
+        Args:
+            file_path: Path to the file to hash
+
+        Returns:
+            Hex digest of the file bytes
+        """
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def make_key(content_hash: str, version: str, options: Dict[str, Any]) -> str:
+        """
+        Build a cache key from a content hash, processor version and options
+
+        Args:
+            content_hash: Digest of the file contents
+            version: Version of the processor that produced the documents
+            options: Extraction options that influence the output
+
+        Returns:
+            Cache key
+        """
+        payload = json.dumps(
+            {'content': content_hash, 'version': version, 'options': options},
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[List[Document]]:
+        """
+        Look up cached documents
+
+        Args:
+            key: Cache key from make_key
+
+        Returns:
+            List of cached Documents, or None on a miss
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            documents = [Document.from_dict(item) for item in data['documents']]
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError, KeyError, TypeError):
+            # Corrupt or partially written entry, drop it and treat as a miss
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        # Touch the entry so eviction sees it as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self.hits += 1
+        return documents
+
+    def put(self, key: str, documents: List[Document]):
+        """
+        Store documents under a key and evict old entries if over budget
+
+        Args:
+            key: Cache key from make_key
+            documents: Documents to store
+        """
+        data = {'documents': [doc.to_dict() for doc in documents]}
+
+        # Write to a temp file first so readers never see a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(temp_path, self._entry_path(key))
+        except Exception:
+            self._remove(temp_path)
+            raise
+
+        self._evict()
+
+    def _entries(self) -> List[Tuple[str, os.stat_result]]:
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.json'):
+                try:
+                    entries.append((entry.path, entry.stat()))
+                except OSError:
+                    continue
+        return entries
+
+    def _evict(self):
+        """Remove least recently used entries until the cache fits its size budget"""
+        entries = self._entries()
+        total = sum(stat.st_size for _, stat in entries)
+        if total <= self.max_size_bytes:
+            return
+
+        entries.sort(key=lambda item: item[1].st_mtime)
+        for path, stat in entries:
+            if total <= self.max_size_bytes:
+                break
+            self._remove(path)
+            total -= stat.st_size
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current cache size"""
+        entries = self._entries()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(entries),
+            'size_bytes': sum(stat.st_size for _, stat in entries),
+        }
+
+    def clear(self):
+        """Remove every cached entry"""
+        for path, _ in self._entries():
+            self._remove(path)
@@ -0,0 +1,210 @@
+"""
+Parallel ingestion pipeline that fans files out to a process pool
+"""
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from llama_index.core import Document
+from document_processor import DocumentProcessor, get_file_type_category
+import metrics
+from config import INGEST_WORKERS, INGEST_FILE_TIMEOUT, OCR_BATCH_SIZE
+
+
+@dataclass
+class IngestResult:
+    """Outcome of processing a single file"""
+    file_path: str
+    documents: List[Document] = field(default_factory=list)
+    error: Optional[str] = None
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+# One DocumentProcessor per worker process so OCR models load once per worker
+_worker_processor: Optional[DocumentProcessor] = None
+
+
+def _init_worker(threads: int):
+    global _worker_processor
+    # Split the cores between workers so torch (EasyOCR) doesn't oversubscribe them
+    os.environ.setdefault('OMP_NUM_THREADS', str(threads))
+    # The pipeline already runs a process per core, a PDF pool per worker would nest pools
+    _worker_processor = DocumentProcessor(pdf_workers=1)
+
+
+class _FileTimeout(BaseException):
+    """
+    Raised by the alarm when a file runs out of time
+
+    A BaseException, so the handlers' `except Exception` fallbacks can't turn
+    it into an error Document that would be indexed as if it were content.
+    """
+
+
+def _raise_timeout(signum, frame):
+    raise _FileTimeout()
+
+
+def _process_in_worker(file_paths: List[str], timeout: Optional[float]) -> Tuple[Dict[str, List[Document]], float]:
+    """
+    Process one file, or a batch of images, inside a worker, enforcing the timeout
+
+    A batch gets the per-file timeout once for every image in it.
+    """
+    # SIGALRM is only available on Unix; elsewhere files run without a timeout
+    use_alarm = bool(timeout) and hasattr(signal, 'SIGALRM')
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout * len(file_paths))
+
+    start = time.perf_counter()
+    try:
+        if len(file_paths) == 1:
+            documents = {file_paths[0]: _worker_processor.process_file(file_paths[0])}
+        else:
+            documents = _worker_processor.process_images(file_paths)
+    except _FileTimeout:
+        # Reported to the parent as an ordinary error result
+        raise TimeoutError("File processing timed out") from None
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    return documents, time.perf_counter() - start
+
+
+class IngestPipeline:
+    """Processes many files in parallel with per-file timeouts and failure isolation"""
+
+    def __init__(
+        self,
+        max_workers: int = INGEST_WORKERS,
+        file_timeout: Optional[float] = INGEST_FILE_TIMEOUT,
+        max_retries: int = 1,
+        image_batch_size: int = OCR_BATCH_SIZE,
+    ):
+        self.max_workers = max(1, max_workers)
+        self.file_timeout = file_timeout
+        self.max_retries = max_retries
+        self.image_batch_size = max(1, image_batch_size)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # The pipeline may be shared by several sessions' script threads
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Workers are kept alive between batches so models stay loaded.
+        # spawn avoids forking a process that already runs torch/Streamlit threads.
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(max(1, (os.cpu_count() or 1) // self.max_workers),),
+                )
+            return self._executor
+
+    def _reset_executor(self, broken: ProcessPoolExecutor):
+        with self._lock:
+            # Another caller may already have replaced the broken pool
+            if self._executor is broken:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _plan_tasks(self, file_paths: List[str]) -> List[List[str]]:
+        """One task per file, except images which are grouped into OCR batches"""
+        images = [path for path in file_paths if get_file_type_category(path) == 'image']
+        tasks = [[path] for path in file_paths if get_file_type_category(path) != 'image']
+        # Spread the images over all workers rather than filling a few big batches
+        per_task = max(1, min(self.image_batch_size, -(-len(images) // self.max_workers)))
+        tasks.extend(images[start:start + per_task] for start in range(0, len(images), per_task))
+        return tasks
+
+    def process_files(self, file_paths: Iterable[str]) -> Iterator[IngestResult]:
+        """
+        Process files in parallel and yield results in completion order
+
+        Images are OCR'd in batches of up to image_batch_size per worker task.
+        A file that fails or times out yields an IngestResult with an error
+        instead of aborting the batch. If a worker crashes hard (e.g. a native
+        OCR/codec segfault) the pool is rebuilt and in-flight files are retried
+        on their own up to max_retries times.
+
+        Args:
+            file_paths: Paths of the files to process
+
+        Returns:
+            Iterator of IngestResult objects
+        """
+        file_paths = list(file_paths)
+        pending = self._plan_tasks(file_paths)
+        attempts = {path: 0 for path in file_paths}
+        futures = {}
+
+        try:
+            while pending:
+                executor = self._get_executor()
+                futures = {
+                    executor.submit(_process_in_worker, paths, self.file_timeout): paths
+                    for paths in pending
+                }
+                pending = []
+
+                for future in as_completed(futures):
+                    paths = futures[future]
+                    try:
+                        documents, seconds = future.result()
+                        for path in paths:
+                            yield self._record(
+                                IngestResult(file_path=path, documents=documents[path], seconds=seconds / len(paths))
+                            )
+                    except BrokenProcessPool:
+                        for path in paths:
+                            attempts[path] += 1
+                            if attempts[path] <= self.max_retries:
+                                # Alone, so one bad image can't take its batch down again
+                                pending.append([path])
+                            else:
+                                yield self._record(IngestResult(file_path=path, error="Worker process crashed"))
+                    except Exception as e:
+                        for path in paths:
+                            yield self._record(IngestResult(file_path=path, error=str(e)))
+
+                if pending:
+                    self._reset_executor(executor)
+        finally:
+            # A caller that stops early (e.g. a cancelled job) must not leave
+            # its queued files occupying the shared pool
+            for future in futures:
+                future.cancel()
+
+    @staticmethod
+    def _record(result: IngestResult) -> IngestResult:
+        """Record a result's metrics here, since spans recorded in the workers stay in their processes"""
+        modality = get_file_type_category(result.file_path)
+        metrics.inc("ingest_files_total", modality=modality, result="ok" if result.ok else "error")
+        if result.ok:
+            metrics.record_span("ingest.file", result.seconds, modality=modality)
+        return result
+
+    def close(self):
+        """Shut down the worker processes"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,517 @@
+"""
+Persistent background queue for ingestion jobs
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import metrics
+from config import (
+    JOB_QUEUE_PATH,
+    JOB_WORKERS,
+    INDEX_BATCH_DOCS,
+    PDF_STREAM_MIN_PAGES,
+)
+
+
+# Job states; queued and running jobs are picked up again after a restart
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+# Item states; only pending items are processed when a job (re)starts.
+# Removed items were indexed, then deleted from the index again.
+PENDING, ITEM_DONE, ITEM_FAILED, EXPANDED, REMOVED = "pending", "done", "failed", "expanded", "removed"
+
+
+@dataclass
+class Job:
+    """Snapshot of a job and its progress"""
+    id: int
+    kind: str
+    status: str
+    total: int
+    done: int
+    failed: int
+    indexed: int
+    message: str
+    error: Optional[str]
+    created: float
+    finished: Optional[float]
+    collection: Optional[str] = None
+
+    @property
+    def progress(self) -> float:
+        return (self.done + self.failed) / self.total if self.total else 0.0
+
+    @property
+    def active(self) -> bool:
+        return self.status not in FINISHED
+
+
+class JobQueue:
+    """
+    Runs file and YouTube ingestion jobs on background threads
+
+    Jobs and their items (file paths or video URLs) are kept in SQLite, so
+    the queue survives restarts: jobs that were running are queued again and
+    continue with the items not yet indexed. An item only counts as done
+    once its documents are in the index. Cancelling takes effect between
+    items, so a file is never left half indexed, and a cancelled job can be
+    resumed later.
+    """
+
+    def __init__(
+        self,
+        engine: Any,
+        pipeline: Any,
+        db_path: str = JOB_QUEUE_PATH,
+        workers: int = JOB_WORKERS,
+        start: bool = True,
+    ):
+        self.engine = engine
+        self.pipeline = pipeline
+        self.workers = max(1, workers)
+        self._processor = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._stopping = False
+        self._threads: List[threading.Thread] = []
+
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                indexed INTEGER NOT NULL DEFAULT 0,
+                message TEXT NOT NULL DEFAULT '',
+                error TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL,
+                finished REAL,
+                collection TEXT
+            )
+            """
+        )
+        # Queues created before collections existed index into the default one
+        if "collection" not in [column[1] for column in self._conn.execute("PRAGMA table_info(jobs)")]:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN collection TEXT")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS job_items (
+                job_id INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                item TEXT NOT NULL,
+                info TEXT NOT NULL DEFAULT '{}',
+                status TEXT NOT NULL,
+                documents INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                PRIMARY KEY (job_id, position)
+            )
+            """
+        )
+        with self._conn:
+            # Whatever was running when the process stopped starts over from its pending items
+            self._conn.execute("UPDATE jobs SET status = ? WHERE status = ?", (QUEUED, RUNNING))
+
+        if start:
+            self.start()
+
+    @property
+    def processor(self):
+        """DocumentProcessor for long PDFs, which are streamed rather than sent to the pipeline"""
+        if self._processor is None:
+            from document_processor import DocumentProcessor
+
+            self._processor = DocumentProcessor()
+        return self._processor
+
+    def start(self):
+        """Start the worker threads"""
+        with self._wakeup:
+            self._stopping = False
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f"ingest-job-{len(self._threads)}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the workers once their current item is finished"""
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _submit(self, kind: str, items: List[Tuple[str, Dict[str, Any]]], collection: Optional[str]) -> int:
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (kind, status, message, created, collection) VALUES (?, ?, 'Queued', ?, ?)",
+                (kind, QUEUED, time.time(), collection),
+            )
+            job_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT INTO job_items (job_id, position, item, info, status) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (job_id, position, item, json.dumps(info), PENDING)
+                    for position, (item, info) in enumerate(items)
+                ],
+            )
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def submit_files(
+        self,
+        file_paths: Iterable[str],
+        info: Optional[Dict[str, Dict[str, Any]]] = None,
+        collection: Optional[str] = None,
+    ) -> int:
+        """
+        Queue files for extraction and indexing
+
+        Args:
+            file_paths: Saved files, they must stay on disk until the job is done
+            info: Optional per-path details shown in the UI, e.g. {'name', 'size'}
+            collection: Collection to index into, defaults to COLLECTION_NAME
+
+        Returns:
+            Job id
+        """
+        info = info or {}
+        return self._submit("files", [(path, info.get(path, {})) for path in file_paths], collection)
+
+    def submit_youtube(self, urls: Iterable[str], collection: Optional[str] = None) -> int:
+        """Queue YouTube video, playlist or channel URLs, returning the job id"""
+        return self._submit("youtube", [(url.strip(), {}) for url in urls if url.strip()], collection)
+
+    def _row_to_job(self, row: tuple) -> Job:
+        job_id, kind, status, indexed, message, error, created, finished, collection = row
+        counts = dict(self._conn.execute(
+            "SELECT status, COUNT(*) FROM job_items WHERE job_id = ? AND status != ? GROUP BY status",
+            (job_id, EXPANDED),
+        ).fetchall())
+        return Job(
+            id=job_id,
+            kind=kind,
+            status=status,
+            total=sum(counts.values()),
+            done=counts.get(ITEM_DONE, 0) + counts.get(REMOVED, 0),
+            failed=counts.get(ITEM_FAILED, 0),
+            indexed=indexed,
+            message=message,
+            error=error,
+            created=created,
+            finished=finished,
+            collection=collection,
+        )
+
+    _JOB_COLUMNS = "id, kind, status, indexed, message, error, created, finished, collection"
+
+    def get(self, job_id: int) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {self._JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return self._row_to_job(row) if row else None
+
+    def list_jobs(self, limit: int = 10) -> List[Job]:
+        """Most recent jobs first"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {self._JOB_COLUMNS} FROM jobs ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+            return [self._row_to_job(row) for row in rows]
+
+    def item_errors(self, job_id: int) -> List[Tuple[str, str]]:
+        """(item, error) for every failed item of a job"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT item, error FROM job_items WHERE job_id = ? AND status = ? ORDER BY position",
+                (job_id, ITEM_FAILED),
+            ).fetchall()
+
+    def indexed_items(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Details of indexed items, most recent first; an item indexed again is listed once"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_items.item, job_items.info, jobs.kind, jobs.collection FROM job_items "
+                "JOIN jobs ON jobs.id = job_items.job_id WHERE job_items.status = ? "
+                "ORDER BY job_items.job_id DESC, job_items.position DESC",
+                (ITEM_DONE,),
+            ).fetchall()
+        items = {}
+        for item, info, kind, collection in rows:
+            if (item, collection) not in items:
+                items[(item, collection)] = {'item': item, 'kind': kind, 'collection': collection, **json.loads(info)}
+        return list(items.values())[:limit]
+
+    def remove_item(self, item: str, collection: Optional[str] = None):
+        """Drop a file path or URL from indexed_items(), e.g. after deleting it from the index"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE job_items SET status = ? WHERE item = ? AND status = ? "
+                "AND job_id IN (SELECT id FROM jobs WHERE collection IS ?)",
+                (REMOVED, item, ITEM_DONE, collection),
+            )
+
+    def cancel(self, job_id: int) -> bool:
+        """Stop a job after its current item; returns False if it already finished"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET cancel_requested = 1, message = 'Cancelling' WHERE id = ? AND status IN (?, ?)",
+                (job_id, QUEUED, RUNNING),
+            )
+            # A queued job has nothing to finish first
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, message = 'Cancelled', finished = ? WHERE id = ? AND status = ?",
+                (CANCELLED, time.time(), job_id, QUEUED),
+            )
+            return cursor.rowcount > 0
+
+    def resume(self, job_id: int) -> bool:
+        """Queue a cancelled or failed job again to process its remaining items"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, cancel_requested = 0, error = NULL, message = 'Queued', finished = NULL "
+                "WHERE id = ? AND status IN (?, ?)",
+                (QUEUED, job_id, CANCELLED, FAILED),
+            )
+        with self._wakeup:
+            self._wakeup.notify()
+        return cursor.rowcount > 0
+
+    def clear_finished(self):
+        """Forget finished jobs, e.g. after the index they filled was cleared"""
+        with self._lock, self._conn:
+            finished = f"SELECT id FROM jobs WHERE status IN ({','.join('?' * len(FINISHED))})"
+            self._conn.execute(f"DELETE FROM job_items WHERE job_id IN ({finished})", FINISHED)
+            self._conn.execute(f"DELETE FROM jobs WHERE id IN ({finished})", FINISHED)
+
+    def _claim(self) -> Optional[Tuple[int, str, Optional[str]]]:
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT id, kind, collection FROM jobs WHERE status = ? ORDER BY id LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, message = 'Starting' WHERE id = ?", (RUNNING, row[0])
+                )
+            return row
+
+    def _work(self):
+        while True:
+            with self._wakeup:
+                if self._stopping:
+                    return
+            claimed = self._claim()
+            if claimed is None:
+                with self._wakeup:
+                    if not self._stopping:
+                        self._wakeup.wait(timeout=5)
+                continue
+
+            job_id, kind, collection = claimed
+            try:
+                with metrics.span("job.run", kind=kind):
+                    if kind == "youtube":
+                        self._run_youtube(job_id, collection)
+                    else:
+                        self._run_files(job_id, collection)
+                self._finish(job_id)
+            except Exception as e:
+                self._finish(job_id, error=str(e))
+
+    def _finish(self, job_id: int, error: Optional[str] = None):
+        with self._lock, self._conn:
+            if error is not None:
+                status, message = FAILED, "Failed"
+            elif self._conn.execute(
+                "SELECT COUNT(*) FROM job_items WHERE job_id = ? AND status = ?", (job_id, PENDING)
+            ).fetchone()[0]:
+                # Stopped early: cancelled, shutting down, or items the run never reached
+                cancelled = self._conn.execute(
+                    "SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)
+                ).fetchone()[0]
+                if cancelled:
+                    status, message = CANCELLED, "Cancelled"
+                elif self._stopping:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, message = 'Queued' WHERE id = ?", (QUEUED, job_id)
+                    )
+                    return
+                else:
+                    self._conn.execute(
+                        "UPDATE job_items SET status = ?, error = 'Not processed' WHERE job_id = ? AND status = ?",
+                        (ITEM_FAILED, job_id, PENDING),
+                    )
+                    status, message = DONE, "Done"
+            else:
+                status, message = DONE, "Done"
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, message = ?, error = ?, finished = ?, cancel_requested = 0 WHERE id = ?",
+                (status, message, error, time.time(), job_id),
+            )
+        metrics.inc("jobs_total", status=status)
+
+    def _should_stop(self, job_id: int) -> bool:
+        with self._wakeup:
+            if self._stopping:
+                return True
+        with self._lock:
+            return bool(self._conn.execute(
+                "SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()[0])
+
+    def _set_message(self, job_id: int, message: str):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE jobs SET message = ? WHERE id = ?", (message, job_id))
+
+    def _pending_items(self, job_id: int) -> List[Tuple[int, str]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT position, item FROM job_items WHERE job_id = ? AND status = ? ORDER BY position",
+                (job_id, PENDING),
+            ).fetchall()
+
+    def _mark_items(self, job_id: int, results: List[Tuple[int, str, int, Optional[str]]]):
+        """Record (position, status, documents, error) for items and add their documents to the job total"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE job_items SET status = ?, documents = ?, error = ? WHERE job_id = ? AND position = ?",
+                [(status, documents, error, job_id, position) for position, status, documents, error in results],
+            )
+            self._conn.execute(
+                "UPDATE jobs SET indexed = indexed + ? WHERE id = ?",
+                (sum(documents for _, status, documents, _ in results if status == ITEM_DONE), job_id),
+            )
+
+    def _index(self, job_id: int, batch: List[Tuple[int, list]], collection: Optional[str]):
+        """Index the documents of finished items, then mark those items done"""
+        # Handlers report some failures as a Document with an error; that text is not content
+        failed = []
+        for position, item_documents in batch:
+            errors = [doc.metadata['error'] for doc in item_documents if 'error' in doc.metadata]
+            if errors:
+                failed.append((position, ITEM_FAILED, 0, str(errors[0])))
+        if failed:
+            self._mark_items(job_id, failed)
+            failed_positions = {position for position, *_ in failed}
+            batch = [(position, docs) for position, docs in batch if position not in failed_positions]
+
+        documents = [document for _, item_documents in batch for document in item_documents]
+        if documents:
+            self._set_message(job_id, f"Indexing {len(documents)} documents")
+            # Re-indexing a file or video replaces its earlier chunks
+            self.engine.upsert_documents(documents, collection=collection)
+        self._mark_items(job_id, [(position, ITEM_DONE, len(docs), None) for position, docs in batch])
+
+    def _run_files(self, job_id: int, collection: Optional[str]):
+        from document_processor import pdf_page_count
+
+        pending = self._pending_items(job_id)
+        positions = {path: position for position, path in pending}
+
+        # Long PDFs are extracted page-parallel and indexed in batches as pages arrive
+        streamed = []
+        for position, path in pending:
+            if Path(path).suffix.lower() != '.pdf':
+                continue
+            try:
+                if pdf_page_count(path) >= PDF_STREAM_MIN_PAGES:
+                    streamed.append((position, path))
+            except Exception:
+                # Unreadable, the pipeline reports the error
+                pass
+        for position, path in streamed:
+            del positions[path]
+            if self._should_stop(job_id):
+                return
+            self._set_message(job_id, f"Extracting and indexing {Path(path).name}")
+            try:
+                counts = self.engine.upsert_document(path, self.processor.iter_file(path), collection=collection)
+                self._mark_items(job_id, [(position, ITEM_DONE, counts['documents'], None)])
+            except Exception as e:
+                self._mark_items(job_id, [(position, ITEM_FAILED, 0, str(e))])
+
+        if not positions or self._should_stop(job_id):
+            return
+        self._set_message(job_id, f"Extracting {len(positions)} files")
+        batch: List[Tuple[int, list]] = []
+        batch_docs = 0
+        for result in self.pipeline.process_files(list(positions)):
+            position = positions[result.file_path]
+            if result.ok:
+                batch.append((position, result.documents))
+                batch_docs += len(result.documents)
+            else:
+                self._mark_items(job_id, [(position, ITEM_FAILED, 0, result.error)])
+            if batch_docs >= INDEX_BATCH_DOCS:
+                self._index(job_id, batch, collection)
+                batch, batch_docs = [], 0
+            if self._should_stop(job_id):
+                break
+        # Whatever was extracted before a cancel is still worth keeping
+        self._index(job_id, batch, collection)
+
+    def _expand_youtube(self, job_id: int):
+        """Replace playlist and channel items with one item per video"""
+        from youtube_processor import YouTubeProcessor
+
+        for position, url in self._pending_items(job_id):
+            if YouTubeProcessor.extract_video_id(url):
+                continue
+            self._set_message(job_id, "Listing playlist videos")
+            video_urls = YouTubeProcessor.expand_urls([url])
+            if video_urls == [url]:
+                # Could not be listed, processing it reports the error
+                continue
+            with self._lock, self._conn:
+                next_position = self._conn.execute(
+                    "SELECT MAX(position) + 1 FROM job_items WHERE job_id = ?", (job_id,)
+                ).fetchone()[0]
+                self._conn.executemany(
+                    "INSERT INTO job_items (job_id, position, item, status) VALUES (?, ?, ?, ?)",
+                    [(job_id, next_position + offset, video_url, PENDING) for offset, video_url in enumerate(video_urls)],
+                )
+                self._conn.execute(
+                    "UPDATE job_items SET status = ? WHERE job_id = ? AND position = ?",
+                    (EXPANDED, job_id, position),
+                )
+
+    def _run_youtube(self, job_id: int, collection: Optional[str]):
+        from youtube_processor import YouTubeProcessor
+
+        self._expand_youtube(job_id)
+        pending = self._pending_items(job_id)
+        positions = {url: position for position, url in pending}
+        if not positions:
+            return
+
+        self._set_message(job_id, f"Fetching {len(positions)} videos")
+        batch: List[Tuple[int, list]] = []
+        batch_docs = 0
+        for url, documents in YouTubeProcessor.process_youtube_urls(list(positions)):
+            position = positions.get(url)
+            if position is None:
+                continue
+            batch.append((position, documents))
+            batch_docs += len(documents)
+            if batch_docs >= INDEX_BATCH_DOCS:
+                self._index(job_id, batch, collection)
+                batch, batch_docs = [], 0
+            if self._should_stop(job_id):
+                break
+        self._index(job_id, batch, collection)
+
+    def close(self):
+        self.stop()
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,224 @@
+"""
+BM25 keyword index and hybrid (keyword + vector) retrieval
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import BaseNode, MetadataMode, NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.types import MetadataFilters
+from config import RRF_K
+
+
+# SQLite limits the number of bound parameters per statement
+_SQL_BATCH = 500
+
+# Words, numbers and identifiers such as snake_case names or E1234 style codes
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+class LexicalIndex:
+    """
+    Persistent BM25 inverted index over node text, backed by SQLite FTS5
+
+    Lives in lexical.db next to the vector store. Nodes are indexed with the
+    same text the embedding model sees, so file names and titles in the
+    metadata are searchable too. Adds and deletes touch only their own rows.
+    """
+
+    def __init__(self, persist_dir: str):
+        os.makedirs(persist_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(persist_dir, "lexical.db"),
+            check_same_thread=False,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5("
+            "node_id UNINDEXED, text, tokenize = 'porter unicode61 remove_diacritics 2')"
+        )
+        # FTS5 can't look rows up by an unindexed column, this maps node ids to rowids
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS node_rows (node_id TEXT PRIMARY KEY, fts_rowid INTEGER NOT NULL)"
+        )
+        self._conn.commit()
+
+    def count(self) -> int:
+        """Number of indexed nodes"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM node_rows").fetchone()[0]
+
+    def _delete_locked(self, node_ids: List[str]):
+        for start in range(0, len(node_ids), _SQL_BATCH):
+            batch = node_ids[start:start + _SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rowids = self._conn.execute(
+                f"SELECT fts_rowid FROM node_rows WHERE node_id IN ({placeholders})",
+                batch,
+            ).fetchall()
+            self._conn.executemany("DELETE FROM chunks WHERE rowid = ?", rowids)
+            self._conn.execute(f"DELETE FROM node_rows WHERE node_id IN ({placeholders})", batch)
+
+    def add(self, nodes: Iterable[BaseNode]):
+        """Index nodes, replacing any earlier version of the same node ids"""
+        rows = [
+            (node.node_id, node.get_content(metadata_mode=MetadataMode.EMBED))
+            for node in nodes
+        ]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._delete_locked([node_id for node_id, _ in rows])
+            for node_id, text in rows:
+                cursor = self._conn.execute(
+                    "INSERT INTO chunks (node_id, text) VALUES (?, ?)", (node_id, text)
+                )
+                self._conn.execute(
+                    "INSERT INTO node_rows (node_id, fts_rowid) VALUES (?, ?)",
+                    (node_id, cursor.lastrowid),
+                )
+
+    def delete(self, node_ids: List[str]):
+        """Remove nodes from the index"""
+        with self._lock, self._conn:
+            self._delete_locked(list(node_ids))
+
+    @staticmethod
+    def _match_expression(query: str) -> Optional[str]:
+        # Quoting every token keeps FTS5 query syntax (AND, NEAR, *, -) out of user input
+        tokens = list(dict.fromkeys(token.lower() for token in _TOKEN.findall(query)))
+        if not tokens:
+            return None
+        return " OR ".join(f'"{token}"' for token in tokens)
+
+    def search(self, query: str, top_k: int, node_ids: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Rank nodes against a free-text query with BM25
+
+        Args:
+            query: Question or keywords
+            top_k: Number of results
+            node_ids: Only rank these nodes, e.g. the result of a metadata filter
+
+        Returns:
+            List of (node_id, score) tuples, best first, higher is better
+        """
+        expression = self._match_expression(query)
+        if expression is None or node_ids == []:
+            return []
+        sql = "SELECT node_id, bm25(chunks) FROM chunks WHERE chunks MATCH ?"
+        params: List[Any] = [expression]
+        if node_ids is not None:
+            sql += " AND node_id IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps(node_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                sql + " ORDER BY bm25(chunks) LIMIT ?",
+                params + [top_k],
+            ).fetchall()
+        # FTS5 reports BM25 negated so that ascending order is best first
+        return [(node_id, -score) for node_id, score in rows]
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM node_rows")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """
+    Merge several rankings of node ids by reciprocal rank fusion
+
+    Each list contributes 1 / (k + rank) for every id it contains, so an id
+    ranked well by both retrievers beats one ranked first by only one.
+
+    Returns:
+        List of (node_id, fused score) tuples, best first
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, node_id in enumerate(ranking):
+            scores[node_id] = scores.get(node_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class LexicalRetriever(BaseRetriever):
+    """
+    Retrieves nodes by BM25 alone, never calling the embedding model
+
+    With metadata filters, the vector store's field index picks the nodes
+    that may be ranked.
+    """
+
+    def __init__(
+        self,
+        lexical_index: LexicalIndex,
+        vector_store: Any,
+        similarity_top_k: int,
+        filters: Optional[MetadataFilters] = None,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self._lexical_index = lexical_index
+        self._vector_store = vector_store
+        self._similarity_top_k = similarity_top_k
+        self._filters = filters
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        node_ids = self._vector_store.filter_node_ids(self._filters) if self._filters else None
+        hits = self._lexical_index.search(query_bundle.query_str, self._similarity_top_k, node_ids)
+        nodes = {node.node_id: node for node in self._vector_store.get_nodes([node_id for node_id, _ in hits])}
+        return [
+            NodeWithScore(node=nodes[node_id], score=score)
+            for node_id, score in hits
+            if node_id in nodes
+        ]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Fuses vector and BM25 results with reciprocal rank fusion
+
+    Each retriever is asked for `candidates` results and the fused list is
+    cut to similarity_top_k. Scores are the fused RRF scores.
+    """
+
+    def __init__(
+        self,
+        vector_retriever: BaseRetriever,
+        lexical_retriever: LexicalRetriever,
+        similarity_top_k: int,
+        rrf_k: int = RRF_K,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self._vector_retriever = vector_retriever
+        self._lexical_retriever = lexical_retriever
+        self._similarity_top_k = similarity_top_k
+        self._rrf_k = rrf_k
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        vector_results = self._vector_retriever.retrieve(query_bundle)
+        lexical_results = self._lexical_retriever.retrieve(query_bundle)
+
+        nodes = {result.node.node_id: result.node for result in vector_results + lexical_results}
+        fused = reciprocal_rank_fusion(
+            [
+                [result.node.node_id for result in vector_results],
+                [result.node.node_id for result in lexical_results],
+            ],
+            self._rrf_k,
+        )
+        return [
+            NodeWithScore(node=nodes[node_id], score=score)
+            for node_id, score in fused[:self._similarity_top_k]
+        ]
@@ -0,0 +1,406 @@
+"""
+Process-wide spans, histograms and counters, exported as Prometheus text or JSON
+"""
+import bisect
+import functools
+import json
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from config import METRICS_ENABLED, METRICS_RECENT_SPANS, METRICS_PORT, METRICS_HOST, PROFILER_INTERVAL
+
+
+# Upper bounds in seconds, from a cached query up to transcribing a long video
+LATENCY_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0,
+)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+class Histogram:
+    """Counts of observed values per bucket, plus their sum, count and maximum"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        # The last slot counts values above the largest bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating inside the bucket it falls in"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters, histograms and timed spans
+
+    A span times a block of code into the span_seconds histogram, labelled
+    with the span name and any extra labels. Spans nest per thread, and the
+    most recent ones are kept with their parent for a simple trace view.
+    """
+
+    def __init__(self, enabled: bool = METRICS_ENABLED, recent_spans: int = METRICS_RECENT_SPANS):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, LabelKey], float] = {}
+        self._histograms: Dict[Tuple[str, LabelKey], Histogram] = {}
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=recent_spans)
+        self._local = threading.local()
+        # Thread id -> innermost open span, read by the sampling profiler
+        self._active: Dict[int, str] = {}
+
+    def inc(self, name: str, amount: float = 1.0, **labels: Any):
+        """Add to a counter"""
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + amount
+
+    def observe(self, name: str, value: float, **labels: Any):
+        """Record a value in a histogram"""
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def record_span(self, name: str, seconds: float, error: bool = False, parent: Optional[str] = None, **labels: Any):
+        """Record a span timed elsewhere, e.g. in a worker process or across a generator"""
+        if not self.enabled:
+            return
+        self.observe("span_seconds", seconds, span=name, **labels)
+        if error:
+            self.inc("span_errors_total", span=name, **labels)
+        with self._lock:
+            self._recent.append({
+                "span": name,
+                "parent": parent,
+                "labels": {key: str(value) for key, value in labels.items()},
+                "start": time.time() - seconds,
+                "seconds": seconds,
+                "error": error,
+                "thread": threading.current_thread().name,
+            })
+
+    def _stack(self) -> List[str]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def span(self, name: str, **labels: Any):
+        """Time the enclosed block as a span"""
+        if not self.enabled:
+            yield
+            return
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        thread_id = threading.get_ident()
+        stack.append(name)
+        self._active[thread_id] = name
+        error = False
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            stack.pop()
+            if stack:
+                self._active[thread_id] = stack[-1]
+            else:
+                self._active.pop(thread_id, None)
+            self.record_span(name, seconds, error, parent, **labels)
+
+    def timed(self, name: str, **labels: Any) -> Callable:
+        """Decorator form of span()"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def active_span(self, thread_id: int) -> Optional[str]:
+        return self._active.get(thread_id)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Everything recorded so far as plain JSON-serialisable data"""
+        with self._lock:
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self._counters.items())
+                ],
+                "histograms": [
+                    {"name": name, "labels": dict(labels), **histogram.summary()}
+                    for (name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0])
+                ],
+                "recent_spans": list(self._recent),
+            }
+
+    def to_json(self, indent: Optional[int] = None) -> str:
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def to_prometheus(self, prefix: str = "rag_") -> str:
+        """Counters and histograms in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                ((key, histogram.buckets, list(histogram.counts), histogram.sum, histogram.count)
+                 for key, histogram in self._histograms.items()),
+                key=lambda item: item[0],
+            )
+
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {prefix}{name} counter")
+                typed.add(name)
+            lines.append(f"{prefix}{name}{_format_labels(labels)} {value:g}")
+
+        for (name, labels), buckets, counts, total, count in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {prefix}{name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{prefix}{name}_bucket{_format_labels(labels, (('le', f'{bound:g}'),))} {cumulative}")
+            lines.append(f"{prefix}{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {count}")
+            lines.append(f"{prefix}{name}_sum{_format_labels(labels)} {total:g}")
+            lines.append(f"{prefix}{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._recent.clear()
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of threads inside a span at a fixed interval
+
+    Samples are tallied as collapsed stacks, the format flamegraph.pl and
+    speedscope read, with the innermost span as the root frame. That shows
+    where time inside a slow span goes without instrumenting every call.
+    Threads outside any span are skipped unless all_threads is set.
+    """
+
+    def __init__(
+        self,
+        metrics: Metrics,
+        interval: float = 0.01,
+        max_depth: int = 64,
+        all_threads: bool = False,
+    ):
+        self.metrics = metrics
+        self.interval = interval
+        self.max_depth = max_depth
+        self.all_threads = all_threads
+        self._lock = threading.Lock()
+        self._samples: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                span = self.metrics.active_span(thread_id)
+                if span is None and not self.all_threads:
+                    continue
+                frames = []
+                while frame is not None and len(frames) < self.max_depth:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack = ";".join([span or "-"] + frames[::-1])
+                with self._lock:
+                    self._samples[stack] = self._samples.get(stack, 0) + 1
+
+    def top(self, n: int = 20) -> List[Tuple[str, int]]:
+        """The most frequently sampled stacks"""
+        with self._lock:
+            return sorted(self._samples.items(), key=lambda item: item[1], reverse=True)[:n]
+
+    def collapsed(self) -> str:
+        """All samples as collapsed stacks, one "frame;frame;frame count" line each"""
+        with self._lock:
+            return "".join(f"{stack} {count}\n" for stack, count in sorted(self._samples.items()))
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+
+_metrics = Metrics()
+_profiler: Optional[SamplingProfiler] = None
+_server: Optional[ThreadingHTTPServer] = None
+_start_lock = threading.Lock()
+
+
+def get_metrics() -> Metrics:
+    """Return the process-wide metrics registry"""
+    return _metrics
+
+
+def span(name: str, **labels: Any):
+    """Time a block as a span in the process-wide registry"""
+    return _metrics.span(name, **labels)
+
+
+def inc(name: str, amount: float = 1.0, **labels: Any):
+    _metrics.inc(name, amount, **labels)
+
+
+def record_span(name: str, seconds: float, **labels: Any):
+    _metrics.record_span(name, seconds, **labels)
+
+
+def timed(name: str, **labels: Any) -> Callable:
+    """Decorator that times every call as a span in the process-wide registry"""
+    return _metrics.timed(name, **labels)
+
+
+def start_profiler(interval: float = PROFILER_INTERVAL or 0.01) -> SamplingProfiler:
+    """Start the process-wide sampling profiler, or return it if it is running"""
+    global _profiler
+    with _start_lock:
+        if _profiler is None:
+            _profiler = SamplingProfiler(_metrics, interval)
+        _profiler.start()
+        return _profiler
+
+
+def get_profiler() -> Optional[SamplingProfiler]:
+    return _profiler
+
+
+class _ExportHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = _metrics.to_prometheus(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = _metrics.to_json(), "application/json"
+        elif self.path == "/profile" and _profiler is not None:
+            body, content_type = _profiler.collapsed(), "text/plain"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port: int = METRICS_PORT, host: str = METRICS_HOST) -> ThreadingHTTPServer:
+    """
+    Serve /metrics (Prometheus), /metrics.json and /profile on a background thread
+
+    Only local clients can connect by default, since /profile exposes stack
+    traces. Calling it again returns the server that is already running.
+    """
+    global _server
+    with _start_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _ExportHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _server
+
+
+def start_configured():
+    """Start the exporter and profiler if METRICS_PORT / PROFILER_INTERVAL enable them"""
+    if METRICS_PORT:
+        try:
+            serve(METRICS_PORT, METRICS_HOST)
+        except OSError as e:
+            print(f"Could not start metrics server on {METRICS_HOST}:{METRICS_PORT}: {e}")
+    if PROFILER_INTERVAL:
+        start_profiler(PROFILER_INTERVAL)
@@ -0,0 +1,34 @@
+"""
+PDF text extraction helpers, kept free of heavy imports so PDF worker processes start quickly
+"""
+from typing import List, Tuple
+
+
+def pdf_page_count(file_path: str) -> int:
+    """Number of pages in a PDF, read from its page tree without extracting text"""
+    import PyPDF2
+    
+    with open(file_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+def extract_pdf_pages(file_path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    """
+    Extract the text of pages [start, stop)
+    
+    Args:
+        file_path: Path to the PDF
+        start: Index of the first page, counting from 0
+        stop: Index one past the last page
+        
+    Returns:
+        List of (1-based page number, text) tuples
+    """
+    import PyPDF2
+    
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [
+            (page_num + 1, pdf_reader.pages[page_num].extract_text() or '')
+            for page_num in range(start, stop)
+        ]
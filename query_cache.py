@@ -0,0 +1,104 @@
+"""
+Semantic cache of query answers keyed by question embedding
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+import numpy as np
+from config import QUERY_CACHE_THRESHOLD, QUERY_CACHE_TTL, QUERY_CACHE_MAX_ENTRIES
+
+
+class QueryCache:
+    """
+    In-memory LRU cache returning a stored answer for near-identical questions
+
+    A lookup hits when a cached question embedding has cosine similarity of at
+    least `threshold` with the new one, the entry is younger than `ttl`
+    seconds, and it was answered against the same index version and scope
+    (e.g. retrieval mode, collections and filters).
+    """
+
+    def __init__(
+        self,
+        threshold: float = QUERY_CACHE_THRESHOLD,
+        ttl: float = QUERY_CACHE_TTL,
+        max_entries: int = QUERY_CACHE_MAX_ENTRIES,
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def get(self, embedding: List[float], index_version: Hashable, scope: Hashable = None) -> Optional[str]:
+        """
+        Find a cached answer for a question embedding
+
+        Args:
+            embedding: Embedding of the new question
+            index_version: Current index version, older entries never match
+            scope: What else the answer depends on; entries of other scopes
+                are skipped but kept for their own lookups
+
+        Returns:
+            Cached answer, or None on a miss
+        """
+        vector = self._normalize(embedding)
+        now = time.time()
+        with self._lock:
+            # Drop entries that can never match again
+            stale = [
+                entry_id for entry_id, entry in self._entries.items()
+                if entry['version'] != index_version or now - entry['created'] > self.ttl
+            ]
+            for entry_id in stale:
+                del self._entries[entry_id]
+
+            entry_ids = [entry_id for entry_id, entry in self._entries.items() if entry['scope'] == scope]
+            if entry_ids:
+                matrix = np.vstack([self._entries[entry_id]['vector'] for entry_id in entry_ids])
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry_id = entry_ids[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return self._entries[entry_id]['answer']
+
+            self.misses += 1
+            return None
+
+    def put(self, embedding: List[float], answer: str, index_version: Hashable, scope: Hashable = None):
+        """Store an answer, evicting the least recently used entry if full"""
+        with self._lock:
+            self._entries[self._next_id] = {
+                'vector': self._normalize(embedding),
+                'answer': answer,
+                'version': index_version,
+                'scope': scope,
+                'created': time.time(),
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the number of cached answers"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._entries),
+        }
@@ -1,106 +1,625 @@
 """
 RAG Engine using LlamaIndex and Groq
 """
-from typing import List, Optional
-import os
-
-from llama_index.core import (
-    VectorStoreIndex,
-    Document,
-    StorageContext,
-    Settings,
-    load_index_from_storage,
-)
-from llama_index.llms.groq import Groq
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Optional, Set, Tuple
+import hashlib
+import json
+import time
+
+from llama_index.core import Document, Settings
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.llms import LLM
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.schema import BaseNode, MetadataMode, NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.types import FilterCondition, FilterOperator, MetadataFilter, MetadataFilters
+import metrics
+from lexical_index import HybridRetriever
+from shards import Shard, ShardSet, ShardedRetriever, validate_collection_name
+from embedding_cache import CachedEmbedding
+from query_cache import QueryCache
+from resource_pool import PooledEmbedding
 from config import (
     GROQ_API_KEY,
     GROQ_MODEL,
     EMBEDDING_MODEL,
     VECTOR_STORE_DIR,
+    COLLECTION_NAME,
+    EMBED_BATCH_SIZE,
+    EMBED_CACHE_ENABLED,
+    INDEX_BATCH_DOCS,
+    QUERY_CACHE_ENABLED,
+    RETRIEVAL_MODE,
+    SIMILARITY_TOP_K,
+    HYBRID_CANDIDATES,
 )
 
 
+NO_DOCUMENTS_MESSAGE = "No documents have been indexed yet. Please upload some documents first."
+
+# Metadata filters for query(), e.g. {'file_type': ['audio', 'video']} or {'file_name': 'report.pdf'}
+Filters = Optional[Dict[str, Any]]
+
+
+def _metadata_filters(filters: Filters) -> Optional[MetadataFilters]:
+    """Turn a field -> value (or list of values) dict into LlamaIndex filters, all of which must match"""
+    if not filters:
+        return None
+    return MetadataFilters(filters=[
+        MetadataFilter(key=key, value=list(value), operator=FilterOperator.IN)
+        if isinstance(value, (list, tuple, set))
+        else MetadataFilter(key=key, value=value, operator=FilterOperator.EQ)
+        for key, value in filters.items()
+    ])
+
+
+def _filters_key(filters: Filters) -> Hashable:
+    if not filters:
+        return None
+    return tuple(sorted(
+        (key, tuple(sorted(map(str, value))) if isinstance(value, (list, tuple, set)) else str(value))
+        for key, value in filters.items()
+    ))
+
+
+def _document_source(metadata: Dict[str, Any]) -> Optional[str]:
+    """The key a document is deleted and replaced by: its video_id, else its file_path"""
+    return metadata.get('video_id') or metadata.get('file_path')
+
+
+def _source_filters(source: str) -> MetadataFilters:
+    return MetadataFilters(
+        filters=[
+            MetadataFilter(key="video_id", value=source, operator=FilterOperator.EQ),
+            MetadataFilter(key="file_path", value=source, operator=FilterOperator.EQ),
+        ],
+        condition=FilterCondition.OR,
+    )
+
+
+@dataclass
+class _Upsert:
+    """Chunk ids of the sources being replaced, before and after"""
+    existing: Dict[str, Set[str]] = field(default_factory=dict)
+    kept: Dict[str, Set[str]] = field(default_factory=dict)
+    occurrences: Counter = field(default_factory=Counter)
+    documents: int = 0
+    added: int = 0
+
+    def assign_ids(self, nodes: List[BaseNode]):
+        """
+        Give nodes ids derived from their source, text and metadata
+
+        An unchanged chunk gets the same id on every upload, so it can be
+        recognised without embedding it. Identical chunks within one source
+        are told apart by how often they occurred before.
+        """
+        new_ids = {}
+        for node in nodes:
+            source = _document_source(node.metadata)
+            content = json.dumps(
+                [node.get_content(metadata_mode=MetadataMode.NONE), node.metadata],
+                sort_keys=True,
+                default=str,
+            )
+            occurrence = self.occurrences[(source, content)]
+            self.occurrences[(source, content)] += 1
+            digest = hashlib.blake2b(
+                json.dumps([source, occurrence, content]).encode("utf-8"), digest_size=16
+            ).hexdigest()
+            new_ids[node.node_id] = digest
+            self.kept[source].add(digest)
+
+        for node in nodes:
+            node.id_ = new_ids[node.node_id]
+            # Keep prev/next links pointing at the renamed neighbours
+            for related in node.relationships.values():
+                for info in related if isinstance(related, list) else [related]:
+                    info.node_id = new_ids.get(info.node_id, info.node_id)
+
+    def stale_ids(self) -> List[str]:
+        """Stored chunks the new content no longer has"""
+        return [
+            node_id
+            for source, node_ids in self.existing.items()
+            for node_id in node_ids - self.kept[source]
+        ]
+
+
+def _load_embedding_model() -> BaseEmbedding:
+    # Pulls in sentence-transformers/torch, so only on first embedding call
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    return HuggingFaceEmbedding(
+        model_name=EMBEDDING_MODEL,
+        embed_batch_size=EMBED_BATCH_SIZE,
+    )
+
+
 class RAGEngine:
-    """RAG Engine for multimodal document query"""
+    """
+    RAG Engine for multimodal document query
 
-    def __init__(self):
-        self.llm = Groq(
-            model=GROQ_MODEL,
-            api_key=GROQ_API_KEY,
-            temperature=0.7,
+    Documents are indexed into named collections (COLLECTION_NAME unless
+    another is given). Each collection is a shard with its own vector store
+    and BM25 index, opened on first use and closed when idle; queries search
+    the selected collections in parallel and merge their results.
+    """
+
+    def __init__(self, llm: Optional[LLM] = None, embed_model: Optional[BaseEmbedding] = None):
+        # llm/embed_model can be swapped for local stand-ins such as MockLLM.
+        # Provider packages are imported only when they are actually needed.
+        if llm is None:
+            from llama_index.llms.groq import Groq
+            llm = Groq(
+                model=GROQ_MODEL,
+                api_key=GROQ_API_KEY,
+                temperature=0.7,
+            )
+        self.llm = llm
+        # The model itself lives in the process-wide pool, shared across
+        # sessions and evicted when idle
+        self.embed_model = embed_model or PooledEmbedding(
+            ('embed_model', EMBEDDING_MODEL),
+            _load_embedding_model,
+            model_name=EMBEDDING_MODEL,
+            embed_batch_size=EMBED_BATCH_SIZE,
         )
-        self.embed_model = HuggingFaceEmbedding(model_name=EMBEDDING_MODEL)
+        if EMBED_CACHE_ENABLED:
+            # Identical chunks (re-uploads, boilerplate, rebuilds) skip the model
+            self.embed_model = CachedEmbedding(self.embed_model)
 
         Settings.llm = self.llm
         Settings.embed_model = self.embed_model
         Settings.chunk_size = 512
         Settings.chunk_overlap = 50
 
-        self.index: Optional[VectorStoreIndex] = None
-        self.query_engine = None
+        self.shards = ShardSet(self.embed_model, VECTOR_STORE_DIR)
+        self.retrieval_mode = RETRIEVAL_MODE
+        self._query_engines = {}
 
-        self._load_index()
+        # Bumped on every index change so cached answers go stale
+        self.index_version = 0
+        self.query_cache = QueryCache() if QUERY_CACHE_ENABLED else None
 
-    def _load_index(self):
-        try:
-            if os.path.exists(os.path.join(VECTOR_STORE_DIR, "docstore.json")):
-                storage_context = StorageContext.from_defaults(
-                    persist_dir=VECTOR_STORE_DIR
-                )
-                self.index = load_index_from_storage(storage_context)
-                self.query_engine = self.index.as_query_engine(
-                    similarity_top_k=5,
-                    response_mode="compact",
-                )
-        except Exception as e:
-            print(f"Could not load existing index: {e}")
-            self.index = None
+    def list_collections(self) -> List[str]:
+        """Names of the collections on disk"""
+        return self.shards.names()
+
+    def load_collections(self, collections: Optional[List[str]] = None) -> List[str]:
+        """Open collections ahead of their first query, all of them by default"""
+        names = self._collections(collections)
+        self.shards.fan_out(names, lambda shard: None)
+        return names
+
+    def _collections(self, collections: Optional[List[str]]) -> Tuple[str, ...]:
+        """The selected collections (all by default) that hold any chunks"""
+        if collections is None:
+            names = self.shards.names()
+        else:
+            names = [validate_collection_name(name) for name in collections]
+        return tuple(sorted(name for name in set(names) if self.shards.count(name) > 0))
+
+    def _make_retriever(self, mode: str, collections: Tuple[str, ...], filters: Filters = None) -> BaseRetriever:
+        metadata_filters = _metadata_filters(filters)
+        if mode in ("vector", "keyword"):
+            return ShardedRetriever(self.shards, collections, mode, SIMILARITY_TOP_K, metadata_filters)
+        if mode == "hybrid":
+            # Vector and BM25 results are each merged across collections, then fused
+            candidates = SIMILARITY_TOP_K * HYBRID_CANDIDATES
+            return HybridRetriever(
+                ShardedRetriever(self.shards, collections, "vector", candidates, metadata_filters),
+                ShardedRetriever(self.shards, collections, "keyword", candidates, metadata_filters),
+                SIMILARITY_TOP_K,
+            )
+        raise ValueError(f"Unknown retrieval mode: {mode}")
+
+    def _get_query_engine(
+        self,
+        mode: str,
+        streaming: bool,
+        collections: Tuple[str, ...],
+        filters: Filters = None,
+    ) -> RetrieverQueryEngine:
+        key = (mode, streaming, collections, _filters_key(filters))
+        engine = self._query_engines.get(key)
+        if engine is None:
+            engine = RetrieverQueryEngine.from_args(
+                self._make_retriever(mode, collections, filters),
+                llm=self.llm,
+                response_mode="compact",
+                streaming=streaming,
+            )
+            # Scoped engines are one-offs, only the unfiltered ones are kept
+            if not filters:
+                self._query_engines[key] = engine
+        return engine
+
+    def _embed_nodes(self, nodes: List[BaseNode], batch_size: int):
+        """Embed nodes in large batches instead of one document at a time"""
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+        for start in range(0, len(nodes), batch_size):
+            embeddings = self.embed_model.get_text_embedding_batch(
+                texts[start:start + batch_size],
+                # Runs in background jobs and benchmarks; progress is in the index.embed span
+                show_progress=False,
+            )
+            for node, embedding in zip(nodes[start:start + batch_size], embeddings):
+                node.embedding = embedding
+
+    def _chunk(self, documents: List[Document]) -> List[BaseNode]:
+        """Chunk every document in one pass, dropping chunks with no text"""
+        with metrics.span("index.chunk"):
+            nodes = Settings.node_parser.get_nodes_from_documents(documents)
+            return [
+                node for node in nodes
+                if node.get_content(metadata_mode=MetadataMode.EMBED).strip()
+            ]
+
+    def _insert_nodes(
+        self,
+        shard: Shard,
+        nodes: List[BaseNode],
+        batch_size: int,
+        stale_node_ids: Iterable[str] = (),
+    ):
+        """Embed and insert nodes, then remove stale_node_ids in the same write"""
+        stale_node_ids = list(stale_node_ids)
+        if not nodes and not stale_node_ids:
+            return
 
-    def add_documents(self, documents: List[Document]):
+        # Only the write needs exclusive access, embedding runs alongside queries
+        with metrics.span("index.embed"):
+            self._embed_nodes(nodes, batch_size)
+        shard.write(nodes, stale_node_ids)
+        self.index_version += 1
+        metrics.inc("indexed_chunks_total", len(nodes))
+        metrics.inc("deleted_chunks_total", len(stale_node_ids))
+
+    @metrics.timed("index.add")
+    def add_documents(
+        self,
+        documents: List[Document],
+        batch_size: int = EMBED_BATCH_SIZE,
+        collection: Optional[str] = None,
+    ):
         if not documents:
             return
 
-        if self.index is None:
-            self.index = VectorStoreIndex.from_documents(
-                documents,
-                show_progress=True,
+        # Chunk every document in one pass, then embed all chunks together
+        with self.shards.use(collection or COLLECTION_NAME) as shard:
+            self._insert_nodes(shard, self._chunk(documents), batch_size)
+        metrics.inc("indexed_documents_total", len(documents))
+
+    def _upsert_batch(self, shard: Shard, documents: List[Document], upsert: _Upsert, batch_size: int):
+        """Index the chunks of documents that are not stored yet"""
+        for document in documents:
+            source = _document_source(document.metadata)
+            if source is None:
+                raise ValueError("Documents need a file_path or video_id to be upserted")
+            if source not in upsert.existing:
+                upsert.existing[source] = set(shard.filter_node_ids(_source_filters(source)))
+                upsert.kept[source] = set()
+
+        nodes = self._chunk(documents)
+        upsert.assign_ids(nodes)
+        new_nodes = [
+            node for node in nodes
+            if node.node_id not in upsert.existing[_document_source(node.metadata)]
+        ]
+        self._insert_nodes(shard, new_nodes, batch_size)
+        upsert.documents += len(documents)
+        upsert.added += len(new_nodes)
+        metrics.inc("indexed_documents_total", len(documents))
+
+    def _finish_upsert(self, shard: Shard, upsert: _Upsert) -> Dict[str, int]:
+        stale_node_ids = upsert.stale_ids()
+        self._insert_nodes(shard, [], EMBED_BATCH_SIZE, stale_node_ids)
+        kept = sum(len(node_ids) for node_ids in upsert.kept.values())
+        return {
+            'documents': upsert.documents,
+            'added': upsert.added,
+            'unchanged': kept - upsert.added,
+            'removed': len(stale_node_ids),
+        }
+
+    @metrics.timed("index.upsert")
+    def upsert_documents(
+        self,
+        documents: List[Document],
+        batch_size: int = EMBED_BATCH_SIZE,
+        collection: Optional[str] = None,
+    ) -> Dict[str, int]:
+        """
+        Replace what is indexed for every file or video these documents come from
+
+        Like add_documents(), but re-indexing a source replaces its earlier
+        chunks instead of duplicating them. Chunk ids are derived from their
+        content, so unchanged chunks keep their stored vectors and only new or
+        edited chunks are embedded.
+
+        Returns:
+            Number of 'documents' indexed and of 'added', 'unchanged' and 'removed' chunks
+        """
+        upsert = _Upsert()
+        with self.shards.use(collection or COLLECTION_NAME) as shard:
+            if documents:
+                self._upsert_batch(shard, documents, upsert, batch_size)
+            return self._finish_upsert(shard, upsert)
+
+    @metrics.timed("index.upsert")
+    def upsert_document(
+        self,
+        source: str,
+        documents: Iterable[Document],
+        batch_docs: int = INDEX_BATCH_DOCS,
+        batch_size: int = EMBED_BATCH_SIZE,
+        collection: Optional[str] = None,
+    ) -> Dict[str, int]:
+        """
+        Replace what is indexed for one file or video
+
+        Documents may come from a generator such as DocumentProcessor.iter_file()
+        and are indexed batch_docs at a time, see add_documents_stream(). Chunks
+        the new content no longer has are removed after the last batch.
+
+        Args:
+            source: File path or YouTube video_id, as in the documents' metadata
+            documents: The new content
+            collection: Collection holding the document, defaults to COLLECTION_NAME
+
+        Returns:
+            Number of 'documents' indexed and of 'added', 'unchanged' and 'removed' chunks
+        """
+        with self.shards.use(collection or COLLECTION_NAME) as shard:
+            upsert = _Upsert(
+                existing={source: set(shard.filter_node_ids(_source_filters(source)))},
+                kept={source: set()},
             )
-        else:
-            for doc in documents:
-                self.index.insert(doc)
+            batch = []
+            for document in documents:
+                if _document_source(document.metadata) != source:
+                    raise ValueError(f"Document does not belong to {source}")
+                batch.append(document)
+                if len(batch) >= batch_docs:
+                    self._upsert_batch(shard, batch, upsert, batch_size)
+                    batch = []
+            if batch:
+                self._upsert_batch(shard, batch, upsert, batch_size)
+            return self._finish_upsert(shard, upsert)
 
-        self.index.storage_context.persist(persist_dir=VECTOR_STORE_DIR)
+    def delete_document(self, source: str, collection: Optional[str] = None) -> int:
+        """
+        Remove every chunk of one file or video from the index
 
-        self.query_engine = self.index.as_query_engine(
-            similarity_top_k=5,
-            response_mode="compact",
-        )
+        Args:
+            source: File path or YouTube video_id, as in the documents' metadata
+            collection: Collection holding the document, defaults to COLLECTION_NAME
+
+        Returns:
+            Number of chunks removed
+        """
+        collection = collection or COLLECTION_NAME
+        if not self.shards.exists(collection):
+            return 0
+        with self.shards.use(collection) as shard:
+            node_ids = shard.filter_node_ids(_source_filters(source))
+            self._insert_nodes(shard, [], EMBED_BATCH_SIZE, node_ids)
+        return len(node_ids)
+
+    def add_documents_stream(
+        self,
+        documents: Iterable[Document],
+        batch_docs: int = INDEX_BATCH_DOCS,
+        batch_size: int = EMBED_BATCH_SIZE,
+        collection: Optional[str] = None,
+    ) -> int:
+        """
+        Index documents from an iterator in bounded batches
+
+        Only batch_docs documents and their chunks are held at a time, so a
+        generator such as DocumentProcessor.iter_file() can index arbitrarily
+        long files with flat memory. Each batch becomes searchable as soon as
+        it is inserted.
+
+        Returns:
+            Number of documents indexed
+        """
+        total = 0
+        batch = []
+        for document in documents:
+            batch.append(document)
+            if len(batch) >= batch_docs:
+                self.add_documents(batch, batch_size, collection)
+                total += len(batch)
+                batch = []
+        if batch:
+            self.add_documents(batch, batch_size, collection)
+            total += len(batch)
+        return total
+
+    def _query_bundle(
+        self,
+        question: str,
+        mode: str,
+        collections: Tuple[str, ...],
+        filters: Filters = None,
+    ) -> Tuple[QueryBundle, Optional[List[float]], Tuple[int, Hashable]]:
+        """
+        Build the query bundle, embedding the question once unless the mode is keyword-only
 
-    def query(self, question: str) -> str:
-        if self.query_engine is None:
-            return "No documents have been indexed yet. Please upload some documents first."
+        Also returns the (index version, scope) the answer is cached under.
+        """
+        if mode == "keyword":
+            # BM25 needs no embedding, so the embedding model is never touched
+            return QueryBundle(question), None, None
+        with metrics.span("query.embed"):
+            embedding = self.embed_model.get_query_embedding(question)
+        cache_key = (self.index_version, (mode, collections, _filters_key(filters)))
+        return QueryBundle(question, embedding=embedding), embedding, cache_key
+
+    def retrieve(
+        self,
+        question: str,
+        mode: Optional[str] = None,
+        filters: Filters = None,
+        collections: Optional[List[str]] = None,
+    ) -> List[NodeWithScore]:
+        """Return the chunks a query would be answered from, without calling the LLM"""
+        collections = self._collections(collections)
+        if not collections:
+            return []
+        mode = mode or self.retrieval_mode
+        query_bundle, _, _ = self._query_bundle(question, mode, collections, filters)
+        with metrics.span("query.retrieve", mode=mode):
+            return self._make_retriever(mode, collections, filters).retrieve(query_bundle)
+
+    def _cached_answer(self, embedding: Optional[List[float]], cache_key: Tuple[int, Hashable]) -> Optional[str]:
+        if self.query_cache is None or embedding is None:
+            return None
+        cached = self.query_cache.get(embedding, *cache_key)
+        metrics.inc("query_cache_total", result="miss" if cached is None else "hit")
+        return cached
+
+    def _cache_answer(self, embedding: Optional[List[float]], answer: str, cache_key: Tuple[int, Hashable]):
+        if self.query_cache is not None and embedding is not None:
+            self.query_cache.put(embedding, answer, *cache_key)
+
+    def query(
+        self,
+        question: str,
+        mode: Optional[str] = None,
+        filters: Filters = None,
+        collections: Optional[List[str]] = None,
+    ) -> str:
+        """
+        Answer a question from the indexed documents
+
+        Args:
+            question: The question
+            mode: "hybrid", "vector" or "keyword", defaults to RETRIEVAL_MODE
+            filters: Only search chunks whose metadata matches, e.g.
+                {'file_name': 'report.pdf'} or {'file_type': ['audio', 'video']}
+            collections: Collections to search, all of them by default
+
+        Returns:
+            The answer text
+        """
+        mode = mode or self.retrieval_mode
         try:
-            response = self.query_engine.query(question)
-            return str(response)
+            collections = self._collections(collections)
+            if not collections:
+                return NO_DOCUMENTS_MESSAGE
+            with metrics.span("query", mode=mode):
+                # Embed once, for both the cache lookup and retrieval
+                query_bundle, embedding, cache_key = self._query_bundle(question, mode, collections, filters)
+                cached = self._cached_answer(embedding, cache_key)
+                if cached is not None:
+                    return cached
+
+                # Each collection is locked only while it is searched
+                with metrics.span("query.retrieve", mode=mode):
+                    engine = self._get_query_engine(mode, False, collections, filters)
+                    nodes = engine.retrieve(query_bundle)
+                with metrics.span("query.llm"):
+                    answer = str(engine.synthesize(query_bundle, nodes))
+
+            self._cache_answer(embedding, answer, cache_key)
+            return answer
         except Exception as e:
             return f"Error processing query: {str(e)}"
 
-    def get_document_count(self) -> int:
+    def stream_query(
+        self,
+        question: str,
+        mode: Optional[str] = None,
+        filters: Filters = None,
+        collections: Optional[List[str]] = None,
+    ) -> Iterator[str]:
+        """Yield the answer token by token as the LLM produces it, see query() for the arguments"""
+        mode = mode or self.retrieval_mode
         try:
-            if self.index is None:
-                return 0
-            return len(self.index.docstore.docs)
+            collections = self._collections(collections)
+            if not collections:
+                yield NO_DOCUMENTS_MESSAGE
+                return
+
+            # Spans can't be held open across yields, so generation is timed by hand
+            started = time.perf_counter()
+            query_bundle, embedding, cache_key = self._query_bundle(question, mode, collections, filters)
+            cached = self._cached_answer(embedding, cache_key)
+            if cached is not None:
+                metrics.record_span("query", time.perf_counter() - started, mode=mode)
+                yield cached
+                return
+
+            # Only retrieval locks the collections, token generation runs without them
+            with metrics.span("query.retrieve", mode=mode):
+                engine = self._get_query_engine(mode, True, collections, filters)
+                nodes = engine.retrieve(query_bundle)
+            generation_started = time.perf_counter()
+            response = engine.synthesize(query_bundle, nodes)
+            tokens = []
+            for token in response.response_gen:
+                if not tokens:
+                    metrics.record_span("query.llm_first_token", time.perf_counter() - generation_started)
+                tokens.append(token)
+                yield token
+            metrics.record_span("query.llm", time.perf_counter() - generation_started)
+            metrics.record_span("query", time.perf_counter() - started, mode=mode)
+
+            self._cache_answer(embedding, "".join(tokens), cache_key)
+        except Exception as e:
+            yield f"Error processing query: {str(e)}"
+
+    def quantization_report(
+        self,
+        questions: Optional[List[str]] = None,
+        k: int = SIMILARITY_TOP_K,
+        collection: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Compare exact, int8 and binary vector search over one collection
+
+        Set VECTOR_INDEX to the mode with the best trade-off for a deployment.
+
+        Args:
+            questions: Sample questions; by default stored chunks are used as queries
+            k: Number of results per query
+            collection: Collection to measure, defaults to COLLECTION_NAME
+
+        Returns:
+            One dict per mode with bytes_per_vector, memory_bytes, recall
+            (quantized ranking alone), rescored_recall (after exact
+            rescoring, what queries see) and query_ms
+        """
+        query_vectors = None
+        if questions:
+            query_vectors = [self.embed_model.get_query_embedding(question) for question in questions]
+        with self.shards.use(collection or COLLECTION_NAME) as shard, shard.lock.read_lock():
+            return shard.vector_store.quantization_report(query_vectors, k)
+
+    def get_document_count(self, collections: Optional[List[str]] = None) -> int:
+        """Number of chunks in the given collections, all of them by default"""
+        try:
+            names = self.shards.names() if collections is None else collections
+            return sum(self.shards.count(name) for name in names)
         except Exception:
             return 0
 
-    def clear_index(self):
-        import shutil
+    def clear_index(self, collections: Optional[List[str]] = None):
+        """Delete the given collections, all of them by default"""
         try:
-            if os.path.exists(VECTOR_STORE_DIR):
-                shutil.rmtree(VECTOR_STORE_DIR)
-                os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
-            self.index = None
-            self.query_engine = None
+            names = self.shards.names() if collections is None else collections
+            for name in names:
+                self.shards.drop(name)
+            self._query_engines = {}
+            self.index_version += 1
         except Exception as e:
             print(f"Error clearing index: {e}")
+
+    def close(self):
+        """Close every open collection"""
+        self.shards.close()
@@ -0,0 +1,177 @@
+"""
+Process-wide registry of heavyweight objects shared across Streamlit sessions
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, List, Optional
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from config import MODEL_IDLE_TIMEOUT, POOL_REAP_INTERVAL
+
+
+class ReadWriteLock:
+    """Many concurrent readers or a single writer; waiting writers block new readers"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read_lock(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write_lock(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class ResourcePool:
+    """
+    Lazily creates shared objects and drops them after a period without use
+
+    Callers should look objects up with get() each time they need them rather
+    than holding on to them, otherwise eviction cannot free the memory.
+    """
+
+    def __init__(self, idle_timeout: float = MODEL_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._lock = threading.RLock()
+        self._entries: Dict[Hashable, Dict[str, Any]] = {}
+        self._reaper: Optional[threading.Thread] = None
+
+    def get(self, key: Hashable, factory: Callable[[], Any], evictable: bool = True) -> Any:
+        """
+        Return the shared object for a key, creating it on first use
+
+        Args:
+            key: Identifier of the resource
+            factory: Builds the resource when it is not loaded
+            evictable: Whether the resource may be dropped when idle
+
+        Returns:
+            The shared object
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                # Built under the lock so concurrent sessions never load a model twice
+                entry = {'value': factory(), 'evictable': evictable}
+                self._entries[key] = entry
+            entry['last_used'] = time.time()
+            self._ensure_reaper()
+            return entry['value']
+
+    def evict_idle(self) -> List[Hashable]:
+        """Drop evictable resources that have not been used within idle_timeout"""
+        now = time.time()
+        with self._lock:
+            idle = [
+                key for key, entry in self._entries.items()
+                if entry['evictable'] and now - entry['last_used'] > self.idle_timeout
+            ]
+            for key in idle:
+                del self._entries[key]
+        return idle
+
+    def _ensure_reaper(self):
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap_forever, daemon=True)
+            self._reaper.start()
+
+    def _reap_forever(self):
+        while True:
+            time.sleep(POOL_REAP_INTERVAL)
+            self.evict_idle()
+
+    def loaded(self) -> List[Hashable]:
+        """Keys of the resources currently in memory"""
+        with self._lock:
+            return list(self._entries)
+
+
+_pool = ResourcePool()
+
+
+def get_pool() -> ResourcePool:
+    """Return the process-wide resource pool"""
+    return _pool
+
+
+class PooledEmbedding(BaseEmbedding):
+    """Embedding model resolved from the resource pool on every call, so it can be evicted when idle"""
+
+    _key: Hashable = PrivateAttr()
+    _factory: Callable[[], BaseEmbedding] = PrivateAttr()
+
+    def __init__(self, key: Hashable, factory: Callable[[], BaseEmbedding], **kwargs: Any):
+        super().__init__(**kwargs)
+        self._key = key
+        self._factory = factory
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "PooledEmbedding"
+
+    def _model(self) -> BaseEmbedding:
+        return get_pool().get(self._key, self._factory)
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._model().get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return await self._model().aget_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._model().get_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return self._model().get_text_embedding_batch(texts)
+
+
+def get_shared_engine():
+    """Return the RAGEngine shared by every session in this process"""
+    from rag_engine import RAGEngine
+
+    return _pool.get('rag_engine', RAGEngine, evictable=False)
+
+
+def get_shared_pipeline():
+    """Return the IngestPipeline shared by every session in this process"""
+    from ingest_pipeline import IngestPipeline
+
+    return _pool.get('ingest_pipeline', IngestPipeline, evictable=False)
+
+
+def get_shared_job_queue():
+    """Return the background ingest JobQueue shared by every session in this process"""
+    from job_queue import JobQueue
+
+    return _pool.get(
+        'job_queue',
+        lambda: JobQueue(get_shared_engine(), get_shared_pipeline()),
+        evictable=False,
+    )
@@ -0,0 +1,426 @@
+"""
+Named collections (shards) of the index, loaded lazily and searched in parallel
+"""
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set
+
+from llama_index.core import VectorStoreIndex, StorageContext, load_index_from_storage
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import BaseNode, NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.types import MetadataFilters
+import metrics
+from vector_store import LocalVectorStore
+from lexical_index import LexicalIndex, LexicalRetriever, reciprocal_rank_fusion
+from resource_pool import ReadWriteLock
+from config import (
+    VECTOR_STORE_DIR,
+    COLLECTION_NAME,
+    INSERT_BATCH_SIZE,
+    MAX_LOADED_SHARDS,
+    SHARD_IDLE_TIMEOUT,
+    SHARD_QUERY_WORKERS,
+    POOL_REAP_INTERVAL,
+)
+
+
+# Collection names become directory names
+_VALID_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+
+def validate_collection_name(name: str) -> str:
+    """Return the name if it can be used as a collection, otherwise raise ValueError"""
+    if not _VALID_NAME.match(name or ""):
+        raise ValueError(
+            f"Invalid collection name: {name!r}. Use letters, digits, '.', '_' or '-'"
+        )
+    return name
+
+
+class Shard:
+    """
+    One collection: its vector store, BM25 index and lock
+
+    Queries share the lock, inserts, deletes and closing take it exclusively.
+    """
+
+    def __init__(self, name: str, persist_dir: str, embed_model: Any):
+        self.name = name
+        self.persist_dir = persist_dir
+        self.embed_model = embed_model
+        self.vector_store = LocalVectorStore(persist_dir)
+        self.lexical_index = LexicalIndex(persist_dir)
+        self.index: Optional[VectorStoreIndex] = None
+        self.lock = ReadWriteLock()
+        # Maintained by ShardSet: sessions using the shard, and when it was last released
+        self.users = 0
+        self.last_used = time.time()
+        self._load()
+
+    @metrics.timed("index.load")
+    def _load(self):
+        try:
+            if os.path.exists(os.path.join(self.persist_dir, "docstore.json")):
+                self._migrate_legacy_index()
+            if self.lexical_index.count() != self.vector_store.count():
+                self._rebuild_lexical_index()
+            if self.vector_store.count() > 0:
+                self.index = self._create_index()
+        except Exception as e:
+            print(f"Could not load collection {self.name}: {e}")
+            self.index = None
+
+    def _migrate_legacy_index(self):
+        """Move nodes from an index persisted as JSON files into the vector store"""
+        storage_context = StorageContext.from_defaults(persist_dir=self.persist_dir)
+        legacy_index = load_index_from_storage(storage_context, embed_model=self.embed_model)
+
+        nodes = list(legacy_index.docstore.docs.values())
+        for node in nodes:
+            node.embedding = legacy_index.vector_store.get(node.node_id)
+        self.vector_store.add(nodes)
+
+        # Keep the old files around, but out of the way of the next startup
+        for file_name in os.listdir(self.persist_dir):
+            if file_name.endswith(".json"):
+                path = os.path.join(self.persist_dir, file_name)
+                os.replace(path, path + ".legacy")
+
+    def _rebuild_lexical_index(self):
+        """Index every stored node for keyword search, e.g. for a store created before BM25"""
+        self.lexical_index.clear()
+        for nodes in self.vector_store.iter_nodes():
+            self.lexical_index.add(nodes)
+
+    def _create_index(self) -> VectorStoreIndex:
+        return VectorStoreIndex.from_vector_store(
+            self.vector_store,
+            embed_model=self.embed_model,
+            insert_batch_size=INSERT_BATCH_SIZE,
+        )
+
+    def count(self) -> int:
+        """Number of chunks in the collection"""
+        return self.vector_store.count()
+
+    def retriever(
+        self,
+        mode: str,
+        top_k: int,
+        filters: Optional[MetadataFilters] = None,
+    ) -> Optional[BaseRetriever]:
+        """Vector or keyword retriever over this collection, None while it is empty"""
+        if mode == "vector":
+            if self.index is None:
+                return None
+            return self.index.as_retriever(similarity_top_k=top_k, filters=filters)
+        if mode == "keyword":
+            return LexicalRetriever(self.lexical_index, self.vector_store, top_k, filters)
+        raise ValueError(f"Unknown retrieval mode: {mode}")
+
+    def filter_node_ids(self, filters: MetadataFilters) -> List[str]:
+        with self.lock.read_lock():
+            return self.vector_store.filter_node_ids(filters)
+
+    def write(self, nodes: List[BaseNode], stale_node_ids: Sequence[str] = ()):
+        """Insert embedded nodes and delete stale ones in one exclusive section"""
+        with self.lock.write_lock(), metrics.span("index.persist"):
+            if nodes:
+                if self.index is None:
+                    self.index = self._create_index()
+
+                # The vector store commits only the new nodes, no full persist needed
+                self.index.insert_nodes(nodes)
+                self.lexical_index.add(nodes)
+            if stale_node_ids:
+                self.vector_store.delete_nodes(list(stale_node_ids))
+                self.lexical_index.delete(list(stale_node_ids))
+            if self.vector_store.count() == 0:
+                self.index = None
+
+    def close(self):
+        with self.lock.write_lock():
+            self.vector_store.close()
+            self.lexical_index.close()
+            self.index = None
+
+
+class ShardSet:
+    """
+    Opens collections on first use and closes them again when idle
+
+    Each collection lives in its own directory under root. At most
+    max_loaded collections stay open; the least recently used ones are
+    closed first, and any collection unused for idle_timeout seconds is
+    closed by a background thread. Collections in use are never closed.
+    """
+
+    def __init__(
+        self,
+        embed_model: Any,
+        root: str = VECTOR_STORE_DIR,
+        max_loaded: int = MAX_LOADED_SHARDS,
+        idle_timeout: float = SHARD_IDLE_TIMEOUT,
+        workers: int = SHARD_QUERY_WORKERS,
+    ):
+        self.embed_model = embed_model
+        self.root = root
+        self.max_loaded = max(1, max_loaded)
+        self.idle_timeout = idle_timeout
+        self.workers = max(1, workers)
+        self._lock = threading.Lock()
+        # Signalled when a shard's last user releases it or a drop finishes
+        self._released = threading.Condition(self._lock)
+        self._shards: "OrderedDict[str, Shard]" = OrderedDict()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._dropping: Set[str] = set()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._reaper: Optional[threading.Thread] = None
+
+        os.makedirs(root, exist_ok=True)
+        self._migrate_flat_layout()
+        self._migrate_legacy_collections()
+
+    def _migrate_flat_layout(self):
+        """Move an index from before collections existed into the default collection"""
+        if not any(
+            os.path.exists(os.path.join(self.root, file_name))
+            for file_name in ("store.db", "docstore.json")
+        ):
+            return
+        target = self.path(COLLECTION_NAME)
+        os.makedirs(target, exist_ok=True)
+        for file_name in os.listdir(self.root):
+            path = os.path.join(self.root, file_name)
+            if os.path.isfile(path):
+                os.replace(path, os.path.join(target, file_name))
+
+    def _migrate_legacy_collections(self):
+        """
+        Convert collections still persisted as JSON files right away
+
+        names() and count() only see collections with a store.db, which the
+        conversion in Shard._load creates, so these have to be loaded once.
+        """
+        for file_name in os.listdir(self.root):
+            if _VALID_NAME.match(file_name) and os.path.exists(os.path.join(self.root, file_name, "docstore.json")):
+                with self.use(file_name):
+                    pass
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, validate_collection_name(name))
+
+    def names(self) -> List[str]:
+        """Collections on disk, loaded or not"""
+        return sorted(
+            file_name for file_name in os.listdir(self.root)
+            if _VALID_NAME.match(file_name) and os.path.exists(os.path.join(self.root, file_name, "store.db"))
+        )
+
+    def exists(self, name: str) -> bool:
+        return os.path.exists(os.path.join(self.path(name), "store.db"))
+
+    def loaded(self) -> List[str]:
+        """Collections currently open, least recently used first"""
+        with self._lock:
+            return list(self._shards)
+
+    def count(self, name: str) -> int:
+        """Number of chunks in a collection, without loading it"""
+        with self._lock:
+            # Shards are closed only after leaving _shards, so this one stays open
+            shard = self._shards.get(name)
+            if shard is not None:
+                return shard.count()
+        if not self.exists(name):
+            return 0
+        conn = sqlite3.connect(os.path.join(self.path(name), "store.db"))
+        try:
+            return conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+        except sqlite3.OperationalError:
+            return 0
+        finally:
+            conn.close()
+
+    def _pin_locked(self, name: str) -> Optional[Shard]:
+        """Mark a loaded shard as in use, so eviction leaves it alone; call with _lock held"""
+        while name in self._dropping:
+            self._released.wait()
+        shard = self._shards.get(name)
+        if shard is not None:
+            shard.users += 1
+            self._shards.move_to_end(name)
+        return shard
+
+    def _acquire(self, name: str) -> Shard:
+        with self._lock:
+            shard = self._pin_locked(name)
+            if shard is not None:
+                return shard
+            load_lock = self._loading.setdefault(name, threading.Lock())
+        # Collections load in parallel, but each one only once
+        with load_lock:
+            with self._lock:
+                shard = self._pin_locked(name)
+                if shard is not None:
+                    return shard
+            shard = Shard(name, self.path(name), self.embed_model)
+            with self._lock:
+                # Pinned in the same step it becomes visible to eviction
+                shard.users = 1
+                self._shards[name] = shard
+                self._loading.pop(name, None)
+            metrics.inc("shard_loads_total")
+        return shard
+
+    def _release(self, shard: Shard):
+        with self._lock:
+            shard.users -= 1
+            shard.last_used = time.time()
+            if shard.users == 0:
+                self._released.notify_all()
+        self._ensure_reaper()
+        self._evict(over_capacity=True)
+
+    @contextmanager
+    def use(self, name: str) -> Iterator[Shard]:
+        """Open a collection (creating it if needed) for the duration of the block"""
+        shard = self._acquire(name)
+        try:
+            yield shard
+        finally:
+            self._release(shard)
+
+    def _evict(self, over_capacity: bool = False, idle: bool = False) -> List[str]:
+        now = time.time()
+        with self._lock:
+            unused = [name for name, shard in self._shards.items() if shard.users == 0]
+            evicted = []
+            if idle:
+                evicted = [name for name in unused if now - self._shards[name].last_used > self.idle_timeout]
+            if over_capacity:
+                # Least recently used first, thanks to the ordering of _shards
+                excess = len(self._shards) - len(evicted) - self.max_loaded
+                evicted += [name for name in unused if name not in evicted][:max(0, excess)]
+            shards = [self._shards.pop(name) for name in evicted]
+        for shard in shards:
+            shard.close()
+            metrics.inc("shard_evictions_total")
+        return evicted
+
+    def evict_idle(self) -> List[str]:
+        """Close collections that have not been used within idle_timeout"""
+        return self._evict(idle=True)
+
+    def _ensure_reaper(self):
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap_forever, daemon=True)
+            self._reaper.start()
+
+    def _reap_forever(self):
+        while True:
+            time.sleep(POOL_REAP_INTERVAL)
+            self.evict_idle()
+
+    def fan_out(self, names: Iterable[str], func: Callable[[Shard], Any]) -> List[Any]:
+        """Call func on every named collection, in parallel when there are several"""
+        names = list(names)
+
+        def run(name: str) -> Any:
+            with self.use(name) as shard:
+                return func(shard)
+
+        if len(names) <= 1:
+            return [run(name) for name in names]
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="shard")
+            executor = self._executor
+        return list(executor.map(run, names))
+
+    def drop(self, name: str):
+        """Wait until a collection is no longer in use, then close it and delete it from disk"""
+        path = self.path(name)
+        with self._lock:
+            while name in self._dropping:
+                self._released.wait()
+            # New users wait in _acquire until the drop is done
+            self._dropping.add(name)
+            while name in self._shards and self._shards[name].users > 0:
+                self._released.wait()
+            shard = self._shards.pop(name, None)
+        try:
+            if shard is not None:
+                shard.close()
+            if os.path.exists(path):
+                shutil.rmtree(path)
+        finally:
+            with self._lock:
+                self._dropping.discard(name)
+                self._released.notify_all()
+
+    def close(self):
+        with self._lock:
+            shards = list(self._shards.values())
+            self._shards.clear()
+        for shard in shards:
+            shard.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+class ShardedRetriever(BaseRetriever):
+    """
+    Runs a vector or keyword search on several collections and merges the results
+
+    Each collection returns its own top_k, searched in parallel. Vector
+    results are merged by cosine similarity, which means the same in every
+    collection. BM25 scores depend on each collection's term statistics, so
+    keyword results are merged by rank with reciprocal rank fusion instead.
+    Collections are looked up on every query, so an evicted collection is
+    simply loaded again.
+    """
+
+    def __init__(
+        self,
+        shards: ShardSet,
+        collections: Sequence[str],
+        mode: str,
+        similarity_top_k: int,
+        filters: Optional[MetadataFilters] = None,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self._shards = shards
+        self._collections = list(collections)
+        self._mode = mode
+        self._similarity_top_k = similarity_top_k
+        self._filters = filters
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        def search(shard: Shard) -> List[NodeWithScore]:
+            with shard.lock.read_lock(), metrics.span("query.shard", mode=self._mode):
+                retriever = shard.retriever(self._mode, self._similarity_top_k, self._filters)
+                return retriever.retrieve(query_bundle) if retriever is not None else []
+
+        shard_results = self._shards.fan_out(self._collections, search)
+        if self._mode == "keyword" and len(shard_results) > 1:
+            nodes = {result.node.node_id: result.node for results in shard_results for result in results}
+            fused = reciprocal_rank_fusion(
+                [[result.node.node_id for result in results] for results in shard_results]
+            )
+            return [
+                NodeWithScore(node=nodes[node_id], score=score)
+                for node_id, score in fused[:self._similarity_top_k]
+            ]
+
+        results = [result for results in shard_results for result in results]
+        results.sort(key=lambda result: result.score or 0.0, reverse=True)
+        return results[:self._similarity_top_k]
@@ -1,7 +1,53 @@
 """
 Test script to verify all dependencies are installed correctly
 """
+import subprocess
 import sys
+import time
+
+# Modules the app must be able to import without pulling in any modality backend
+APP_MODULES = ["document_processor", "youtube_processor", "rag_engine", "ingest_pipeline", "resource_pool"]
+HEAVY_MODULES = [
+    "easyocr", "torch", "sentence_transformers", "moviepy", "pydub",
+    "speech_recognition", "PyPDF2", "docx", "yt_dlp", "youtube_transcript_api",
+]
+IMPORT_BUDGET_SECONDS = 5.0
+
+def check_import_budget():
+    """Import the app modules in a fresh interpreter and check time and loaded backends"""
+    print("\n⏱️  Testing Cold-Start Imports...\n")
+    
+    script = (
+        "import sys\n"
+        f"for name in {APP_MODULES!r}: __import__(name)\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+    )
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    
+    if result.returncode != 0:
+        print("❌ App modules                 IMPORT FAILED")
+        print(f"   {result.stderr.strip().splitlines()[-1] if result.stderr.strip() else ''}")
+        return False
+    
+    ok = True
+    loaded = [m for m in result.stdout.strip().split(",") if m]
+    if loaded:
+        print(f"❌ Lazy loading                {', '.join(loaded)} imported eagerly")
+        ok = False
+    else:
+        print("✅ Lazy loading                OK")
+    
+    if elapsed > IMPORT_BUDGET_SECONDS:
+        print(f"❌ Import time                 {elapsed:.2f}s (budget {IMPORT_BUDGET_SECONDS:.0f}s)")
+        ok = False
+    else:
+        print(f"✅ Import time                 {elapsed:.2f}s")
+    return ok
+
+def test_import_budget():
+    assert check_import_budget()
 
 def test_imports():
     print("🔍 Testing Dependencies...\n")
@@ -66,7 +112,6 @@ def test_imports():
         print("   Install from: https://github.com/UB-Mannheim/tesseract/wiki")
     
     # Test FFmpeg
-    import subprocess
     try:
         result = subprocess.run(['ffmpeg', '-version'], 
                               capture_output=True, 
@@ -102,9 +147,13 @@ def test_imports():
         print("⚠️  .env file                   NOT FOUND")
         print("   Run: python setup.py")
     
+    # Check cold-start import cost
+    print("\n" + "=" * 60)
+    budget_ok = check_import_budget()
+    
     print("\n" + "=" * 60)
     
-    if failed or not os.path.exists('.env'):
+    if failed or not budget_ok or not os.path.exists('.env'):
         print("\n❌ Setup incomplete. Please fix the issues above.")
         return False
     else:
@@ -0,0 +1,39 @@
+"""
+Shared fixtures: the app modules live in the repository root, and every test
+runs in its own working directory so stores and caches never leak between tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Scratch working directory for the app's relative store and cache paths"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def make_engine(workdir):
+    """Create RAGEngines with a fake LLM and the benchmark's hashing embedding"""
+    from llama_index.core.llms import MockLLM
+    from benchmark import HashEmbedding
+    from rag_engine import RAGEngine
+
+    engines = []
+
+    def make(**kwargs):
+        engine = RAGEngine(
+            llm=kwargs.pop("llm", None) or MockLLM(max_tokens=32),
+            embed_model=HashEmbedding(model_name="hash-384"),
+        )
+        engines.append(engine)
+        return engine
+
+    yield make
+    for engine in engines:
+        engine.close()
@@ -0,0 +1,54 @@
+"""
+Semantic answer cache: index versions invalidate, scopes only separate
+"""
+from llama_index.core import Document
+
+from query_cache import QueryCache
+
+QUESTION = [1.0, 0.0, 0.0]
+SIMILAR = [0.99, 0.05, 0.0]
+
+
+def test_similar_question_hits():
+    cache = QueryCache(threshold=0.95)
+    cache.put(QUESTION, "answer", 0)
+
+    assert cache.get(SIMILAR, 0) == "answer"
+
+
+def test_lookups_in_other_scopes_keep_entries():
+    cache = QueryCache(threshold=0.95)
+    hybrid = ("hybrid", ("default",), None)
+    vector = ("vector", ("default",), None)
+    cache.put(QUESTION, "hybrid answer", 0, hybrid)
+
+    assert cache.get(QUESTION, 0, vector) is None
+    assert cache.get(QUESTION, 0, ("hybrid", ("default",), (("file_type", "audio"),))) is None
+    cache.put(QUESTION, "vector answer", 0, vector)
+
+    assert cache.get(QUESTION, 0, hybrid) == "hybrid answer"
+    assert cache.get(QUESTION, 0, vector) == "vector answer"
+    assert cache.stats()['entries'] == 2
+
+
+def test_new_index_version_purges_entries():
+    cache = QueryCache(threshold=0.95)
+    cache.put(QUESTION, "old answer", 0, "hybrid")
+    cache.put(QUESTION, "old answer", 0, "vector")
+
+    assert cache.get(QUESTION, 1, "hybrid") is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_engine_cache_survives_queries_in_other_modes(make_engine):
+    engine = make_engine()
+    engine.add_documents([Document(text="Penguins live in the southern hemisphere.",
+                                   metadata={"file_name": "birds.txt", "file_path": "birds.txt"})])
+    engine.query_cache = QueryCache()
+
+    engine.query("Where do penguins live?", mode="hybrid")
+    engine.query("Where do penguins live?", mode="hybrid")
+    engine.query("Where do penguins live?", mode="vector")
+    engine.query("Where do penguins live?", mode="hybrid")
+
+    assert engine.query_cache.stats() == {'hits': 2, 'misses': 2, 'entries': 2}
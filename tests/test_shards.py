@@ -0,0 +1,124 @@
+"""
+ShardSet: collections open lazily, are evicted by LRU and idle time, never while in use
+"""
+import os
+import threading
+import time
+
+import pytest
+from llama_index.core.schema import TextNode
+
+from benchmark import HashEmbedding
+from shards import ShardSet, validate_collection_name
+
+
+@pytest.fixture
+def make_shards(tmp_path):
+    created = []
+
+    def make(**kwargs):
+        shards = ShardSet(HashEmbedding(model_name="hash-384"), str(tmp_path / "collections"), **kwargs)
+        created.append(shards)
+        return shards
+
+    yield make
+    for shards in created:
+        shards.close()
+
+
+def add_chunk(shards, name, text):
+    embedding = HashEmbedding(model_name="hash-384").get_text_embedding(text)
+    with shards.use(name) as shard:
+        shard.write([TextNode(text=text, embedding=embedding)])
+
+
+def test_least_recently_used_collections_are_closed(make_shards):
+    shards = make_shards(max_loaded=2)
+    for name in ("a", "b", "c"):
+        add_chunk(shards, name, f"text of {name}")
+
+    assert shards.loaded() == ["b", "c"]
+
+    with shards.use("b"):
+        pass
+    with shards.use("a") as shard:
+        # Evicted collections come back with their data
+        assert shard.count() == 1
+    assert shards.loaded() == ["b", "a"]
+    assert shards.names() == ["a", "b", "c"]
+    assert shards.count("c") == 1
+
+
+def test_collections_in_use_are_not_evicted(make_shards):
+    shards = make_shards(max_loaded=1)
+
+    with shards.use("a"):
+        with shards.use("b"):
+            pass
+        with shards.use("c"):
+            assert shards.loaded() == ["a", "c"]
+        # Over capacity, so the unused collections go and the one in use stays
+        assert shards.loaded() == ["a"]
+
+
+def test_idle_collections_are_closed(make_shards):
+    shards = make_shards(idle_timeout=0.05)
+    with shards.use("a"):
+        pass
+    with shards.use("b"):
+        time.sleep(0.1)
+        assert shards.evict_idle() == ["a"]
+
+    assert shards.loaded() == ["b"]
+
+
+def test_drop_waits_for_users(make_shards):
+    shards = make_shards()
+    add_chunk(shards, "a", "text of a")
+    in_use = threading.Event()
+    released = []
+
+    def user():
+        with shards.use("a"):
+            in_use.set()
+            time.sleep(0.1)
+            released.append(time.perf_counter())
+
+    thread = threading.Thread(target=user)
+    thread.start()
+    in_use.wait()
+    shards.drop("a")
+    dropped = time.perf_counter()
+    thread.join()
+
+    assert released and released[0] <= dropped
+    assert shards.names() == []
+    assert not os.path.exists(shards.path("a"))
+
+
+def test_concurrent_use_under_eviction_pressure(make_shards):
+    shards = make_shards(max_loaded=1)
+    errors = []
+
+    def worker(index):
+        try:
+            for round_ in range(20):
+                name = "abc"[(index + round_) % 3]
+                with shards.use(name) as shard:
+                    shard.count()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+
+
+@pytest.mark.parametrize("name", ["", "../escape", "a/b", ".hidden", "x" * 65])
+def test_invalid_collection_names_are_rejected(name):
+    with pytest.raises(ValueError):
+        validate_collection_name(name)
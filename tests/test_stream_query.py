@@ -0,0 +1,60 @@
+"""
+Streaming answers with a local fake LLM
+"""
+from typing import Any, List
+
+from llama_index.core import Document
+from llama_index.core.llms import MockLLM
+
+from query_cache import QueryCache
+
+QUESTION = "Where do penguins live?"
+
+# What happened, in order: the LLM producing a token or the caller receiving one
+EVENTS: List[str] = []
+
+
+class RecordingLLM(MockLLM):
+    """MockLLM that logs every token it produces"""
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        for response in super().stream_complete(prompt, formatted, **kwargs):
+            EVENTS.append("produced")
+            yield response
+
+
+def make_indexed_engine(make_engine):
+    engine = make_engine(llm=RecordingLLM(max_tokens=8))
+    engine.add_documents([Document(text="Penguins live in the southern hemisphere.",
+                                   metadata={"file_name": "birds.txt", "file_path": "birds.txt"})])
+    engine.query_cache = QueryCache()
+    EVENTS.clear()
+    return engine
+
+
+def test_tokens_are_yielded_as_they_are_generated(make_engine):
+    engine = make_indexed_engine(make_engine)
+
+    tokens = []
+    for token in engine.stream_query(QUESTION, mode="vector"):
+        EVENTS.append("consumed")
+        tokens.append(token)
+
+    assert len(tokens) == 8
+    assert EVENTS == ["produced", "consumed"] * 8
+
+
+def test_streamed_answer_matches_and_is_cached(make_engine):
+    engine = make_indexed_engine(make_engine)
+
+    streamed = "".join(engine.stream_query(QUESTION, mode="vector"))
+
+    # Served from the cache without calling the LLM again
+    EVENTS.clear()
+    assert engine.query(QUESTION, mode="vector") == streamed
+    assert EVENTS == []
+    assert engine.query_cache.stats()['hits'] == 1
+
+    # And the same as the answer generated without streaming
+    engine.query_cache = None
+    assert engine.query(QUESTION, mode="vector") == streamed
@@ -0,0 +1,48 @@
+"""
+An index persisted by the app before collections existed must survive the upgrade
+"""
+import os
+
+from llama_index.core import Document, StorageContext, VectorStoreIndex
+
+from benchmark import HashEmbedding
+from config import COLLECTION_NAME, VECTOR_STORE_DIR
+from rag_engine import NO_DOCUMENTS_MESSAGE
+
+
+def build_baseline_index(persist_dir: str):
+    """Persist an index the way the original app did: JSON files straight in VECTOR_STORE_DIR"""
+    documents = [
+        Document(text="The quarterly report covers revenue growth in Europe.",
+                 metadata={"file_name": "report.txt", "file_path": "uploaded_files/report.txt", "file_type": "text"}),
+        Document(text="Penguins live in the southern hemisphere and cannot fly.",
+                 metadata={"file_name": "birds.txt", "file_path": "uploaded_files/birds.txt", "file_type": "text"}),
+    ]
+    index = VectorStoreIndex.from_documents(documents, embed_model=HashEmbedding(model_name="hash-384"))
+    index.storage_context.persist(persist_dir=persist_dir)
+    return len(index.docstore.docs)
+
+
+def test_baseline_index_is_queryable_after_upgrade(make_engine):
+    chunks = build_baseline_index(VECTOR_STORE_DIR)
+    assert os.path.exists(os.path.join(VECTOR_STORE_DIR, "docstore.json"))
+
+    engine = make_engine()
+
+    assert engine.list_collections() == [COLLECTION_NAME]
+    assert engine.get_document_count() == chunks
+    for mode in ("vector", "keyword"):
+        answer = engine.query("Where do penguins live?", mode=mode)
+        assert answer != NO_DOCUMENTS_MESSAGE
+    assert engine.delete_document("uploaded_files/birds.txt") == 1
+
+
+def test_upgrade_runs_once(make_engine):
+    chunks = build_baseline_index(VECTOR_STORE_DIR)
+    make_engine().close()
+
+    # The JSON files are set aside, so a restart neither migrates again nor duplicates nodes
+    engine = make_engine()
+
+    assert engine.get_document_count() == chunks
+    assert not os.path.exists(os.path.join(VECTOR_STORE_DIR, COLLECTION_NAME, "docstore.json"))
@@ -0,0 +1,55 @@
+"""
+Re-indexing a file replaces its chunks and only embeds what changed
+"""
+import pytest
+from llama_index.core import Document
+
+
+def pages(texts, file_path="uploaded_files/report.pdf"):
+    return [
+        Document(text=text, metadata={"file_name": "report.pdf", "file_path": file_path, "page_number": number})
+        for number, text in enumerate(texts, 1)
+    ]
+
+
+TEXTS = ["Revenue grew in Europe.", "Costs fell in Asia.", "Penguins cannot fly."]
+
+
+def test_first_upload_adds_every_chunk(make_engine):
+    engine = make_engine()
+
+    stats = engine.upsert_documents(pages(TEXTS))
+
+    assert stats == {'documents': 3, 'added': 3, 'unchanged': 0, 'removed': 0}
+    assert engine.get_document_count() == 3
+
+
+def test_unchanged_upload_adds_nothing(make_engine):
+    engine = make_engine()
+    engine.upsert_documents(pages(TEXTS))
+
+    stats = engine.upsert_document("uploaded_files/report.pdf", iter(pages(TEXTS)), batch_docs=2)
+
+    assert stats == {'documents': 3, 'added': 0, 'unchanged': 3, 'removed': 0}
+    assert engine.get_document_count() == 3
+
+
+def test_edited_upload_replaces_changed_chunks(make_engine):
+    engine = make_engine()
+    engine.upsert_documents(pages(TEXTS))
+    engine.upsert_documents(pages(["Other file."], file_path="uploaded_files/other.txt"))
+
+    stats = engine.upsert_documents(pages(["Revenue grew in Europe.", "Costs rose in Asia."]))
+
+    assert stats == {'documents': 2, 'added': 1, 'unchanged': 1, 'removed': 2}
+    # The other file is untouched
+    assert engine.get_document_count() == 3
+    assert engine.delete_document("uploaded_files/other.txt") == 1
+    assert engine.get_document_count() == 2
+
+
+def test_documents_of_another_source_are_rejected(make_engine):
+    engine = make_engine()
+
+    with pytest.raises(ValueError):
+        engine.upsert_document("uploaded_files/report.pdf", pages(TEXTS, file_path="uploaded_files/other.pdf"))
@@ -0,0 +1,140 @@
+"""
+LocalVectorStore: deletes, replaced ids and compaction across matrix generations
+"""
+import os
+import sqlite3
+
+import numpy as np
+import pytest
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from vector_store import LocalVectorStore
+
+DIM = 16
+
+
+@pytest.fixture
+def embeddings():
+    return np.random.default_rng(0).normal(size=(40, DIM)).astype(np.float32)
+
+
+def nodes(embeddings, ids):
+    return [TextNode(id_=f"n{i}", text=f"text {i}", embedding=embeddings[i].tolist()) for i in ids]
+
+
+def nearest(store, embedding):
+    return store.query(VectorStoreQuery(query_embedding=embedding.tolist(), similarity_top_k=1)).ids
+
+
+def matrix_files(path):
+    return sorted(name for name in os.listdir(path) if name.startswith("vectors"))
+
+
+def test_deleted_nodes_are_not_returned(tmp_path, embeddings):
+    store = LocalVectorStore(str(tmp_path), index_kind="exact")
+    store.add(nodes(embeddings, range(10)))
+
+    store.delete_nodes(node_ids=["n3"])
+
+    assert store.count() == 9
+    assert nearest(store, embeddings[3]) != ["n3"]
+    assert nearest(store, embeddings[4]) == ["n4"]
+    store.close()
+
+
+def test_re_adding_an_id_replaces_its_vector(tmp_path, embeddings):
+    store = LocalVectorStore(str(tmp_path), index_kind="exact")
+    store.add(nodes(embeddings, range(10)))
+
+    store.add([TextNode(id_="n0", text="moved", embedding=embeddings[20].tolist())])
+
+    assert store.count() == 10
+    assert nearest(store, embeddings[20]) == ["n0"]
+    assert store.get_nodes(["n0"])[0].get_content() == "moved"
+    store.close()
+
+
+def test_compaction_switches_generations_and_survives_reopening(tmp_path, embeddings):
+    store = LocalVectorStore(str(tmp_path), index_kind="exact")
+    store.add(nodes(embeddings, range(40)))
+
+    store.delete_nodes(node_ids=[f"n{i}" for i in range(20)])
+    store.compact()
+    assert matrix_files(tmp_path) == ["vectors.1.bin"]
+
+    store.delete_nodes(node_ids=[f"n{i}" for i in range(20, 30)])
+    store.compact()
+    assert matrix_files(tmp_path) == ["vectors.2.bin"]
+    assert os.path.getsize(tmp_path / "vectors.2.bin") == 10 * DIM * 4
+    store.close()
+
+    store = LocalVectorStore(str(tmp_path), index_kind="exact")
+    assert store.count() == 10
+    for i in range(30, 40):
+        assert nearest(store, embeddings[i]) == [f"n{i}"]
+
+    # Rows added after compaction go to the current generation
+    store.add(nodes(embeddings, [0]))
+    assert nearest(store, embeddings[0]) == ["n0"]
+    store.close()
+
+
+def test_files_left_by_an_interrupted_compaction_are_removed(tmp_path, embeddings):
+    store = LocalVectorStore(str(tmp_path), index_kind="exact")
+    store.add(nodes(embeddings, range(40)))
+    store.delete_nodes(node_ids=[f"n{i}" for i in range(20)])
+    store.compact()
+    store.close()
+
+    # An old generation not yet unlinked, and a new one whose commit never happened
+    (tmp_path / "vectors.bin").write_bytes(b"\0" * 64)
+    (tmp_path / "vectors.2.bin").write_bytes(b"\0" * 64)
+
+    store = LocalVectorStore(str(tmp_path), index_kind="exact")
+    assert matrix_files(tmp_path) == ["vectors.1.bin"]
+    assert nearest(store, embeddings[25]) == ["n25"]
+    store.close()
+
+
+class FailingMetaWrites:
+    """Connection proxy whose transaction fails when it records the new generation"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self._conn.__exit__(*exc_info)
+
+    def execute(self, sql, *args):
+        if "vectors_generation" in sql:
+            raise sqlite3.OperationalError("disk I/O error")
+        return self._conn.execute(sql, *args)
+
+
+def test_failed_compaction_commit_keeps_the_old_generation(tmp_path, embeddings):
+    store = LocalVectorStore(str(tmp_path), index_kind="exact")
+    store.add(nodes(embeddings, range(40)))
+    store.delete_nodes(node_ids=[f"n{i}" for i in range(20)])
+
+    conn = store._conn
+    store._conn = FailingMetaWrites(conn)
+    with pytest.raises(sqlite3.OperationalError):
+        store._rewrite_matrix()
+    store._conn = conn
+
+    # The renumbering was rolled back with it, so the old file still matches
+    assert matrix_files(tmp_path) == ["vectors.bin"]
+    assert nearest(store, embeddings[25]) == ["n25"]
+    store.close()
+
+    store = LocalVectorStore(str(tmp_path), index_kind="exact")
+    assert store.count() == 20
+    assert nearest(store, embeddings[25]) == ["n25"]
+    store.close()
@@ -0,0 +1,196 @@
+"""
+Tests for YouTube ingestion, run offline against a fake YouTubeProcessor
+"""
+import threading
+import time
+
+import pytest
+import requests
+
+import youtube_processor
+from config import YOUTUBE_MAX_RETRIES, YOUTUBE_RETRY_BACKOFF
+from youtube_processor import YouTubeCache, YouTubeProcessor
+
+PLAYLIST_URL = "https://www.youtube.com/playlist?list=PL1"
+
+
+def video_url(video_id: str) -> str:
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+
+@pytest.fixture
+def fake(tmp_path):
+    """A YouTubeProcessor serving fake videos, with its own cache and call log"""
+
+    class FakeYouTube(YouTubeProcessor):
+        cache = YouTubeCache(str(tmp_path / "youtube_cache"))
+        playlists = {PLAYLIST_URL: [video_url("a"), video_url("b"), video_url("c")]}
+        transcripts = {}
+        # Exceptions raised by the next fetch_video_info / fetch_transcript calls, in order
+        info_errors = []
+        transcript_errors = []
+        calls = []
+        lock = threading.Lock()
+        active = 0
+        peak = 0
+        delay = 0.0
+
+        @classmethod
+        def fetch_video_info(cls, url):
+            with cls.lock:
+                cls.calls.append(("info", url))
+                if cls.info_errors:
+                    raise cls.info_errors.pop(0)
+                cls.active += 1
+                cls.peak = max(cls.peak, cls.active)
+            try:
+                threading.Event().wait(cls.delay)
+            finally:
+                with cls.lock:
+                    cls.active -= 1
+            return {
+                'title': f"Video {cls.extract_video_id(url)}",
+                'author': "Author",
+                'duration': 120,
+                'description': "",
+            }
+
+        @classmethod
+        def fetch_transcript(cls, video_id, languages=['en']):
+            with cls.lock:
+                cls.calls.append(("transcript", video_id))
+                if cls.transcript_errors:
+                    raise cls.transcript_errors.pop(0)
+            return cls.transcripts.get(video_id)
+
+        @classmethod
+        def fetch_playlist(cls, url):
+            with cls.lock:
+                cls.calls.append(("playlist", url))
+            return cls.playlists[url]
+
+    return FakeYouTube
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record backoff delays instead of sleeping, without jitter"""
+    delays = []
+    monkeypatch.setattr(youtube_processor.time, "sleep", delays.append)
+    monkeypatch.setattr(youtube_processor.random, "uniform", lambda a, b: 1.0)
+    return delays
+
+
+def test_expand_urls_expands_playlists_and_drops_duplicates(fake):
+    urls = fake.expand_urls([video_url("b"), PLAYLIST_URL, "", video_url("d")])
+
+    assert urls == [video_url("b"), video_url("a"), video_url("c"), video_url("d")]
+
+
+def test_unreadable_playlist_is_reported_as_an_error(fake):
+    results = dict(fake.process_youtube_urls(["https://www.youtube.com/playlist?list=missing"]))
+
+    documents = results["https://www.youtube.com/playlist?list=missing"]
+    assert len(documents) == 1
+    assert 'error' in documents[0].metadata
+
+
+def test_process_youtube_urls_bounds_concurrency(fake):
+    fake.delay = 0.05
+    urls = [video_url(str(i)) for i in range(12)]
+
+    results = dict(fake.process_youtube_urls(urls, max_workers=3))
+
+    assert sorted(results) == sorted(urls)
+    assert 1 < fake.peak <= 3
+
+
+def test_stopping_early_drops_queued_videos(fake):
+    fake.delay = 0.05
+    urls = [video_url(str(i)) for i in range(20)]
+
+    results = fake.process_youtube_urls(urls, max_workers=2)
+    next(results)
+    results.close()
+    time.sleep(0.2)
+
+    fetched = [url for kind, url in fake.calls if kind == "info"]
+    assert len(fetched) <= 4
+
+
+def test_transcript_is_chunked_into_documents(fake):
+    fake.transcripts["a"] = [
+        {'text': "hello", 'start': 0.0, 'duration': 2.0},
+        {'text': "world", 'start': 70.0, 'duration': 3.0},
+    ]
+
+    documents = fake.process_youtube_url(video_url("a"))
+
+    assert documents[0].metadata['has_transcript'] is True
+    assert [d.metadata['start_seconds'] for d in documents[1:]] == [0.0, 70.0]
+    assert documents[2].metadata['timestamp_url'].endswith("&t=70s")
+
+
+def test_cached_videos_make_no_requests(fake):
+    fake.transcripts["a"] = [{'text': "hello", 'start': 0.0, 'duration': 2.0}]
+    first = fake.process_youtube_url(video_url("a"))
+    fake.calls.clear()
+
+    second = fake.process_youtube_url(video_url("a"))
+
+    assert fake.calls == []
+    assert [d.text for d in second] == [d.text for d in first]
+
+
+def test_missing_transcript_is_cached(fake):
+    fake.process_youtube_url(video_url("a"))
+    fake.calls.clear()
+
+    documents = fake.process_youtube_url(video_url("a"))
+
+    assert fake.calls == []
+    assert documents[0].metadata['has_transcript'] is False
+
+
+def test_failed_transcript_fetch_is_an_error_not_a_missing_transcript(fake, sleeps):
+    fake.transcripts["a"] = [{'text': "hello", 'start': 0.0, 'duration': 2.0}]
+    fake.transcript_errors = [requests.ConnectionError("down")] * (YOUTUBE_MAX_RETRIES + 1)
+
+    documents = dict(fake.process_youtube_urls([video_url("a")]))[video_url("a")]
+
+    assert len(documents) == 1
+    assert 'error' in documents[0].metadata
+
+    # Nothing was cached, so the next attempt fetches the transcript
+    documents = fake.process_youtube_url(video_url("a"))
+    assert documents[0].metadata['has_transcript'] is True
+
+
+def test_transient_errors_are_retried_with_backoff(fake, sleeps):
+    fake.info_errors = [requests.ConnectionError("reset"), requests.Timeout("slow")]
+
+    info = fake.get_video_info(video_url("a"))
+
+    assert info['title'] == "Video a"
+    assert len(fake.calls) == 3
+    assert sleeps == [YOUTUBE_RETRY_BACKOFF, YOUTUBE_RETRY_BACKOFF * 2]
+
+
+def test_permanent_errors_are_not_retried(fake, sleeps):
+    fake.info_errors = [KeyError("title")]
+
+    info = fake.get_video_info(video_url("a"))
+
+    assert 'error' in info
+    assert len(fake.calls) == 1
+    assert sleeps == []
+
+
+def test_failures_are_not_cached(fake, sleeps):
+    fake.info_errors = [requests.ConnectionError("down")] * (YOUTUBE_MAX_RETRIES + 1)
+
+    assert 'error' in fake.get_video_info(video_url("a"))
+    assert len(fake.calls) == YOUTUBE_MAX_RETRIES + 1
+    assert len(sleeps) == YOUTUBE_MAX_RETRIES
+
+    assert fake.get_video_info(video_url("a"))['title'] == "Video a"
@@ -0,0 +1,315 @@
+"""
+Silence-based audio segmentation and concurrent speech recognition
+"""
+import shutil
+import subprocess
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, Tuple
+import numpy as np
+import metrics
+from config import (
+    SPEECH_BACKEND,
+    AUDIO_WORKERS,
+    AUDIO_RECOGNITION_RETRIES,
+    AUDIO_RETRY_BACKOFF,
+    AUDIO_SAMPLE_RATE,
+    AUDIO_SEGMENT_MIN_SECONDS,
+    AUDIO_SEGMENT_MAX_SECONDS,
+    AUDIO_MIN_SILENCE_MS,
+    AUDIO_SILENCE_THRESH_DBFS,
+)
+
+
+# Length of the frames loudness is measured over
+FRAME_MS = 10
+
+# Audio is always handled as mono 16-bit little-endian PCM
+SAMPLE_WIDTH = 2
+
+
+def ffmpeg_executable() -> str:
+    """ffmpeg on PATH, or the binary bundled with imageio-ffmpeg (installed with moviepy)"""
+    path = shutil.which("ffmpeg")
+    if path:
+        return path
+    import imageio_ffmpeg
+
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+
+def iter_pcm(file_path: str, sample_rate: int = AUDIO_SAMPLE_RATE, chunk_seconds: float = 1.0) -> Iterator[bytes]:
+    """
+    Decode the audio track of any audio or video file to mono 16-bit PCM
+
+    ffmpeg writes the PCM to a pipe, so the file is decoded in a single pass
+    and nothing is written to disk. Stopping the iteration early stops ffmpeg.
+
+    Args:
+        file_path: Audio or video file
+        sample_rate: Output samples per second
+        chunk_seconds: Length of the chunks read from the pipe
+
+    Returns:
+        Iterator of PCM chunks
+    """
+    # stderr goes to a file, not a pipe, so a damaged file that makes ffmpeg log
+    # an error per frame can't fill a pipe nobody reads and stall the decode
+    stderr = tempfile.TemporaryFile()
+    process = subprocess.Popen(
+        [
+            ffmpeg_executable(), "-nostdin", "-v", "error",
+            "-i", file_path,
+            "-vn", "-ac", "1", "-ar", str(sample_rate), "-f", "s16le", "-",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=stderr,
+    )
+    chunk_bytes = int(sample_rate * chunk_seconds) * SAMPLE_WIDTH
+    try:
+        while True:
+            chunk = process.stdout.read(chunk_bytes)
+            if not chunk:
+                break
+            yield chunk
+        if process.wait() != 0:
+            stderr.seek(0)
+            error = stderr.read().decode("utf-8", errors="replace").strip()
+            raise RuntimeError(f"ffmpeg could not decode audio: {error or process.returncode}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        stderr.close()
+
+
+@dataclass
+class AudioSpan:
+    """A bounded piece of speech cut out of a longer recording"""
+    index: int
+    start: float
+    end: float
+    pcm: bytes
+
+
+def iter_segments(
+    pcm_chunks: Iterable[bytes],
+    sample_rate: int = AUDIO_SAMPLE_RATE,
+    min_seconds: float = AUDIO_SEGMENT_MIN_SECONDS,
+    max_seconds: float = AUDIO_SEGMENT_MAX_SECONDS,
+    min_silence_ms: int = AUDIO_MIN_SILENCE_MS,
+    silence_thresh: float = AUDIO_SILENCE_THRESH_DBFS,
+) -> Iterator[AudioSpan]:
+    """
+    Cut a stream of mono 16-bit PCM into segments at pauses
+
+    A segment ends at the first pause of at least min_silence_ms once it is
+    min_seconds long, or is cut hard at max_seconds. Segments that are silent
+    throughout are dropped. Only the current segment is buffered, so memory
+    does not depend on the length of the recording.
+
+    Args:
+        pcm_chunks: Raw PCM in chunks of any size
+        sample_rate: Samples per second of the PCM
+        min_seconds: Shortest segment that may end at a pause
+        max_seconds: Longest segment
+        min_silence_ms: Shortest pause that ends a segment
+        silence_thresh: Loudness in dBFS below which a frame counts as silent
+
+    Returns:
+        Iterator of AudioSpan with start/end offsets in seconds
+    """
+    frame_bytes = sample_rate * FRAME_MS // 1000 * SAMPLE_WIDTH
+    min_frames = int(min_seconds * 1000 / FRAME_MS)
+    max_frames = int(max_seconds * 1000 / FRAME_MS)
+    silence_frames = max(1, min_silence_ms // FRAME_MS)
+    # Compare mean squares against the threshold instead of taking logs per frame
+    thresh_power = (10 ** (silence_thresh / 20) * 32768) ** 2
+
+    segment = bytearray()
+    frames = 0
+    voiced = False
+    quiet_run = 0
+    start_frame = 0
+    index = 0
+    pending = b''
+
+    def emit(end_frame):
+        return AudioSpan(
+            index=index,
+            start=start_frame * FRAME_MS / 1000,
+            end=end_frame * FRAME_MS / 1000,
+            pcm=bytes(segment),
+        )
+
+    for chunk in pcm_chunks:
+        data = pending + chunk
+        usable = len(data) - len(data) % frame_bytes
+        pending = data[usable:]
+        if not usable:
+            continue
+
+        samples = np.frombuffer(data[:usable], dtype='<i2').astype(np.float32)
+        powers = (samples.reshape(-1, frame_bytes // SAMPLE_WIDTH) ** 2).mean(axis=1)
+
+        for i, power in enumerate(powers):
+            segment += data[i * frame_bytes:(i + 1) * frame_bytes]
+            frames += 1
+            if power < thresh_power:
+                quiet_run += 1
+            else:
+                quiet_run = 0
+                voiced = True
+
+            if frames >= max_frames or (frames >= min_frames and quiet_run >= silence_frames):
+                if voiced:
+                    yield emit(start_frame + frames)
+                    index += 1
+                start_frame += frames
+                segment = bytearray()
+                frames = 0
+                voiced = False
+                quiet_run = 0
+
+    if voiced:
+        yield emit(start_frame + frames)
+
+
+# Backend name -> class, see register_backend()
+_BACKENDS: Dict[str, Callable[[], "RecognizerBackend"]] = {}
+
+
+def register_backend(name: str):
+    """Register a RecognizerBackend subclass under a name usable in SPEECH_BACKEND"""
+    def decorator(cls):
+        _BACKENDS[name] = cls
+        cls.name = name
+        return cls
+    return decorator
+
+
+class RecognizerBackend:
+    """Turns one segment of mono 16-bit PCM into text"""
+
+    name = ""
+
+    def transcribe(self, pcm: bytes, sample_rate: int) -> str:
+        """
+        Transcribe a segment
+
+        Returns:
+            The recognised text, or an empty string when nothing was understood
+        """
+        raise NotImplementedError
+
+
+class _SpeechRecognitionBackend(RecognizerBackend):
+    """Base for backends provided by the SpeechRecognition package"""
+
+    def __init__(self):
+        import speech_recognition as sr
+
+        self._sr = sr
+        self._recognizer = sr.Recognizer()
+
+    def _recognize(self, audio_data) -> str:
+        raise NotImplementedError
+
+    def transcribe(self, pcm: bytes, sample_rate: int) -> str:
+        audio_data = self._sr.AudioData(pcm, sample_rate, SAMPLE_WIDTH)
+        try:
+            return self._recognize(audio_data)
+        except self._sr.UnknownValueError:
+            return ""
+
+
+@register_backend("google")
+class GoogleRecognizer(_SpeechRecognitionBackend):
+    """
+    Google Web Speech API, needs network access
+
+    A segment the API fails to answer is retried with backoff, so one
+    dropped request doesn't fail the recording. If it still fails the error
+    is raised: the file then ends up as an error document, which is neither
+    cached nor indexed and can be ingested again once the network is back.
+    """
+
+    def _recognize(self, audio_data) -> str:
+        return self._recognizer.recognize_google(audio_data)
+
+    def transcribe(self, pcm: bytes, sample_rate: int) -> str:
+        for attempt in range(AUDIO_RECOGNITION_RETRIES + 1):
+            try:
+                return super().transcribe(pcm, sample_rate)
+            except self._sr.RequestError:
+                if attempt == AUDIO_RECOGNITION_RETRIES:
+                    raise
+                metrics.inc("speech_retries_total")
+                time.sleep(AUDIO_RETRY_BACKOFF * (2 ** attempt))
+
+
+@register_backend("sphinx")
+class SphinxRecognizer(_SpeechRecognitionBackend):
+    """CMU Sphinx, runs fully offline but needs the pocketsphinx package"""
+
+    def _recognize(self, audio_data) -> str:
+        return self._recognizer.recognize_sphinx(audio_data)
+
+
+@register_backend("placeholder")
+class PlaceholderRecognizer(RecognizerBackend):
+    """
+    Local stand-in that recognises nothing and never leaves the machine
+
+    Useful offline and in tests: segmentation, timestamps and indexing all
+    run as usual, each segment is just described instead of transcribed.
+    """
+
+    def transcribe(self, pcm: bytes, sample_rate: int) -> str:
+        seconds = len(pcm) / (sample_rate * SAMPLE_WIDTH)
+        return f"[{seconds:.1f} seconds of untranscribed speech]"
+
+
+def get_recognizer(name: str = SPEECH_BACKEND) -> RecognizerBackend:
+    """Create the recognizer backend registered under a name"""
+    if name not in _BACKENDS:
+        raise ValueError(f"Unknown speech recognition backend: {name}")
+    return _BACKENDS[name]()
+
+
+def transcribe_segments(
+    segments: Iterable[AudioSpan],
+    recognizer: RecognizerBackend,
+    sample_rate: int = AUDIO_SAMPLE_RATE,
+    workers: int = AUDIO_WORKERS,
+) -> Iterator[Tuple[AudioSpan, str]]:
+    """
+    Transcribe segments concurrently, yielding results in recording order
+
+    At most two segments per worker are waiting or in flight, so a long
+    recording is never held in memory as a whole.
+
+    Args:
+        segments: Segments, e.g. from iter_segments()
+        recognizer: Backend used for every segment
+        sample_rate: Samples per second of the segment PCM
+        workers: Number of segments transcribed at the same time
+
+    Returns:
+        Iterator of (segment, text) tuples
+    """
+    workers = max(1, workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        for segment in segments:
+            in_flight.append((segment, executor.submit(recognizer.transcribe, segment.pcm, sample_rate)))
+            if len(in_flight) >= 2 * workers:
+                done, future = in_flight.popleft()
+                yield done, future.result()
+        while in_flight:
+            done, future = in_flight.popleft()
+            yield done, future.result()
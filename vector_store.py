@@ -0,0 +1,658 @@
+"""
+Local vector store that persists nodes incrementally and searches a memory-mapped matrix
+"""
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterCondition,
+    FilterOperator,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import (
+    node_to_metadata_dict,
+    metadata_dict_to_node,
+)
+from ann_index import create_ann_index, quantization_report
+from config import (
+    VECTOR_STORE_COMPACT_EVERY,
+    VECTOR_STORE_DTYPE,
+    VECTOR_INDEX,
+    ANN_CANDIDATES,
+    FILTER_FIELDS,
+)
+
+
+# Rows scored per matmul, bounds the float32 temporaries for float16 matrices
+SEARCH_BLOCK_ROWS = 65536
+
+
+class LocalVectorStore(BasePydanticVectorStore):
+    """
+    Vector store with node data in SQLite and embeddings in a memory-mapped matrix
+
+    Node text and metadata live in <persist_dir>/store.db, and every add or
+    delete is one SQLite transaction over the affected rows only. Embeddings are
+    L2-normalized and appended to vectors.bin as a contiguous float32 or float16
+    matrix, which is memory-mapped rather than loaded, so cold start only reads
+    the row -> node id mapping and similarity search is a blocked matmul plus
+    argpartition. Rows of deleted or replaced nodes become dead and are dropped
+    when the store is compacted, which writes the live rows to a new
+    vectors.<generation>.bin recorded in the meta table.
+
+    With index_kind "ivf" or "hnsw" an approximate index (see ann_index) picks
+    candidate rows, which are then rescored exactly against the matrix. With
+    "int8" or "binary" the candidates come from a scan over compact quantized
+    codes held in memory, while the full-precision matrix is only read for
+    the rows being rescored.
+
+    The metadata fields in FILTER_FIELDS are indexed in the node_fields table
+    as they are inserted. A query with metadata filters looks its candidate
+    rows up there and scores only those, exactly.
+    """
+
+    stores_text: bool = True
+
+    _persist_dir: str = PrivateAttr()
+    _vectors_path: str = PrivateAttr()
+    _conn: sqlite3.Connection = PrivateAttr()
+    _lock: threading.RLock = PrivateAttr()
+    _writes_since_compact: int = PrivateAttr(default=0)
+    _dim: Optional[int] = PrivateAttr(default=None)
+    _dtype: np.dtype = PrivateAttr()
+    _row_node_ids: List[Optional[str]] = PrivateAttr(default_factory=list)
+    _live: np.ndarray = PrivateAttr()
+    _matrix: Optional[np.memmap] = PrivateAttr(default=None)
+    _ann: Optional[Any] = PrivateAttr(default=None)
+
+    def __init__(
+        self,
+        persist_dir: str,
+        dtype: str = VECTOR_STORE_DTYPE,
+        index_kind: str = VECTOR_INDEX,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        os.makedirs(persist_dir, exist_ok=True)
+        self._persist_dir = persist_dir
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            os.path.join(persist_dir, "store.db"),
+            check_same_thread=False,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._set_aside_blob_layout()
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS nodes (
+                node_id TEXT PRIMARY KEY,
+                ref_doc_id TEXT,
+                node_json TEXT NOT NULL,
+                row INTEGER UNIQUE NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS nodes_ref_doc_id ON nodes (ref_doc_id)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS node_fields (
+                field TEXT NOT NULL,
+                value TEXT NOT NULL,
+                node_id TEXT NOT NULL,
+                PRIMARY KEY (field, value, node_id)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS node_fields_node_id ON node_fields (node_id)"
+        )
+        self._conn.commit()
+
+        # The dtype of an existing matrix wins over the configured one
+        meta = self._get_meta()
+        self._dtype = np.dtype(meta.get("dtype", dtype))
+        if "dim" in meta:
+            self._dim = int(meta["dim"])
+        self._vectors_path = self._generation_path(int(meta.get("vectors_generation", 0)))
+        self._remove_stale_generations()
+        self._load_rows()
+        self._migrate_blob_layout()
+        self._index_fields_if_changed()
+
+        self._ann = create_ann_index(index_kind, persist_dir)
+        self._sync_ann()
+
+    def _set_aside_blob_layout(self):
+        """Rename a nodes table from the earlier layout that kept embeddings as blobs"""
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(nodes)")]
+        if "embedding" in columns:
+            with self._conn:
+                self._conn.execute("DROP INDEX IF EXISTS nodes_ref_doc_id")
+                self._conn.execute("ALTER TABLE nodes RENAME TO nodes_blob")
+
+    def _migrate_blob_layout(self):
+        """Move rows set aside by _set_aside_blob_layout into the matrix layout"""
+        tables = [name for (name,) in self._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        if "nodes_blob" not in tables:
+            return
+        rows = self._conn.execute(
+            "SELECT node_id, ref_doc_id, node_json, embedding FROM nodes_blob ORDER BY rowid"
+        ).fetchall()
+        self._add_rows([
+            (node_id, ref_doc_id, node_json, np.frombuffer(embedding, dtype=np.float32))
+            for node_id, ref_doc_id, node_json, embedding in rows
+        ])
+        with self._conn:
+            self._conn.execute("DROP TABLE nodes_blob")
+
+    @staticmethod
+    def _field_rows(node_id: str, metadata: Dict[str, Any]) -> List[tuple]:
+        """(field, value, node_id) rows for the filterable fields present in metadata"""
+        return [
+            (field, str(metadata[field]), node_id)
+            for field in FILTER_FIELDS
+            if metadata.get(field) is not None
+        ]
+
+    def _index_fields_if_changed(self):
+        """(Re)build node_fields when FILTER_FIELDS differs from what was indexed"""
+        fields = json.dumps(FILTER_FIELDS)
+        if self._get_meta().get("filter_fields") == fields:
+            return
+        with self._conn:
+            self._conn.execute("DELETE FROM node_fields")
+            for node_id, node_json in self._conn.execute("SELECT node_id, node_json FROM nodes").fetchall():
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO node_fields (field, value, node_id) VALUES (?, ?, ?)",
+                    self._field_rows(node_id, json.loads(node_json)),
+                )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('filter_fields', ?)", (fields,)
+            )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return self._conn
+
+    def _get_meta(self) -> Dict[str, str]:
+        return dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+
+    def _generation_path(self, generation: int) -> str:
+        file_name = f"vectors.{generation}.bin" if generation else "vectors.bin"
+        return os.path.join(self._persist_dir, file_name)
+
+    def _remove_stale_generations(self):
+        """Delete matrix files left by a compaction that crashed before or after its commit"""
+        for file_name in os.listdir(self._persist_dir):
+            path = os.path.join(self._persist_dir, file_name)
+            if (
+                file_name.startswith("vectors.")
+                and file_name.endswith((".bin", ".compact"))
+                and path != self._vectors_path
+            ):
+                os.remove(path)
+
+    def _row_bytes(self) -> int:
+        return self._dim * self._dtype.itemsize
+
+    def _file_rows(self) -> int:
+        if self._dim is None or not os.path.exists(self._vectors_path):
+            return 0
+        size = os.path.getsize(self._vectors_path)
+        rows, remainder = divmod(size, self._row_bytes())
+        if remainder:
+            # A crash mid-append left a partial row; it was never committed
+            with open(self._vectors_path, "r+b") as f:
+                f.truncate(rows * self._row_bytes())
+        return rows
+
+    def _load_rows(self):
+        """Rebuild the row -> node id mapping from SQLite"""
+        n_rows = self._file_rows()
+        self._row_node_ids = [None] * n_rows
+        self._live = np.zeros(n_rows, dtype=bool)
+        for node_id, row in self._conn.execute("SELECT node_id, row FROM nodes"):
+            if row < n_rows:
+                self._row_node_ids[row] = node_id
+                self._live[row] = True
+        self._matrix = None
+
+    def _get_matrix(self) -> Optional[np.memmap]:
+        if self._matrix is None and self._row_node_ids:
+            self._matrix = np.memmap(
+                self._vectors_path,
+                dtype=self._dtype,
+                mode="r",
+                shape=(len(self._row_node_ids), self._dim),
+            )
+        return self._matrix
+
+    def count(self) -> int:
+        """Number of nodes in the store"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        rows = []
+        for node in nodes:
+            metadata = node_to_metadata_dict(node, remove_text=False, flat_metadata=False)
+            rows.append((node.node_id, node.ref_doc_id, json.dumps(metadata), node.get_embedding()))
+        self._add_rows(rows)
+        return [node.node_id for node in nodes]
+
+    def _add_rows(self, rows: List[tuple]):
+        """Append (node_id, ref_doc_id, node_json, embedding) rows"""
+        if not rows:
+            return
+
+        embeddings = np.asarray([row[3] for row in rows], dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings = (embeddings / np.maximum(norms, 1e-12)).astype(self._dtype)
+        node_ids = [row[0] for row in rows]
+
+        with self._lock:
+            if self._dim is None:
+                self._dim = embeddings.shape[1]
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                        [("dim", str(self._dim)), ("dtype", self._dtype.name)],
+                    )
+            elif embeddings.shape[1] != self._dim:
+                raise ValueError(
+                    f"Embedding dimension {embeddings.shape[1]} does not match store dimension {self._dim}"
+                )
+
+            # Vectors go to disk before the rows that reference them are committed,
+            # so a crash can only leave unreferenced (dead) rows behind
+            first_row = self._file_rows()
+            with open(self._vectors_path, "ab") as f:
+                f.write(embeddings.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            replaced = self._rows_for_node_ids(node_ids)
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO nodes (node_id, ref_doc_id, node_json, row) "
+                    "VALUES (?, ?, ?, ?)",
+                    [
+                        (node_id, ref_doc_id, node_json, first_row + offset)
+                        for offset, (node_id, ref_doc_id, node_json, _) in enumerate(rows)
+                    ],
+                )
+                # Field values go in the same transaction as the nodes they describe
+                self._delete_fields(node_ids)
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO node_fields (field, value, node_id) VALUES (?, ?, ?)",
+                    [
+                        field_row
+                        for node_id, _, node_json, _ in rows
+                        for field_row in self._field_rows(node_id, json.loads(node_json))
+                    ],
+                )
+
+            self._mark_dead(replaced)
+            self._row_node_ids.extend(node_ids)
+            self._live = np.concatenate([self._live, np.ones(len(rows), dtype=bool)])
+            self._matrix = None
+            self._sync_ann()
+            self._after_write()
+
+    def _rows_for_node_ids(self, node_ids: List[str]) -> List[int]:
+        rows = []
+        for start in range(0, len(node_ids), 500):
+            batch = node_ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows.extend(
+                row for (row,) in self._conn.execute(
+                    f"SELECT row FROM nodes WHERE node_id IN ({placeholders})",
+                    batch,
+                )
+            )
+        return rows
+
+    def _delete_fields(self, node_ids: List[str]):
+        for start in range(0, len(node_ids), 500):
+            batch = node_ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            self._conn.execute(f"DELETE FROM node_fields WHERE node_id IN ({placeholders})", batch)
+
+    def _mark_dead(self, rows: List[int]):
+        for row in rows:
+            if row < len(self._row_node_ids):
+                self._row_node_ids[row] = None
+                self._live[row] = False
+        if self._ann is not None:
+            self._ann.remove(rows)
+
+    def _sync_ann(self):
+        if self._ann is not None:
+            self._ann.sync(self._get_matrix(), self._live)
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        with self._lock:
+            rows = [
+                row for (row,) in self._conn.execute(
+                    "SELECT row FROM nodes WHERE ref_doc_id = ?", (ref_doc_id,)
+                )
+            ]
+            with self._conn:
+                self._conn.execute(
+                    "DELETE FROM node_fields WHERE node_id IN (SELECT node_id FROM nodes WHERE ref_doc_id = ?)",
+                    (ref_doc_id,),
+                )
+                self._conn.execute("DELETE FROM nodes WHERE ref_doc_id = ?", (ref_doc_id,))
+            self._mark_dead(rows)
+            self._after_write()
+
+    def delete_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[Any] = None,
+        **delete_kwargs: Any,
+    ) -> None:
+        if not node_ids:
+            return
+        with self._lock:
+            rows = self._rows_for_node_ids(node_ids)
+            with self._conn:
+                self._conn.executemany(
+                    "DELETE FROM nodes WHERE node_id = ?",
+                    [(node_id,) for node_id in node_ids],
+                )
+                self._delete_fields(node_ids)
+            self._mark_dead(rows)
+            self._after_write()
+
+    def clear(self) -> None:
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM nodes")
+                self._conn.execute("DELETE FROM node_fields")
+            self._mark_dead(list(range(len(self._row_node_ids))))
+            self.compact()
+
+    def _filter_sql(self, filters: MetadataFilters) -> tuple:
+        """Translate metadata filters into a query selecting matching node ids"""
+        clauses = []
+        params: List[Any] = []
+        for metadata_filter in filters.filters:
+            if isinstance(metadata_filter, MetadataFilters):
+                sql, nested_params = self._filter_sql(metadata_filter)
+                clauses.append(f"SELECT node_id FROM ({sql})")
+                params.extend(nested_params)
+                continue
+
+            if metadata_filter.operator == FilterOperator.EQ:
+                values = [metadata_filter.value]
+            elif metadata_filter.operator == FilterOperator.IN:
+                values = list(metadata_filter.value)
+            else:
+                raise ValueError(f"Unsupported filter operator: {metadata_filter.operator}")
+            values = [str(value) for value in values]
+            placeholders = ",".join("?" * len(values))
+
+            if metadata_filter.key in FILTER_FIELDS:
+                clauses.append(
+                    f"SELECT node_id FROM node_fields WHERE field = ? AND value IN ({placeholders})"
+                )
+                params.append(metadata_filter.key)
+            else:
+                # Not indexed, falls back to scanning the stored metadata
+                clauses.append(
+                    "SELECT node_id FROM nodes "
+                    f"WHERE CAST(json_extract(node_json, ?) AS TEXT) IN ({placeholders})"
+                )
+                params.append(f'$."{metadata_filter.key}"')
+            params.extend(values)
+
+        joiner = " UNION " if filters.condition == FilterCondition.OR else " INTERSECT "
+        return joiner.join(clauses), params
+
+    def filter_rows(self, filters: MetadataFilters) -> np.ndarray:
+        """Matrix rows of the nodes matching metadata filters"""
+        if not filters.filters:
+            return np.flatnonzero(self._live)
+        sql, params = self._filter_sql(filters)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT row FROM nodes WHERE node_id IN ({sql})", params
+            ).fetchall()
+        return np.sort(np.fromiter((row for (row,) in rows), dtype=np.int64, count=len(rows)))
+
+    def filter_node_ids(self, filters: MetadataFilters) -> List[str]:
+        """Ids of the nodes matching metadata filters"""
+        with self._lock:
+            row_node_ids = self._row_node_ids
+            return [
+                row_node_ids[row] for row in self.filter_rows(filters)
+                if row < len(row_node_ids) and row_node_ids[row] is not None
+            ]
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        with self._lock:
+            matrix = self._get_matrix()
+            row_node_ids, live = self._row_node_ids, self._live
+            candidates = self.filter_rows(query.filters) if query.filters else None
+
+        if matrix is None or query.query_embedding is None or not live.any():
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        query_vector = np.asarray(query.query_embedding, dtype=np.float32)
+        query_vector = query_vector / max(float(np.linalg.norm(query_vector)), 1e-12)
+        k = min(query.similarity_top_k, int(live.sum()))
+
+        if candidates is not None:
+            # Scoped search: only the pre-filtered rows are read and scored
+            candidates = candidates[candidates < len(row_node_ids)]
+            candidates = candidates[live[candidates]]
+            candidate_scores = np.empty(len(candidates), dtype=np.float32)
+            for start in range(0, len(candidates), SEARCH_BLOCK_ROWS):
+                block = np.asarray(matrix[candidates[start:start + SEARCH_BLOCK_ROWS]], dtype=np.float32)
+                candidate_scores[start:start + len(block)] = block @ query_vector
+            order = self._top_k(candidate_scores, min(k, len(candidates)))
+            top, top_scores = candidates[order], candidate_scores[order]
+        elif self._ann is not None and self._ann.ready and not kwargs.get("exact"):
+            # Approximate candidates, rescored exactly; knobs like nprobe/ef pass through
+            with self._lock:
+                candidates = self._ann.search(query_vector, k * ANN_CANDIDATES, **kwargs)
+            candidates = np.unique(candidates[candidates < len(row_node_ids)])
+            candidates = candidates[live[candidates]]
+            candidate_scores = (
+                np.asarray(matrix[candidates], dtype=np.float32) @ query_vector
+                if len(candidates) else np.zeros(0, dtype=np.float32)
+            )
+            order = self._top_k(candidate_scores, min(k, len(candidates)))
+            top, top_scores = candidates[order], candidate_scores[order]
+        else:
+            scores = np.empty(len(row_node_ids), dtype=np.float32)
+            for start in range(0, len(row_node_ids), SEARCH_BLOCK_ROWS):
+                block = matrix[start:start + SEARCH_BLOCK_ROWS]
+                scores[start:start + len(block)] = block.astype(np.float32, copy=False) @ query_vector
+            scores[~live] = -np.inf
+            top = self._top_k(scores, k)
+            top_scores = scores[top]
+
+        top_ids = [row_node_ids[row] for row in top]
+        nodes = self._get_nodes(top_ids)
+
+        return VectorStoreQueryResult(
+            nodes=[nodes[node_id] for node_id in top_ids],
+            similarities=[float(score) for score in top_scores],
+            ids=top_ids,
+        )
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        """Indices of the k highest scores, best first"""
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64)
+        if k < len(scores):
+            candidates = np.argpartition(-scores, k - 1)[:k]
+        else:
+            candidates = np.arange(len(scores))
+        return candidates[np.argsort(-scores[candidates])]
+
+    def quantization_report(
+        self,
+        query_vectors: Optional[np.ndarray] = None,
+        k: int = 10,
+        sample: int = 100,
+    ) -> List[Dict[str, Any]]:
+        """
+        Memory and recall@k of int8 and binary codes over the stored vectors
+
+        Args:
+            query_vectors: Query embeddings; by default a sample of stored
+                vectors, each searched for with itself excluded
+            k: Number of results per query
+            sample: Number of stored vectors sampled as queries
+
+        Returns:
+            One dict per mode, see ann_index.quantization_report()
+        """
+        with self._lock:
+            matrix = self._get_matrix()
+            live = self._live.copy()
+        if matrix is None or not live.any():
+            return []
+        if query_vectors is not None:
+            query_vectors = np.asarray(query_vectors, dtype=np.float32)
+            query_vectors /= np.maximum(np.linalg.norm(query_vectors, axis=1, keepdims=True), 1e-12)
+            return quantization_report(matrix, live, query_vectors, k)
+
+        rng = np.random.default_rng(0)
+        live_rows = np.flatnonzero(live)
+        query_rows = np.sort(rng.choice(live_rows, min(sample, len(live_rows)), replace=False))
+        # Leaving the sampled rows out keeps every query from trivially finding itself
+        live[query_rows] = False
+        return quantization_report(matrix, live, np.asarray(matrix[query_rows], dtype=np.float32), k)
+
+    def get_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[Any] = None,
+    ) -> List[BaseNode]:
+        """Nodes by id in the order given, or every node when node_ids is None"""
+        if node_ids is None:
+            return [node for batch in self.iter_nodes() for node in batch]
+        nodes = self._get_nodes(node_ids)
+        return [nodes[node_id] for node_id in node_ids if node_id in nodes]
+
+    def iter_nodes(self, batch_size: int = 500) -> Iterator[List[BaseNode]]:
+        """Yield every stored node in batches, without loading them all at once"""
+        last_row = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT row, node_json FROM nodes WHERE row > ? ORDER BY row LIMIT ?",
+                    (last_row, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            last_row = rows[-1][0]
+            yield [metadata_dict_to_node(json.loads(node_json)) for _, node_json in rows]
+
+    def _get_nodes(self, node_ids: List[str]) -> Dict[str, BaseNode]:
+        if not node_ids:
+            return {}
+        placeholders = ",".join("?" * len(node_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT node_id, node_json FROM nodes WHERE node_id IN ({placeholders})",
+                node_ids,
+            ).fetchall()
+        return {node_id: metadata_dict_to_node(json.loads(node_json)) for node_id, node_json in rows}
+
+    def _after_write(self):
+        self._writes_since_compact += 1
+        if self._writes_since_compact >= VECTOR_STORE_COMPACT_EVERY:
+            self.compact()
+
+    def compact(self):
+        """
+        Drop dead matrix rows, checkpoint the WAL and vacuum the database
+
+        The matrix is only rewritten when at least a quarter of its rows are dead.
+        """
+        with self._lock:
+            n_rows = len(self._row_node_ids)
+            n_dead = n_rows - int(self._live.sum())
+            if n_rows and n_dead / n_rows > 0.25:
+                self._rewrite_matrix()
+                # Row numbers changed, rebuild the ANN index over the new layout
+                if self._ann is not None:
+                    self._ann.reset()
+                    self._sync_ann()
+            if self._ann is not None:
+                self._ann.save()
+
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            free_pages = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+            total_pages = self._conn.execute("PRAGMA page_count").fetchone()[0]
+            if total_pages and free_pages / total_pages > 0.25:
+                self._conn.execute("VACUUM")
+            self._writes_since_compact = 0
+
+    def _rewrite_matrix(self):
+        live_rows = np.flatnonzero(self._live)
+        old_path = self._vectors_path
+        generation = int(self._get_meta().get("vectors_generation", 0)) + 1
+        new_path = self._generation_path(generation)
+        matrix = self._get_matrix()
+        with open(new_path, "wb") as f:
+            for start in range(0, len(live_rows), SEARCH_BLOCK_ROWS):
+                f.write(np.ascontiguousarray(matrix[live_rows[start:start + SEARCH_BLOCK_ROWS]]).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        # The new row numbers and the file they index are committed together;
+        # until then the old file stays in place, matching the old row numbers
+        try:
+            with self._conn:
+                # Rows are renumbered through negative values to avoid UNIQUE clashes
+                self._conn.executemany(
+                    "UPDATE nodes SET row = ? WHERE row = ?",
+                    [(-new_row - 1, int(old_row)) for new_row, old_row in enumerate(live_rows)],
+                )
+                self._conn.execute("UPDATE nodes SET row = -row - 1 WHERE row < 0")
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('vectors_generation', ?)",
+                    (str(generation),),
+                )
+        except Exception:
+            os.remove(new_path)
+            raise
+
+        # Release the old mapping before its file is removed
+        self._matrix = None
+        del matrix
+        self._vectors_path = new_path
+        self._load_rows()
+        os.remove(old_path)
+
+    def close(self):
+        with self._lock:
+            if self._ann is not None:
+                self._ann.save()
+            self._matrix = None
+            self._conn.close()
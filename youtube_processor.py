@@ -1,16 +1,80 @@
 """
 YouTube video processor for extracting transcripts
 """
-from typing import List, Optional
-from youtube_transcript_api import YouTubeTranscriptApi
-from youtube_transcript_api._errors import TranscriptsDisabled, NoTranscriptFound
-import yt_dlp
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import json
+import os
+import random
 import re
+import sys
+import tempfile
+import time
+import urllib.error
 from llama_index.core import Document
+import metrics
+from config import (
+    YOUTUBE_CACHE_ENABLED,
+    YOUTUBE_CACHE_DIR,
+    YOUTUBE_WORKERS,
+    YOUTUBE_MAX_RETRIES,
+    YOUTUBE_RETRY_BACKOFF,
+    YOUTUBE_CHUNK_SECONDS,
+    YOUTUBE_CHUNK_MAX_CHARS,
+)
+
+
+class YouTubeCache:
+    """On-disk JSON cache of video info and transcripts, one file per video and kind"""
+    
+    def __init__(self, cache_dir: str = YOUTUBE_CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+    
+    def _path(self, kind: str, video_id: str) -> str:
+        return os.path.join(self.cache_dir, f"{video_id}.{kind}.json")
+    
+    def get(self, kind: str, video_id: str) -> Tuple[bool, Any]:
+        """
+        Look up a cached value
+        
+        Args:
+            kind: What is cached, e.g. 'info' or 'transcript'
+            video_id: YouTube video ID
+            
+        Returns:
+            Tuple of (found, value); value may be None for a cached "not available"
+        """
+        try:
+            with open(self._path(kind, video_id), 'r', encoding='utf-8') as f:
+                return True, json.load(f)
+        except (OSError, ValueError):
+            return False, None
+    
+    def put(self, kind: str, video_id: str, value: Any):
+        """Store a value, written atomically so concurrent fetches never see half a file"""
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(value, f)
+            os.replace(temp_path, self._path(kind, video_id))
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
 
 
 class YouTubeProcessor:
-    """Handles processing of YouTube videos"""
+    """
+    Handles processing of YouTube videos
+    
+    Network access goes through fetch_video_info(), fetch_transcript() and
+    fetch_playlist() only. Subclasses can override them to serve fake
+    metadata and transcripts, e.g. in tests or offline.
+    """
+    
+    # Shared by all callers, created on first use; set to a YouTubeCache to redirect it
+    cache: Optional[YouTubeCache] = None
     
     @staticmethod
     def extract_video_id(url: str) -> Optional[str]:
@@ -36,10 +100,82 @@ class YouTubeProcessor:
         
         return None
     
+    @classmethod
+    def _get_cache(cls) -> Optional[YouTubeCache]:
+        if cls.cache is None and YOUTUBE_CACHE_ENABLED:
+            YouTubeProcessor.cache = YouTubeCache()
+        return cls.cache
+    
+    @staticmethod
+    def _is_transient(error: BaseException) -> bool:
+        """
+        Whether a fetch error is worth retrying
+        
+        Connection failures, timeouts and HTTP 429/5xx responses are
+        transient, wherever they sit in the exception chain. Anything else,
+        like a missing video or a bug, fails on the first attempt.
+        """
+        # Only loaded if it is the library that raised
+        yt_dlp = sys.modules.get('yt_dlp.networking.exceptions')
+        seen = set()
+        while error is not None and id(error) not in seen:
+            seen.add(id(error))
+            response = getattr(error, 'response', None)
+            status = getattr(response, 'status_code', None) or getattr(response, 'status', None)
+            if status is None and isinstance(error, urllib.error.HTTPError):
+                status = error.code
+            if status is not None:
+                return status == 429 or status >= 500
+            # requests and urllib errors are OSErrors; invalid URLs are also ValueErrors
+            if isinstance(error, OSError) and not isinstance(error, (ValueError, FileNotFoundError, PermissionError)):
+                return True
+            if yt_dlp is not None and isinstance(error, yt_dlp.TransportError):
+                return True
+            # yt-dlp wraps the original error in exc_info or cause
+            exc_info = getattr(error, 'exc_info', None)
+            error = (
+                error.__cause__
+                or error.__context__
+                or (exc_info[1] if isinstance(exc_info, tuple) and len(exc_info) > 1 else None)
+                or getattr(error, 'cause', None)
+            )
+            if not isinstance(error, BaseException):
+                error = None
+        return False
+    
+    @classmethod
+    def _with_retries(cls, func: Callable[..., Any], *args: Any) -> Any:
+        """Call func, retrying transient errors with exponential backoff and jitter"""
+        for attempt in range(YOUTUBE_MAX_RETRIES + 1):
+            try:
+                return func(*args)
+            except Exception as e:
+                if attempt == YOUTUBE_MAX_RETRIES or not cls._is_transient(e):
+                    raise
+                metrics.inc("youtube_retries_total")
+                time.sleep(YOUTUBE_RETRY_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5))
+    
+    @classmethod
+    def _cached_fetch(cls, kind: str, video_id: Optional[str], func: Callable[..., Any], *args: Any) -> Any:
+        """Serve a fetch from the cache, or fetch with retries and cache the result"""
+        cache = cls._get_cache()
+        if cache is not None and video_id:
+            found, value = cache.get(kind, video_id)
+            metrics.inc("youtube_cache_total", kind=kind, result="hit" if found else "miss")
+            if found:
+                return value
+        
+        # Failures raise before anything is cached, so they are retried next time
+        with metrics.span("youtube.fetch", kind=kind):
+            value = cls._with_retries(func, *args)
+        if cache is not None and video_id:
+            cache.put(kind, video_id, value)
+        return value
+    
     @staticmethod
-    def get_video_info(url: str) -> dict:
+    def fetch_video_info(url: str) -> dict:
         """
-        Get video metadata using yt-dlp
+        Fetch video metadata using yt-dlp, raising on failure
         
         Args:
             url: YouTube URL
@@ -47,23 +183,92 @@ class YouTubeProcessor:
         Returns:
             Dictionary with video information
         """
+        import yt_dlp
+        
         ydl_opts = {
             'quiet': True,
             'no_warnings': True,
             'extract_flat': True,
         }
         
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=False)
+            return {
+                'title': info.get('title', 'Unknown'),
+                'author': info.get('uploader', 'Unknown'),
+                'duration': info.get('duration', 0),
+                'description': info.get('description', ''),
+                'upload_date': info.get('upload_date', ''),
+                'view_count': info.get('view_count', 0)
+            }
+    
+    @staticmethod
+    def fetch_transcript(video_id: str, languages: List[str] = ['en']) -> Optional[List[Dict[str, Any]]]:
+        """
+        Fetch the caption segments of a video, raising on network failure
+        
+        Args:
+            video_id: YouTube video ID
+            languages: List of preferred languages
+            
+        Returns:
+            List of {'text', 'start', 'duration'} segments, or None if the
+            video has no transcript
+        """
+        from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound
+        
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                return {
-                    'title': info.get('title', 'Unknown'),
-                    'author': info.get('uploader', 'Unknown'),
-                    'duration': info.get('duration', 0),
-                    'description': info.get('description', ''),
-                    'upload_date': info.get('upload_date', ''),
-                    'view_count': info.get('view_count', 0)
-                }
+            # Falls back to auto-generated captions when no manual ones match
+            return YouTubeTranscriptApi().fetch(video_id, languages=languages).to_raw_data()
+        except (TranscriptsDisabled, NoTranscriptFound):
+            return None
+    
+    @staticmethod
+    def fetch_playlist(url: str) -> List[str]:
+        """
+        List the video URLs of a playlist or channel using yt-dlp
+        
+        Args:
+            url: Playlist or channel URL
+            
+        Returns:
+            Video URLs in playlist order
+        """
+        import yt_dlp
+        
+        ydl_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': 'in_playlist',
+        }
+        
+        def collect(entries):
+            urls = []
+            for entry in entries or []:
+                if entry.get('entries'):
+                    # Channels list their tabs (videos, shorts, ...) as nested playlists
+                    urls.extend(collect(entry['entries']))
+                elif entry.get('ie_key') == 'Youtube' and entry.get('id'):
+                    urls.append(f"https://www.youtube.com/watch?v={entry['id']}")
+            return urls
+        
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=False)
+            return collect(info.get('entries'))
+    
+    @classmethod
+    def get_video_info(cls, url: str) -> dict:
+        """
+        Get video metadata, from the cache when possible
+        
+        Args:
+            url: YouTube URL
+            
+        Returns:
+            Dictionary with video information
+        """
+        try:
+            return cls._cached_fetch('info', cls.extract_video_id(url), cls.fetch_video_info, url)
         except Exception as e:
             return {
                 'title': 'Unknown',
@@ -73,8 +278,28 @@ class YouTubeProcessor:
                 'error': str(e)
             }
     
-    @staticmethod
-    def get_transcript(video_id: str, languages: List[str] = ['en']) -> Optional[str]:
+    @classmethod
+    def get_transcript_segments(cls, video_id: str, languages: List[str] = ['en']) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get the caption segments of a video, from the cache when possible
+        
+        Fetch failures are raised rather than reported as a missing
+        transcript, so the video is not indexed without its captions.
+        
+        Args:
+            video_id: YouTube video ID
+            languages: List of preferred languages
+            
+        Returns:
+            List of {'text', 'start', 'duration'} segments, or None if the
+            video has no transcript
+        """
+        # Languages change the result, so they are part of the cache key
+        kind = 'transcript-' + '-'.join(languages)
+        return cls._cached_fetch(kind, video_id, cls.fetch_transcript, video_id, languages)
+    
+    @classmethod
+    def get_transcript(cls, video_id: str, languages: List[str] = ['en']) -> Optional[str]:
         """
         Get transcript for a YouTube video
         
@@ -85,28 +310,73 @@ class YouTubeProcessor:
         Returns:
             Transcript text or None
         """
-        try:
-            transcript_list = YouTubeTranscriptApi.get_transcript(video_id, languages=languages)
-            transcript_text = ' '.join([item['text'] for item in transcript_list])
-            return transcript_text
-        except (TranscriptsDisabled, NoTranscriptFound):
-            # Try to get auto-generated captions
-            try:
-                transcript_list = YouTubeTranscriptApi.list_transcripts(video_id)
-                transcript = transcript_list.find_generated_transcript(languages)
-                transcript_data = transcript.fetch()
-                transcript_text = ' '.join([item['text'] for item in transcript_data])
-                return transcript_text
-            except Exception:
-                return None
-        except Exception:
+        segments = cls.get_transcript_segments(video_id, languages)
+        if segments is None:
             return None
+        return ' '.join([item['text'] for item in segments])
+    
+    @staticmethod
+    def format_timestamp(seconds: float) -> str:
+        """Format seconds as m:ss, or h:mm:ss for long videos"""
+        minutes, secs = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        if hours:
+            return f"{hours}:{minutes:02d}:{secs:02d}"
+        return f"{minutes}:{secs:02d}"
+    
+    @staticmethod
+    def chunk_transcript(
+        segments: List[Dict[str, Any]],
+        window_seconds: float = YOUTUBE_CHUNK_SECONDS,
+        max_chars: int = YOUTUBE_CHUNK_MAX_CHARS,
+    ) -> List[Dict[str, Any]]:
+        """
+        Group caption segments into time windows
+        
+        A chunk is closed once it spans window_seconds or adding the next
+        segment would take it past max_chars, so chunks never need to be
+        split again by the node parser.
+        
+        Args:
+            segments: Caption segments with 'text', 'start' and 'duration'
+            window_seconds: Caption time covered by one chunk
+            max_chars: Longest chunk text
+            
+        Returns:
+            List of {'text', 'start', 'end'} chunks, times in seconds
+        """
+        chunks = []
+        texts = []
+        length = 0
+        start = end = 0.0
+        for segment in segments:
+            text = segment['text'].replace('\n', ' ').strip()
+            if not text:
+                continue
+            seg_start = float(segment['start'])
+            if texts and (seg_start - start >= window_seconds or length + len(text) + 1 > max_chars):
+                chunks.append({'text': ' '.join(texts), 'start': start, 'end': end})
+                texts = []
+                length = 0
+            if not texts:
+                start = seg_start
+            texts.append(text)
+            length += len(text) + 1
+            end = seg_start + float(segment.get('duration', 0))
+        if texts:
+            chunks.append({'text': ' '.join(texts), 'start': start, 'end': end})
+        return chunks
     
     @classmethod
+    @metrics.timed("youtube.process")
     def process_youtube_url(cls, url: str) -> List[Document]:
         """
         Process a YouTube URL and return LlamaIndex Documents
         
+        The first Document describes the video. The transcript follows as
+        one Document per time window, with start_seconds/end_seconds and a
+        link to that moment in the metadata.
+        
         Args:
             url: YouTube URL
             
@@ -125,28 +395,109 @@ class YouTubeProcessor:
         video_info = cls.get_video_info(url)
         
         # Get transcript
-        transcript = cls.get_transcript(video_id)
+        segments = cls.get_transcript_segments(video_id)
+        chunks = cls.chunk_transcript(segments) if segments else []
+        
+        metadata = {
+            'source': 'youtube',
+            'video_id': video_id,
+            'url': url,
+            'title': video_info['title'],
+            'author': video_info['author'],
+            'duration': video_info['duration'],
+            'has_transcript': bool(chunks)
+        }
         
-        if not transcript:
-            text = f"Video Title: {video_info['title']}\n"
-            text += f"Author: {video_info['author']}\n"
-            text += f"Description: {video_info['description']}\n"
+        text = f"Video Title: {video_info['title']}\n"
+        text += f"Author: {video_info['author']}\n"
+        text += f"Description: {video_info['description']}\n"
+        if not chunks:
             text += "\n[Note: Transcript not available for this video]"
-        else:
-            text = f"Video Title: {video_info['title']}\n"
-            text += f"Author: {video_info['author']}\n"
-            text += f"Description: {video_info['description']}\n\n"
-            text += f"Transcript:\n{transcript}"
-        
-        return [Document(
-            text=text,
-            metadata={
-                'source': 'youtube',
-                'video_id': video_id,
-                'url': url,
-                'title': video_info['title'],
-                'author': video_info['author'],
-                'duration': video_info['duration'],
-                'has_transcript': transcript is not None
-            }
-        )]
+        
+        documents = [Document(text=text, metadata=metadata)]
+        
+        for index, chunk in enumerate(chunks):
+            documents.append(Document(
+                text=f"[{cls.format_timestamp(chunk['start'])} - {cls.format_timestamp(chunk['end'])}] {chunk['text']}",
+                metadata={
+                    **metadata,
+                    'chunk': index,
+                    'start_seconds': chunk['start'],
+                    'end_seconds': chunk['end'],
+                    'timestamp_url': f"https://www.youtube.com/watch?v={video_id}&t={int(chunk['start'])}s"
+                }
+            ))
+        
+        return documents
+    
+    @classmethod
+    def expand_urls(cls, urls: Iterable[str]) -> List[str]:
+        """
+        Turn a mix of video, playlist and channel URLs into video URLs
+        
+        Args:
+            urls: YouTube URLs of any kind
+            
+        Returns:
+            Video URLs without duplicates, in input order
+        """
+        expanded = []
+        seen = set()
+        for url in urls:
+            url = url.strip()
+            if not url:
+                continue
+            if cls.extract_video_id(url):
+                video_urls = [url]
+            else:
+                try:
+                    video_urls = cls._with_retries(cls.fetch_playlist, url)
+                except Exception:
+                    # Left in so process_youtube_urls reports it
+                    video_urls = [url]
+            for video_url in video_urls:
+                key = cls.extract_video_id(video_url) or video_url
+                if key not in seen:
+                    seen.add(key)
+                    expanded.append(video_url)
+        return expanded
+    
+    @classmethod
+    def process_youtube_urls(
+        cls,
+        urls: Iterable[str],
+        max_workers: int = YOUTUBE_WORKERS,
+    ) -> Iterator[Tuple[str, List[Document]]]:
+        """
+        Process many videos, playlists and channels concurrently
+        
+        At most max_workers videos are fetched at a time. Cached videos
+        return immediately, so re-ingesting a playlist makes no requests
+        for videos seen before.
+        
+        Args:
+            urls: YouTube URLs of any kind
+            max_workers: Number of videos fetched at the same time
+            
+        Returns:
+            Iterator of (video URL, Documents) in completion order
+        """
+        video_urls = cls.expand_urls(urls)
+        if not video_urls:
+            return
+        
+        executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(video_urls))))
+        try:
+            futures = {executor.submit(cls.process_youtube_url, url): url for url in video_urls}
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    yield url, future.result()
+                except Exception as e:
+                    yield url, [Document(
+                        text=f"Could not process YouTube video: {url}",
+                        metadata={'error': str(e), 'source': 'youtube', 'url': url}
+                    )]
+        finally:
+            # Also runs when the consumer stops early, e.g. a cancelled job; drop queued videos
+            executor.shutdown(wait=False, cancel_futures=True)